@@ -10,6 +10,7 @@ from pyVirtualize.utils.klasses import PersistableClass
 
 from .datastore import Datastore
 from .vm import VirtualMachine
+from .vm.operation.snapshot import snapshot_report
 
 
 class vSphere(PersistableClass):
@@ -86,7 +87,10 @@ class vSphere(PersistableClass):
     def logout(self):
         """
         Logs out from the specified VCenter server. 
+        Guest authentication tickets held for the virtual machines are released beforehand.
         """
+        for vm in self._vms.values():
+            vm.release_auth()
         try:
             self.service_instance.content.sessionManager.Logout()
         except:
@@ -213,6 +217,25 @@ class vSphere(PersistableClass):
             if not self._vms.has_key(vm.name):
                 self._vms[vm.name] = VirtualMachine(vm, self.service_instance)
 
+    def snapshot_report(self, older_than=None, larger_than=None, sort_by=None, reverse=True):
+        """
+        Reports the disk usage and age of the snapshots of all the virtual machines,
+        fetched in bulk; see 'pyVirtualize.pyvSphere.vm.operation.snapshot_report'.
+
+        :param older_than: (int or timedelta) Only snapshots older than this; an int counts days.
+        :param larger_than: (int) Only snapshots using more bytes than this.
+        :param sort_by: (str) Sort on this field of SnapshotUsage, ex: 'size', 'age'.
+        :param reverse: (bool) Sort descending.
+
+        :return: iterator of SnapshotUsage(vm, name, path, moid, create_time, age, size, files, is_current).
+
+        | **Example**
+        | >> for usage in vsphere.snapshot_report(older_than=7, larger_than=50 * 1024 ** 3, sort_by='size'):
+        | >>     print(usage.vm, usage.path, usage.size, usage.age)
+        """
+        return snapshot_report(self.service_instance, older_than=older_than, larger_than=larger_than,
+                               sort_by=sort_by, reverse=reverse)
+
     def _get_objects(self, views):
         content = self.service_instance.RetrieveContent()
         container = content.rootFolder
@@ -1,7 +1,11 @@
 __author__ = 'rramchandani'
 
 
+from pyVirtualize.utils.cache import TTLCache
+
 from .operation import Operations
+from .operation._auth import GuestAuthSessions
+from .operation._base import GUEST_STATE_TTL
 
 
 class VimBase:
@@ -10,6 +14,9 @@ class VimBase:
         self.vmomi_object = vmomi_object
         self.service_instance = service_instance
         self.credentials = dict() if credentials is None else credentials
+        self.auth_sessions = GuestAuthSessions(self)
+        self.guest_state = TTLCache(ttl=GUEST_STATE_TTL)
+        self.snapshot_tree = None
 
 
 class Details:
@@ -167,6 +174,7 @@ class VirtualMachine(object):
         self.details = Details(vmomi_obj)
 
         self.timeout = kwargs.get('timeout', None)
+        self.vim.guest_state.ttl = kwargs.get('guest_state_ttl', GUEST_STATE_TTL)
 
     def set_credentials(self, username, password, credentials_type, default=False):
         """
@@ -182,8 +190,24 @@ class VirtualMachine(object):
         | >> vm.set_credentials(username="myDomain\\domainAdmin", password="secret", credentials_type="admin")
         """
         self._dirty = True
+        self.vim.auth_sessions.release(credentials_type)
         self.vim.credentials[credentials_type] = {'username': username, 'password': password, 'default': default}
 
+    def invalidate_guest_state(self):
+        """
+        Drops the cached tools status, guest OS, guest operations readiness and power state,
+        ex: after this virtual machine was powered off from outside of pyVirtualize.
+        The guest state is cached for 'guest_state_ttl' seconds (keyword argument of the constructor).
+        """
+        self.vim.guest_state.clear()
+
+    def release_auth(self):
+        """
+        Releases the guest authentication tickets acquired by the guest operations on this virtual machine.
+        They are acquired again by the next guest operation.
+        """
+        self.vim.auth_sessions.release()
+
     @property
     def operations(self):
         """
@@ -1,10 +1,12 @@
 __author__ = 'rramchandani'
 
 
-from .file import FileOperations
-from .process import ProcessOperations
+from .file import FileOperations, copy_between, broadcast_upload
+from .process import ProcessOperations, ProcessResult, ProcessStream, CommandBatch, run_everywhere
 from .power import PowerOperations
-from .snapshot import SnapshotOperations
+from .snapshot import SnapshotOperations, remove_all_snapshots, consolidate_disks, reset_to_snapshot, ResetReport, \
+    snapshot_report, SnapshotUsage
+from ._snapshot_tree import SnapshotTree, SnapshotNode
 
 from .admin import AdminOperations
 from .vmutils import VMUtils
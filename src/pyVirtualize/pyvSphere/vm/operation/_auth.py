@@ -0,0 +1,128 @@
+__author__ = 'rramchandani'
+
+import threading
+
+from pyVmomi import vim
+
+# Faults meaning the guest can't hand out tickets, plain name/password logons are used instead.
+TICKET_UNSUPPORTED = (vim.fault.OperationNotSupportedByGuest, vim.fault.GuestComponentsOutOfDate,
+                      vim.fault.OperationDisabledByGuest)
+
+
+class GuestAuthSessions(object):
+    """
+    Guest authentication sessions of one virtual machine, one per (credentials type, interactive).
+    The first guest operation logs on with the name and password and trades them, through
+    AcquireCredentialsInGuest, for a TicketedSessionAuthentication which every following operation reuses;
+    hence VMware Tools logs on to the guest OS only once instead of once per operation.
+
+    :param vim: (VimBase) The virtual machine the sessions belong to.
+    """
+
+    def __init__(self, vim):
+        self._vim = vim
+        self._sessions = dict()
+        self._keys = dict()  # ticket -> session key, retired tickets included.
+        self._lock = threading.Lock()
+
+    def _auth_manager(self):
+        return self._vim.service_instance.content.guestOperationsManager.authManager
+
+    def _acquire(self, key):
+        type_, interactive = key
+        cred = self._vim.credentials[type_]
+        requested = vim.vm.guest.NamePasswordAuthentication(
+            username=cred['username'],
+            password=cred['password'],
+            interactiveSession=interactive
+        )
+        try:
+            auth = self._auth_manager().AcquireCredentialsInGuest(vm=self._vim.vmomi_object, requestedAuth=requested)
+        except TICKET_UNSUPPORTED:
+            return requested
+
+        self._keys[auth.ticket] = key
+        return auth
+
+    def get(self, type_, interactive=True):
+        """
+        :return: vim.vm.guest.GuestAuthentication for the credentials type, acquired on first use.
+        """
+        key = (type_, interactive)
+        with self._lock:
+            auth = self._sessions.get(key)
+            if auth is None:
+                auth = self._sessions[key] = self._acquire(key)
+            return auth
+
+    def renew(self, auth):
+        """
+        Replaces a ticket the guest no longer accepts, ex: after a reboot of the guest.
+
+        :return: vim.vm.guest.GuestAuthentication to retry with,
+         None when 'auth' is not a ticket of these sessions.
+        """
+        with self._lock:
+            key = self._keys.get(getattr(auth, 'ticket', None))
+            if key is None:
+                return None
+
+            current = self._sessions.get(key)
+            if current is not None and current is not auth:
+                # Renewed meanwhile by another operation.
+                return current
+            auth = self._sessions[key] = self._acquire(key)
+            return auth
+
+    def release(self, type_=None):
+        """
+        Releases the tickets of the credentials type, or all of them when 'type_' is None.
+        Errors are ignored, the guest drops the tickets by itself when it is restarted.
+        """
+        with self._lock:
+            for key in [k for k in self._sessions if type_ is None or k[0] == type_]:
+                auth = self._sessions.pop(key)
+                if not isinstance(auth, vim.vm.guest.TicketedSessionAuthentication):
+                    continue
+                for ticket in [t for t, k in self._keys.items() if k == key]:
+                    del self._keys[ticket]
+                try:
+                    self._auth_manager().ReleaseCredentialsInGuest(vm=self._vim.vmomi_object, auth=auth)
+                except Exception:
+                    pass
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class GuestManager(object):
+    """
+    Proxy to a member of the guestOperationsManager (fileManager, processManager).
+    A call failing with InvalidGuestLogin because its ticket expired is retried once with a renewed ticket.
+    The authentication is taken from the 'auth' keyword, or else the second positional argument.
+    """
+
+    def __init__(self, manager, sessions):
+        self._manager = manager
+        self._sessions = sessions
+
+    def __getattr__(self, name):
+        method = getattr(self._manager, name)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            except vim.fault.InvalidGuestLogin:
+                auth = kwargs.get('auth', args[1] if len(args) > 1 else None)
+                renewed = self._sessions.renew(auth)
+                if renewed is None:
+                    raise
+            if 'auth' in kwargs:
+                kwargs['auth'] = renewed
+            else:
+                args = args[:1] + (renewed,) + args[2:]
+            return method(*args, **kwargs)
+
+        return call
@@ -2,25 +2,140 @@ __author__ = 'rramchandani'
 
 import time
 
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 from pyVirtualize.utils.exceptions import TimeOutException
 
 import pyVirtualize.utils.exceptions as exceps
 
+from ._auth import GuestManager
+from ._snapshot_tree import SnapshotTree
+
 TIMEOUT = 600 #seconds, i.e 10 mins.
+POLL_MIN_INTERVAL = 0.5  # seconds, first wait between two polls of guest processes or tasks.
+POLL_MAX_INTERVAL = 5  # seconds, longest wait between two polls of guest processes or tasks.
+POLL_BACKOFF = 1.5  # growth of the wait after a poll where nothing ended.
+GUEST_STATE_TTL = 5  # seconds a fetched guest state is trusted by the guest operations prechecks.
+
+# Guest state fetched at once by '_guest_state'.
+GUEST_STATE_PROPERTIES = ('guest.toolsStatus', 'guest.interactiveGuestOperationsReady',
+                          'summary.config.guestFullName', 'runtime.powerState')
+
+
+def wait_for_tasks(service_instance, tasks, timeout=TIMEOUT):
+    """
+    Waits for many vSphere tasks at once: the state of all the pending ones is read with a single
+    PropertyCollector call, first every POLL_MIN_INTERVAL seconds, backing off up to POLL_MAX_INTERVAL.
+
+    :param service_instance: The ServiceInstance the tasks belong to.
+    :param tasks: (list) vim.Task objects.
+    :param timeout: (int) Seconds to wait for.
+
+    :return: (dict) Task moId -> None when it succeeded, else its fault (or a TimeOutException).
+    """
+    pending = dict((task._moId, task) for task in tasks)
+    results = dict()
+    pc = service_instance.content.propertyCollector
+    interval = POLL_MIN_INTERVAL
+    start_time = time.time()
+    while pending:
+        spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=task, skip=False) for task in pending.values()],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info.state', 'info.error'])]
+        )
+        for obj in pc.RetrieveContents([spec]) or []:
+            props = dict((prop.name, prop.val) for prop in obj.propSet)
+            state = props.get('info.state')
+            if state == 'success':
+                results[obj.obj._moId] = None
+            elif state == 'error':
+                results[obj.obj._moId] = props.get('info.error') or exceps.TaskExecutionFailed()
+            else:
+                continue
+            del pending[obj.obj._moId]
+
+        if not pending:
+            break
+        elif time.time() - start_time >= timeout:
+            results.update((moid, TimeOutException()) for moid in pending)
+            break
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+    return results
+
+
+def retrieve_contents(pc, objects, type_, paths):
+    """
+    Reads 'paths' of many managed objects with a single PropertyCollector call.
+    A single object which is gone fails the whole call with ManagedObjectNotFound, hence such an object
+    is left out and the others are asked for again; when the fault doesn't tell which object is gone,
+    each is asked for on its own.
+
+    :param pc: The PropertyCollector.
+    :param objects: (list) Managed objects, all of 'type_'.
+    :param type_: Managed object type, ex: vim.VirtualMachine.
+    :param paths: (list) Property paths to read.
+
+    :return: (list) vmodl.query.PropertyCollector.ObjectContent of the objects which still exist.
+    """
+    objects = list(objects)
+    while objects:
+        spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objects],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=type_, pathSet=list(paths))]
+        )
+        try:
+            return pc.RetrieveContents([spec]) or []
+        except vmodl.fault.ManagedObjectNotFound as err:
+            missing = getattr(getattr(err, 'obj', None), '_moId', None)
+            remaining = [obj for obj in objects if obj._moId != missing]
+            if len(remaining) < len(objects):
+                objects = remaining
+            elif len(objects) == 1:
+                return []
+            else:
+                contents = []
+                for obj in objects:
+                    contents.extend(retrieve_contents(pc, [obj], type_, paths))
+                return contents
+    return []
 
 
 class BaseOperation(object):
 
     def __init__(self, vim, timeout=None, **kwargs):
+        self._vim = vim
         self.vmomi_object = vim.vmomi_object
         self.service_instance = vim.service_instance
         self.credentials = vim.credentials
         self._timeout_seconds = timeout if timeout and (isinstance(timeout, int) or isinstance(timeout, float))\
                                 else TIMEOUT
 
-    def _is_tools_installed(self):
-        tools_status = self.vmomi_object.guest.toolsStatus
+    def _guest_state(self, name, cached=False):
+        """
+        Value of one of the GUEST_STATE_PROPERTIES.
+        All of them are fetched with a single PropertyCollector call, kept in the VM's guest state cache
+        for 'GUEST_STATE_TTL' seconds; 'cached' allows to be served from there.
+        """
+        state = self._vim.guest_state.get('state') if cached else None
+        if state is None:
+            pc = self.service_instance.content.propertyCollector
+            spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=self.vmomi_object, skip=False)],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                                    pathSet=list(GUEST_STATE_PROPERTIES))]
+            )
+            state = dict.fromkeys(GUEST_STATE_PROPERTIES)
+            for obj in pc.RetrieveContents([spec]) or []:
+                for prop in obj.propSet:
+                    state[prop.name] = prop.val
+            self._vim.guest_state.set('state', state)
+        return state[name]
+
+    def _invalidate_guest_state(self):
+        self._vim.guest_state.clear()
+
+    def _is_tools_installed(self, cached=False):
+        tools_status = self._guest_state('guest.toolsStatus', cached)
         if tools_status == 'toolsNotInstalled' or \
                         tools_status == 'toolsNotRunning':
             return False
@@ -40,25 +155,48 @@ class BaseOperation(object):
 
     @staticmethod
     def _wait_for_task_to_complete(task):
+        interval = POLL_MIN_INTERVAL
         while True:
             state = task.info.state
-            if state == 'running':
-                time.sleep(5)
+            if state in ('queued', 'running'):
+                time.sleep(interval)
+                interval = min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
             elif state != 'success':
                 raise exceps.TaskExecutionFailed
             else:
                 break
 
     def _wait_for_process_terminate_in_guest(self, pid, creds):
+        for _ in self._iter_processes_terminated_in_guest([pid], creds):
+            pass
+
+    def _iter_processes_terminated_in_guest(self, pids, creds):
+        """
+        Generator of (pid, ProcessInfo) as the processes end; all outstanding pids are polled with
+        a single ListProcessesInGuest call, first every POLL_MIN_INTERVAL seconds, backing off up to
+        POLL_MAX_INTERVAL while none of them ends.
+        The ProcessInfo is None for a pid the guest doesn't list (anymore).
+        """
+        pm = self._guest_manager('processManager')
+        pending = set(int(pid) for pid in pids)
+        interval = POLL_MIN_INTERVAL
         start_time = time.time()
-        while True:
-            current_time = time.time()
-            if not self._is_process_exists_in_gos(pid, creds):
+        while pending:
+            res = pm.ListProcessesInGuest(self.vmomi_object, creds, pids=sorted(pending))
+            listed = dict((info.pid, info) for info in res or [])
+
+            ended = [pid for pid in sorted(pending) if pid not in listed or
+                     (isinstance(listed[pid].exitCode, int) and listed[pid].exitCode >= 0)]
+            for pid in ended:
+                pending.discard(pid)
+                yield pid, listed.get(pid)
+
+            if not pending:
                 break
-            elif current_time - start_time >= self._timeout_seconds:
+            elif time.time() - start_time >= self._timeout_seconds:
                 raise TimeOutException
-            else:
-                time.sleep(5)
+            interval = POLL_MIN_INTERVAL if ended else min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+            time.sleep(interval)
 
     def _timeout(self, condition_func, *args):
         start_time = time.time()
@@ -71,30 +209,32 @@ class BaseOperation(object):
             else:
                 time.sleep(5)
 
-    def _is_guest_powered_off(self):
-        return True if self.vmomi_object.runtime.powerState == "poweredOff" else False
+    def _is_guest_powered_off(self, cached=False):
+        return True if self._guest_state('runtime.powerState', cached) == "poweredOff" else False
 
-    def _is_guest_powered_on(self):
+    def _is_guest_powered_on(self, cached=False):
         try:
-            return True if self.vmomi_object.runtime.powerState == "poweredOn" else False
+            return True if self._guest_state('runtime.powerState', cached) == "poweredOn" else False
         except:
             return False
 
-    def _is_guest_operations_ready(self):
-        return True if self.vmomi_object.guest.interactiveGuestOperationsReady else False
+    def _is_guest_operations_ready(self, cached=False):
+        return True if self._guest_state('guest.interactiveGuestOperationsReady', cached) else False
 
     def _precheck_for_operations(self):
-        if not self._is_tools_installed():
+        if not self._is_tools_installed(cached=True):
             if not self.upgrade_vm_tools():
                 raise Exception
 
     def _guest_os_name(self):
-        return self.vmomi_object.summary.config.guestFullName
+        return self._guest_state('summary.config.guestFullName', cached=True) or ''
+
+    def _is_windows_guest(self):
+        return self._guest_os_name().__contains__("Windows")
 
     def _is_process_exists_in_gos(self, pid, creds):
         pid = int(pid)
-        content = self.service_instance.RetrieveContent()
-        pm = content.guestOperationsManager.processManager
+        pm = self._guest_manager('processManager')
         #creds = self._get_auth()
 
         res = pm.ListProcessesInGuest(self.vmomi_object, creds, pids=[pid])
@@ -115,16 +255,29 @@ class BaseOperation(object):
         if not self.credentials.get(type_) and type_ is not None:
             raise Exception("No credential type '{0}' found.".format(type))
 
-        cred = self.credentials[type_]
+        return self._vim.auth_sessions.get(type_, interactive)
 
-        return vim.vm.guest.NamePasswordAuthentication(
-            username=cred['username'],
-            password=cred['password'],
-            interactiveSession=interactive
-        )
+    def _guest_manager(self, name):
+        """
+        :param name: (str) 'fileManager' or 'processManager'.
+        :return: the guestOperationsManager member, renewing expired authentication tickets on its calls.
+        """
+        return GuestManager(getattr(self.service_instance.content.guestOperationsManager, name),
+                            self._vim.auth_sessions)
+
+    def release_auth(self, credentials=None):
+        """
+        Releases the guest authentication tickets held for this virtual machine.
+
+        :param credentials: (str)
+         Specify the credentials type string, whose tickets to release.
+         If left empty, the tickets of all credentials types are released.
+        """
+        self._vim.auth_sessions.release(credentials)
 
     def upgrade_vm_tools(self):
         self.vmomi_object.UpgradeTools()
+        self._invalidate_guest_state()
         self._timeout(self._is_tools_installed)
 
     def _get_obj(self, vimtype, name=None, not_found_return_none=False):
@@ -151,19 +304,27 @@ class BaseOperation(object):
             return None if not_found_return_none else []
         return obj
 
-    def _get_snapshot_list(self):
-        _ = self.vmomi_object.snapshot
-        if not _:
-            return dict()
-
-        snapshots = _.rootSnapshotList
-        snapshot_list = {}
+    def _snapshot_tree(self, refresh=False):
+        """
+        The VM's snapshot tree, fetched once and then kept up to date by the snapshot operations.
+        """
+        if refresh or self._vim.snapshot_tree is None:
+            self._vim.snapshot_tree = SnapshotTree.from_vm(self.vmomi_object)
+        return self._vim.snapshot_tree
+
+    def _get_snapshot(self, key):
+        """
+        :param key: Snapshot managed object, its ID, its path or its name.
+        :return: SnapshotNode
+        :raises: ValueError, when the snapshot doesn't exist or its name is ambiguous.
+        """
+        node = self._snapshot_tree().find(key)
+        if node is None:
+            # Possibly taken from outside of pyVirtualize since the tree was fetched.
+            node = self._snapshot_tree(refresh=True).find(key)
+        if node is None:
+            raise ValueError("Snapshot '{0}' doesn't exists.".format(key))
+        return node
 
-        def func(snapshots):
-            for snapshot in snapshots:
-                snapshot_list[snapshot.name] = snapshot.snapshot
-                if snapshot.childSnapshotList:
-                    func(snapshots=snapshot.childSnapshotList)
-            return snapshot_list
-
-        return func(snapshots=snapshots)
+    def _get_snapshot_list(self):
+        return self._snapshot_tree().as_dict()
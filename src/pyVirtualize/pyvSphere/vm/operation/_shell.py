@@ -0,0 +1,397 @@
+"""
+Builders for the small helper scripts pyVirtualize runs inside guests.
+Windows guests get PowerShell (passed as -EncodedCommand, so no quoting has to survive cmd.exe),
+every other guest gets /bin/sh.
+"""
+
+__author__ = 'rramchandani'
+
+import base64
+
+POWERSHELL = 'C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe'
+CMD = 'C:\\Windows\\System32\\cmd.exe'
+SH = '/bin/sh'
+BASH = '/bin/bash'
+
+COMPRESSIONS = ('gzip', 'zstd')
+BATCH_SHELLS = ('sh', 'bash', 'cmd', 'powershell')
+BATCH_EXTENSIONS = {'sh': 'sh', 'bash': 'sh', 'cmd': 'cmd', 'powershell': 'ps1'}
+
+
+def sh_quote(value):
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def ps_quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def join(windows, *parts):
+    """
+    Joins guest path components with the guest's separator.
+    """
+    sep = '\\' if windows else '/'
+    return sep.join([parts[0].rstrip('/\\')] + [part.strip('/\\') for part in parts[1:]])
+
+
+def shell_command(windows, script):
+    """
+    :return: (program, arguments) running 'script' with the guest's shell.
+    """
+    if windows:
+        encoded = base64.b64encode(script.encode('utf-16-le')).decode('ascii')
+        return POWERSHELL, '-NoProfile -NonInteractive -ExecutionPolicy Bypass -EncodedCommand ' + encoded
+    return SH, '-c ' + sh_quote(script)
+
+
+def _ps_gzip(src, dest, mode):
+    # Stream.CopyTo needs .NET 4, copy by hand so that older guests work as well.
+    stream = '$z = New-Object IO.Compression.GzipStream({0}, [IO.Compression.CompressionMode]::{1})'
+    if mode == 'Compress':
+        reader, writer, stream = '$i', '$z', stream.format('$o', mode)
+    else:
+        reader, writer, stream = '$z', '$o', stream.format('$i', mode)
+    return "\n".join([
+        "$ErrorActionPreference = 'Stop'",
+        "$i = [IO.File]::OpenRead({0})".format(ps_quote(src)),
+        "$o = [IO.File]::Create({0})".format(ps_quote(dest)),
+        stream,
+        "try {",
+        "  $buf = New-Object byte[] 1048576",
+        "  while (($n = {0}.Read($buf, 0, $buf.Length)) -gt 0) {{ {1}.Write($buf, 0, $n) }}".format(reader, writer),
+        "} finally { $z.Close(); $i.Close(); $o.Close() }",
+    ])
+
+
+def _zstd(windows, args):
+    quote = ps_quote if windows else sh_quote
+    script = 'zstd -q -f ' + ' '.join(arg if arg.startswith('-') else quote(arg) for arg in args)
+    if windows:
+        script = "& " + script + "\nif ($LASTEXITCODE) { exit $LASTEXITCODE }"
+    return script
+
+
+def compress_script(windows, method, src, dest):
+    """
+    Script compressing the guest file 'src' into 'dest'.
+    """
+    if method == 'zstd':
+        return _zstd(windows, [src, '-o', dest])
+    if windows:
+        return _ps_gzip(src, dest, 'Compress')
+    return 'gzip -c {0} > {1}'.format(sh_quote(src), sh_quote(dest))
+
+
+def decompress_script(windows, method, src, dest):
+    """
+    Script decompressing the guest file 'src' into 'dest' and removing 'src' afterwards.
+    """
+    if method == 'zstd':
+        script = _zstd(windows, ['-d', src, '-o', dest])
+    elif windows:
+        script = _ps_gzip(src, dest, 'Decompress')
+    else:
+        script = 'gzip -dc {0} > {1}'.format(sh_quote(src), sh_quote(dest))
+
+    if windows:
+        return script + "\nRemove-Item -LiteralPath {0} -Force".format(ps_quote(src))
+    return script + ' && rm -f {0}'.format(sh_quote(src))
+
+
+def _ps_copy_into(output, sources):
+    return "\n".join([
+        "$o = [IO.File]::Create({0})".format(ps_quote(output)),
+        "try {",
+        "  $buf = New-Object byte[] 1048576",
+        "  foreach ($p in {0}) {{".format(sources),
+        "    $i = [IO.File]::OpenRead($p)",
+        "    try { while (($n = $i.Read($buf, 0, $buf.Length)) -gt 0) { $o.Write($buf, 0, $n) } } finally { $i.Close() }",
+        "  }",
+        "} finally { $o.Close() }",
+    ])
+
+
+def join_parts_script(windows, parts_dir, dest, token):
+    """
+    Script concatenating the 'part*' files of 'parts_dir', in name order, into 'dest' and removing 'parts_dir'.
+    The parts are joined into '<dest>.<token>.partial' which is renamed to 'dest' once complete, so a join
+    running concurrently (ex: a retry after a timeout) can fail but never leaves a truncated 'dest'.
+    """
+    partial = '{0}.{1}.partial'.format(dest, token)
+    if windows:
+        sources = "(Get-ChildItem -LiteralPath {0} -Filter 'part*' | Sort-Object Name | ForEach-Object {{ $_.FullName }})"
+        return "\n".join([
+            "$ErrorActionPreference = 'Stop'",
+            "try {",
+            _ps_copy_into(partial, sources.format(ps_quote(parts_dir))),
+            "Move-Item -LiteralPath {0} -Destination {1} -Force".format(ps_quote(partial), ps_quote(dest)),
+            "} catch {",
+            "  Remove-Item -LiteralPath {0} -Force -ErrorAction SilentlyContinue".format(ps_quote(partial)),
+            "  throw",
+            "}",
+            "Remove-Item -LiteralPath {0} -Recurse -Force".format(ps_quote(parts_dir)),
+        ])
+    return "\n".join([
+        "cat {0}/part* > {1} && mv -f {1} {2} || {{ rc=$?; rm -f {1}; exit $rc; }}".format(
+            sh_quote(parts_dir), sh_quote(partial), sh_quote(dest)),
+        "rm -rf {0}".format(sh_quote(parts_dir)),
+    ])
+
+
+HASH_ALGORITHMS = {'md5': 'MD5', 'sha1': 'SHA1', 'sha256': 'SHA256', 'sha512': 'SHA512'}
+
+
+def hash_script(windows, algo, paths_file, output):
+    """
+    Script writing one "<hex digest>\\t<path>" line per path listed in the guest file 'paths_file'
+    (UTF-8, one path per line) into the guest file 'output', the digest being '-' for paths which are not
+    regular files. The paths are read from the guest rather than embedded, so the command line stays short
+    whatever their number.
+    """
+    if algo not in HASH_ALGORITHMS:
+        raise ValueError("Unsupported hash algorithm '{0}', use one of {1}.".format(algo, sorted(HASH_ALGORITHMS)))
+
+    if windows:
+        return "\n".join([
+            "$ErrorActionPreference = 'Stop'",
+            "$h = [Security.Cryptography.HashAlgorithm]::Create('{0}')".format(HASH_ALGORITHMS[algo]),
+            "$paths = [IO.File]::ReadAllLines({0}, [Text.Encoding]::UTF8)".format(ps_quote(paths_file)),
+            "$lines = foreach ($f in $paths) {",
+            "  if (-not $f) { continue }",
+            "  $d = '-'",
+            "  if (Test-Path -LiteralPath $f -PathType Leaf) {",
+            "    $s = [IO.File]::OpenRead($f)",
+            "    try { $d = -join ($h.ComputeHash($s) | ForEach-Object { $_.ToString('x2') }) } finally { $s.Close() }",
+            "  }",
+            "  $d + \"`t\" + $f",
+            "}",
+            "[IO.File]::WriteAllLines({0}, [string[]]@($lines))".format(ps_quote(output)),
+        ])
+    return "\n".join([
+        "while IFS= read -r f; do",
+        "  [ -n \"$f\" ] || continue",
+        "  if [ -f \"$f\" ]; then d=$({0}sum < \"$f\" | cut -d' ' -f1); else d=-; fi".format(algo),
+        "  printf '%s\\t%s\\n' \"$d\" \"$f\"",
+        "done < {0} > {1}".format(sh_quote(paths_file), sh_quote(output)),
+    ])
+
+
+def parse_hash_output(data):
+    """
+    :return: (dict) path -> hex digest, or None for paths which are not regular files.
+    """
+    digests = dict()
+    for line in data.decode('utf-8').splitlines():
+        if '\t' not in line:
+            continue
+        digest, path = line.split('\t', 1)
+        digests[path] = None if digest in ('-', '') else digest.lower()
+    return digests
+
+
+def capture_script(windows, program, arguments, workdir, token):
+    """
+    Script running 'program' with its stdout and stderr redirected into files of 'workdir', which it then
+    concatenates, separated by 'token', into the single 'workdir'/result file. It exits with the program's status.
+    On Windows this is a batch file (to be run by cmd.exe), elsewhere a /bin/sh script.
+    """
+    def path(name):
+        return join(windows, workdir, name)
+
+    if windows:
+        return "\r\n".join([
+            '@echo off',
+            '"{0}" {1} > "{2}" 2> "{3}"'.format(program, arguments, path('stdout'), path('stderr')),
+            'set PYV_RC=%ERRORLEVEL%',
+            '> "{0}" <nul set /p ={1}'.format(path('marker'), token),
+            'copy /b "{0}" + "{1}" + "{2}" "{3}" > nul'.format(path('stdout'), path('marker'), path('stderr'),
+                                                               path('result')),
+            'exit %PYV_RC%',
+        ])
+    return "\n".join([
+        '{0} {1} > {2} 2> {3}'.format(sh_quote(program), arguments, sh_quote(path('stdout')),
+                                      sh_quote(path('stderr'))),
+        'rc=$?',
+        "{{ cat {0}; printf '%s' {1}; cat {2}; }} > {3}".format(sh_quote(path('stdout')), sh_quote(token),
+                                                                 sh_quote(path('stderr')), sh_quote(path('result'))),
+        'exit $rc',
+    ])
+
+
+def script_command(windows, script_path):
+    """
+    :return: (program, arguments) running a script file written from 'capture_script' or 'redirect_script'.
+    """
+    if windows:
+        return CMD, '/s /c ""{0}""'.format(script_path)
+    return SH, sh_quote(script_path)
+
+
+def redirect_script(windows, program, arguments, output):
+    """
+    Script running 'program' with both its stdout and stderr appended, as they come, to the guest file 'output'.
+    On Windows this is a batch file (to be run by cmd.exe), elsewhere a /bin/sh script.
+    """
+    if windows:
+        return "\r\n".join([
+            '@echo off',
+            '"{0}" {1} > "{2}" 2>&1'.format(program, arguments, output),
+            'exit %ERRORLEVEL%',
+        ])
+    return 'exec {0} {1} > {2} 2>&1'.format(sh_quote(program), arguments, sh_quote(output))
+
+
+def tail_script(windows, path, offset, output):
+    """
+    Script copying the bytes of the guest file 'path' from 'offset' onwards into 'output'.
+    'path' may still be written to by another process.
+    """
+    if windows:
+        return "\n".join([
+            "$ErrorActionPreference = 'Stop'",
+            "$i = New-Object IO.FileStream({0}, [IO.FileMode]::Open, [IO.FileAccess]::Read, "
+            "[IO.FileShare]::ReadWrite)".format(ps_quote(path)),
+            "$o = [IO.File]::Create({0})".format(ps_quote(output)),
+            "try {",
+            "  [void]$i.Seek({0}, [IO.SeekOrigin]::Begin)".format(int(offset)),
+            "  $buf = New-Object byte[] 1048576",
+            "  while (($n = $i.Read($buf, 0, $buf.Length)) -gt 0) { $o.Write($buf, 0, $n) }",
+            "} finally { $i.Close(); $o.Close() }",
+        ])
+    return 'tail -c +{0} {1} > {2}'.format(int(offset) + 1, sh_quote(path), sh_quote(output))
+
+
+def _sh_batch(commands, workdir, token, stop_on_error):
+    lines = [
+        'W={0}'.format(sh_quote(workdir)),
+        ': > "$W/result"',
+        'pyv_record() {',
+        "  {{ printf '%s %s out %s\\n' {0} \"$1\" \"$2\"; cat \"$W/out\"".format(sh_quote(token)),
+        "    printf '%s %s err %s\\n' {0} \"$1\" \"$2\"; cat \"$W/err\"; }} >> \"$W/result\"".format(sh_quote(token)),
+        '}',
+    ]
+    for index, command in enumerate(commands):
+        lines.extend([
+            # A subshell, so that a command calling 'exit' ends itself only and not the whole batch.
+            '(',
+            command,
+            ') > "$W/out" 2> "$W/err" < /dev/null',
+            'rc=$?',
+            'pyv_record {0} $rc'.format(index),
+        ])
+        if stop_on_error:
+            lines.append('[ $rc -eq 0 ] || exit $rc')
+    lines.append('exit 0')
+    return "\n".join(lines) + "\n"
+
+
+def _cmd_batch(commands, workdir, token, stop_on_error):
+    lines = [
+        '@echo off',
+        'set "PYV_W={0}"'.format(workdir),
+        'type nul > "%PYV_W%\\result"',
+    ]
+    for index, command in enumerate(commands):
+        lines.extend([
+            '{0} > "%PYV_W%\\out" 2> "%PYV_W%\\err" < nul'.format(command),
+            'set PYV_RC=%ERRORLEVEL%',
+            'call :pyv_record {0}'.format(index),
+        ])
+        if stop_on_error:
+            lines.append('if not "%PYV_RC%"=="0" exit /b %PYV_RC%')
+    lines.extend([
+        'exit /b 0',
+        '',
+        ':pyv_record',
+        # Leading redirections, a trailing "0 >> file" would be taken for a descriptor.
+        '>> "%PYV_W%\\result" echo {0} %1 out %PYV_RC%'.format(token),
+        'type "%PYV_W%\\out" >> "%PYV_W%\\result"',
+        '>> "%PYV_W%\\result" echo {0} %1 err %PYV_RC%'.format(token),
+        'type "%PYV_W%\\err" >> "%PYV_W%\\result"',
+        'goto :eof',
+    ])
+    return "\r\n".join(lines) + "\r\n"
+
+
+def _ps_batch(commands, workdir, token, stop_on_error):
+    lines = [
+        "$r = {0}".format(ps_quote(join(True, workdir, 'result'))),
+        "$utf8 = New-Object Text.UTF8Encoding $false",
+        "[IO.File]::WriteAllText($r, '', $utf8)",
+        "function Pyv-Record($i, $rc, $out, $err) {",
+        "  $text = {0} + \" $i out $rc`n\" + $out + {0} + \" $i err $rc`n\" + $err".format(ps_quote(token)),
+        "  [IO.File]::AppendAllText($r, $text, $utf8)",
+        "}",
+    ]
+    for index, command in enumerate(commands):
+        lines.extend([
+            "$out = New-Object Text.StringBuilder; $err = New-Object Text.StringBuilder; $failed = $false",
+            "$global:LASTEXITCODE = 0",
+            "try {",
+            "  & {",
+            command,
+            "  } 2>&1 | ForEach-Object {",
+            "    if ($_ -is [Management.Automation.ErrorRecord]) {",
+            "      [void]$err.AppendLine($_.ToString())",
+            "      # Native programs writing to stderr are not failures on their own.",
+            "      if ($_.FullyQualifiedErrorId -notlike 'NativeCommandError*') { $failed = $true }",
+            "    } else { [void]$out.AppendLine($_.ToString()) }",
+            "  }",
+            "} catch { [void]$err.AppendLine($_.ToString()); $failed = $true }",
+            "$rc = if ($LASTEXITCODE) { $LASTEXITCODE } elseif ($failed) { 1 } else { 0 }",
+            "Pyv-Record {0} $rc $out.ToString() $err.ToString()".format(index),
+        ])
+        if stop_on_error:
+            lines.append("if ($rc -ne 0) { exit $rc }")
+    lines.append("exit 0")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def batch_script(shell, commands, workdir, token, stop_on_error=False):
+    """
+    Script running each command line of 'commands' in turn, written in the syntax of 'shell' (see BATCH_SHELLS).
+    For every command it appends to 'workdir'/result a "<token> <index> out <status>" line followed by its
+    stdout, then a "<token> <index> err <status>" line followed by its stderr, see 'parse_batch_output'.
+    With 'stop_on_error' it exits with the status of the first failing command.
+    """
+    if shell not in BATCH_SHELLS:
+        raise ValueError("Unsupported shell '{0}', use one of {1}.".format(shell, BATCH_SHELLS))
+    if shell == 'cmd':
+        return _cmd_batch(commands, workdir, token, stop_on_error)
+    if shell == 'powershell':
+        return _ps_batch(commands, workdir, token, stop_on_error)
+    script = _sh_batch(commands, workdir, token, stop_on_error)
+    return ('#!/bin/bash\n' if shell == 'bash' else '#!/bin/sh\n') + script
+
+
+def batch_command(shell, script_path):
+    """
+    :return: (program, arguments) running the script file written from 'batch_script'.
+    """
+    if shell == 'cmd':
+        return script_command(True, script_path)
+    if shell == 'powershell':
+        return POWERSHELL, '-NoProfile -NonInteractive -ExecutionPolicy Bypass -File "{0}"'.format(script_path)
+    return BASH if shell == 'bash' else SH, sh_quote(script_path)
+
+
+def parse_batch_output(data, token, count):
+    """
+    :return: (list) One (status, stdout, stderr) tuple per command, stdout and stderr being bytes;
+     None for the commands which didn't run.
+    """
+    results = [None] * count
+    for section in data.split(token.encode('ascii'))[1:]:
+        header, _, body = section.partition(b'\n')
+        fields = header.decode('ascii', 'replace').split()
+        if len(fields) != 3 or not fields[0].isdigit() or int(fields[0]) >= count:
+            continue
+        index, stream, status = int(fields[0]), fields[1], fields[2]
+        status = int(status) if status.lstrip('-').isdigit() else None
+        _, stdout, stderr = results[index] or (None, b'', b'')
+        if stream == 'out':
+            stdout = body
+        else:
+            stderr = body
+        results[index] = (status, stdout, stderr)
+    return results
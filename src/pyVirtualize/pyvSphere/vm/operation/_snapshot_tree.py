@@ -0,0 +1,201 @@
+__author__ = 'rramchandani'
+
+from collections import Counter, defaultdict
+
+SEPARATOR = '/'  # between the names of a snapshot path, ex: 'base/patched/configured'.
+
+
+class SnapshotNode(object):
+    """
+    One snapshot of a virtual machine's snapshot tree.
+
+    :ivar name: (str) Name of the snapshot, not necessarily unique.
+    :ivar description: (str) Description of the snapshot.
+    :ivar snapshot: (vim.vm.Snapshot) Managed object of the snapshot.
+    :ivar moid: (str) Managed object ID of the snapshot, ex: 'snapshot-42'.
+    :ivar create_time: (datetime) Creation time of the snapshot.
+    :ivar state: (str) Power state of the virtual machine when the snapshot was taken.
+    :ivar parent: (SnapshotNode) Parent snapshot, None for a root.
+    :ivar children: (list) Child snapshots.
+    :ivar is_current: (bool) True for the snapshot the virtual machine currently runs from.
+    """
+
+    def __init__(self, name, snapshot, description="", create_time=None, state=None, parent=None):
+        self.name = name
+        self.description = description
+        self.snapshot = snapshot
+        self.moid = snapshot._moId
+        self.create_time = create_time
+        self.state = state
+        self.parent = parent
+        self.children = []
+        self.is_current = False
+
+    @property
+    def path(self):
+        """
+        Names from the root snapshot down to this one, joined with '/'.
+        """
+        names, node = [], self
+        while node is not None:
+            names.append(node.name)
+            node = node.parent
+        return SEPARATOR.join(reversed(names))
+
+    def walk(self):
+        """
+        Generates this snapshot and all of its descendants, parents before children.
+        """
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+    def __repr__(self):
+        return "<Snapshot: {0} ({1}){2}>".format(self.path, self.moid, ' current' if self.is_current else '')
+
+
+class SnapshotTree(object):
+    """
+    Snapshot tree of a virtual machine, indexed by managed object ID, name and path.
+    Built once from 'vm.snapshot' and then kept up to date in place by the snapshot operations.
+    """
+
+    def __init__(self):
+        self.roots = []
+        self.current = None
+        self._by_moid = dict()
+        self._by_name = defaultdict(list)
+
+    @classmethod
+    def from_vm(cls, vmomi_object):
+        return cls.from_info(vmomi_object.snapshot)
+
+    @classmethod
+    def from_info(cls, info):
+        """
+        :param info: (vim.vm.SnapshotInfo) The 'snapshot' property of a virtual machine, may be None.
+        """
+        tree = cls()
+        if not info:
+            return tree
+
+        def build(items, parent):
+            for item in items:
+                node = tree._index(SnapshotNode(item.name, item.snapshot, item.description, item.createTime,
+                                                item.state, parent))
+                if parent is None:
+                    tree.roots.append(node)
+                else:
+                    parent.children.append(node)
+                build(item.childSnapshotList or [], node)
+
+        build(info.rootSnapshotList or [], None)
+        if info.currentSnapshot is not None:
+            tree._set_current(tree._by_moid.get(info.currentSnapshot._moId))
+        return tree
+
+    def _index(self, node):
+        self._by_moid[node.moid] = node
+        self._by_name[node.name].append(node)
+        return node
+
+    def _unindex(self, node):
+        self._by_moid.pop(node.moid, None)
+        self._by_name[node.name].remove(node)
+        if not self._by_name[node.name]:
+            del self._by_name[node.name]
+
+    def _set_current(self, node):
+        if self.current is not None:
+            self.current.is_current = False
+        self.current = node
+        if node is not None:
+            node.is_current = True
+
+    def __iter__(self):
+        for root in self.roots:
+            for node in root.walk():
+                yield node
+
+    def __len__(self):
+        return len(self._by_moid)
+
+    def find(self, key):
+        """
+        :param key: Snapshot managed object, its ID (ex: 'snapshot-42'), its path (ex: 'base/patched') or its name.
+        :return: SnapshotNode, or None when no snapshot matches.
+        :raises: ValueError, when a name or path matches several snapshots.
+        """
+        if hasattr(key, '_moId'):
+            return self._by_moid.get(key._moId)
+        if key in self._by_moid:
+            return self._by_moid[key]
+
+        nodes = self._by_name.get(key, [])
+        if not nodes and SEPARATOR in key:
+            nodes = [node for node in self._by_name.get(key.rsplit(SEPARATOR, 1)[-1], []) if node.path == key]
+        if len(nodes) > 1:
+            paths = [node.path for node in nodes]
+            if len(set(paths)) == len(paths):
+                raise ValueError("Snapshot name '{0}' is ambiguous, use one of the paths: {1}.".format(
+                    key, ', '.join(repr(path) for path in paths)))
+            # Same-named siblings, ex: 'pre' taken again after each revert to 'base'.
+            raise ValueError("Snapshot '{0}' is ambiguous, use one of the IDs: {1}.".format(
+                key, ', '.join('{0!r} ({1})'.format(node.moid, node.path) for node in nodes)))
+        return nodes[0] if nodes else None
+
+    def as_dict(self):
+        """
+        :return: (dict) Snapshot managed objects by path for the paths which are unique, and by name for the
+         names which are unique. Ambiguous snapshots are only reachable through 'find' with their ID.
+        """
+        nodes = list(self)
+        paths = Counter(node.path for node in nodes)
+        snapshots = dict((node.path, node.snapshot) for node in nodes if paths[node.path] == 1)
+        snapshots.update((name, each[0].snapshot) for name, each in self._by_name.items() if len(each) == 1)
+        return snapshots
+
+    def add(self, snapshot, name, description="", create_time=None, state=None):
+        """
+        Records a snapshot just taken: it becomes a child of the current snapshot and the new current one.
+        """
+        node = self._index(SnapshotNode(name, snapshot, description, create_time, state, self.current))
+        if self.current is None:
+            self.roots.append(node)
+        else:
+            self.current.children.append(node)
+        self._set_current(node)
+        return node
+
+    def remove(self, node, remove_children=False):
+        """
+        Records the removal of a snapshot; unless 'remove_children' its children move up to its parent.
+        The parent becomes current when the current snapshot is removed, as vSphere does.
+        """
+        siblings = node.parent.children if node.parent is not None else self.roots
+        position = siblings.index(node)
+        siblings.remove(node)
+
+        removed = list(node.walk()) if remove_children else [node]
+        if not remove_children:
+            for child in node.children:
+                child.parent = node.parent
+            siblings[position:position] = node.children
+
+        for each in removed:
+            self._unindex(each)
+            if each is self.current:
+                self._set_current(node.parent)
+
+    def revert(self, node):
+        """
+        Records a revert to 'node', which becomes the current snapshot.
+        """
+        self._set_current(node)
+
+    def clear(self):
+        """
+        Records the removal of all the snapshots.
+        """
+        self.__init__()
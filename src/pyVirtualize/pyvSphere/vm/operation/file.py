@@ -1,83 +1,456 @@
 __author__ = 'rramchandani'
 
+import io
 import os
+import mmap
+import re
+import gzip
+import json
+import zlib
+import shutil
+import hashlib
+import tempfile
+import time
+import uuid
+import threading
 import requests
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from pyVmomi import vim
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from pyVirtualize.utils.cache import TTLCache
+from pyVirtualize.utils.exceptions import GuestCommandFailed, TimeOutException
+from pyVirtualize.utils.metrics import transfer_metrics
+
 from ._base import BaseOperation
+from . import _shell
 
+LIST_PAGE_SIZE = 1000  # entries requested per ListFilesInGuest call.
+LISTING_CACHE_TTL = 10  # seconds a directory listing is reused for, at most, within one operation.
+WALK_WORKERS = 8  # directories listed concurrently by 'walk_remote'.
+CHUNK_SIZE = 1024 * 1024  # bytes buffered at once while streaming file contents.
+BROADCAST_WORKERS = 16  # uploads in flight during 'broadcast_upload'.
+SPOOL_SIZE = 64 * 1024 * 1024  # compressed payloads larger than this spill into a temporary file.
+PART_SIZE = 256 * 1024 * 1024  # size of the parts 'upload_large' splits files into.
+PART_WORKERS = 4  # parts uploaded concurrently by 'upload_large'.
+DELETE_WORKERS = 8  # paths deleted or moved concurrently by 'delete_remote' and 'move_within'.
+GUEST_IO_RATE = 16 * 1024 * 1024  # bytes per second a guest helper is assumed to get through, at least.
 
-class FileOperations(BaseOperation):
+
+def _glob_to_regex(pattern):
     """
-    FileOperations provides APIs to manipulate the guest operating system file options.
+    Translates a single path component glob ('*', '?', '[...]') into the anchored perl-compatible
+    regular expression understood by the 'matchPattern' argument of ListFilesInGuest.
     """
+    regex, i = '', 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == '*':
+            regex += '.*'
+        elif char == '?':
+            regex += '.'
+        elif char == '[':
+            end = pattern.find(']', i + 1 if pattern[i:i + 1] in ('!', ']') else i)
+            if end < 0:
+                regex += '\\['
+            else:
+                body = pattern[i:end].replace('\\', '\\\\')
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                regex += '[' + body + ']'
+                i = end + 1
+        else:
+            regex += re.escape(char)
+    return '^' + regex + '$'
 
-    def _upload_file(self, src, dest, credentials=None, overwrite=True):
 
-        if not os.path.isfile(src):
-            raise IOError("Local file '{0}' doesn't exists".format(src))
+class _SizedReader(object):
+    """
+    Exposes exactly 'size' bytes of 'stream' together with their length,
+    so that requests streams it with a Content-Length rather than chunked encoding.
+    """
 
-        with open(src, 'rb') as fhandler:
-            _file = fhandler.read()
+    def __init__(self, stream, size):
+        self._stream = stream
+        self._remaining = size
+
+    def __len__(self):
+        return self._remaining
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._stream.read(size) if size else b''
+        self._remaining -= len(data)
+        return data
+
+
+class _TimedReader(object):
+    """
+    Wraps an upload body to time the transfer phases: the first read marks the end of 'connect',
+    the last one the end of 'body', and the time spent reading the local side adds up as 'local_io'.
+    """
+
+    def __init__(self, stream, timer):
+        self._stream = stream
+        self._timer = timer
+        self._started = False
+        self._ended = False
+
+    def __len__(self):
+        return len(self._stream)
+
+    def read(self, size=-1):
+        if not self._started:
+            self._started = True
+            self._timer.phase('connect')
+        start = time.time()
+        data = self._stream.read(size)
+        self._timer.add('local_io', time.time() - start)
+        if not data and not self._ended:
+            # Asked for more once everything went out.
+            self._ended = True
+            self._timer.phase('body')
+        return data
+
+
+class _TimedWriter(object):
+    """
+    Adds the time spent writing into 'stream' to the 'local_io' phase of 'timer'.
+    """
+
+    def __init__(self, stream, timer):
+        self._stream = stream
+        self._timer = timer
+
+    def write(self, data):
+        start = time.time()
+        self._stream.write(data)
+        if self._timer is not None:
+            self._timer.add('local_io', time.time() - start)
+
+
+class _BufferReader(object):
+    """
+    Independent read cursor over a shared buffer (bytes or mmap); the buffer itself is never copied.
+    """
+
+    def __init__(self, buf):
+        self._buf = buf
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._buf) - self._offset
+
+    def read(self, size=-1):
+        end = len(self._buf) if size is None or size < 0 else min(self._offset + size, len(self._buf))
+        data = self._buf[self._offset:end]
+        self._offset = end
+        return data
+
+
+class RemoteFile(object):
+    """
+    Read-only file-like object streaming the contents of a guest file, as returned by 'FileOperations.open_remote'.
+
+    :ivar size: (int) Size of the guest file in bytes.
+    :ivar attributes: vim.vm.guest.FileManager.FileAttributes of the guest file.
+    """
+
+    def __init__(self, response, size=None, attributes=None, timer=None):
+        self._response = response
+        self.size = size
+        self.attributes = attributes
+        self.timer = timer
+        self._read = 0
+        self._closed = False
+
+    def _account(self, data):
+        if self.timer is not None and not self._read and data:
+            self.timer.phase('first_byte')
+        self._read += len(data)
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._account(self._response.raw.read(decode_content=True))
+        return self._account(self._response.raw.read(size, decode_content=True))
+
+    def __iter__(self):
+        for chunk in self._response.iter_content(CHUNK_SIZE):
+            yield self._account(chunk)
+
+    def close(self, error=None):
+        self._response.close()
+        if self.timer is not None and not self._closed:
+            self.timer.phase('body')
+            self.timer.finish(self._read, error=error)
+        self._closed = True
+
+    @property
+    def closed(self):
+        return self._response.raw.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(error=exc_value)
+
+
+RemoteStat = namedtuple('RemoteStat', ['path', 'type', 'size', 'mtime', 'attributes'])
+
+
+def _check_compression(method):
+    if method not in _shell.COMPRESSIONS:
+        raise ValueError("Unsupported compression '{0}', use one of {1}.".format(method, _shell.COMPRESSIONS))
+    if method == 'zstd' and zstandard is None:
+        raise ImportError("'zstd' compression requires the 'zstandard' package.")
+
+
+def _compress_stream(src, dest, method):
+    if method == 'zstd':
+        zstandard.ZstdCompressor().copy_stream(src, dest)
+    else:
+        with gzip.GzipFile(fileobj=dest, mode='wb') as gz:
+            shutil.copyfileobj(src, gz, CHUNK_SIZE)
+
+
+def _decompress_stream(src, dest, method):
+    if method == 'zstd':
+        zstandard.ZstdDecompressor().copy_stream(src, dest)
+    else:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dest.write(decompressor.decompress(chunk))
+        dest.write(decompressor.flush())
+
+
+def _local_digest(path, algo='sha256'):
+    digest = hashlib.new(algo)
+    with open(path, 'rb') as fhandler:
+        for chunk in iter(lambda: fhandler.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _UploadState(object):
+    """
+    Completed parts of a resumable upload, persisted as JSON after every part so a later retry can skip them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.parts = set()
+        if os.path.isfile(path):
+            with open(path) as fh:
+                self.parts = set(json.load(fh).get('parts', []))
 
-            file_attributes = vim.vm.guest.FileManager.WindowsFileAttributes()
-            content = self.service_instance.RetrieveContent()
-            file_manager = content.guestOperationsManager.fileManager
+    def discard(self, index):
+        with self._lock:
+            self.parts.discard(index)
 
-            cred = self._get_auth(type_=credentials)
+    def add(self, index):
+        with self._lock:
+            self.parts.add(index)
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(self.path + '.tmp', 'w') as fh:
+                json.dump({'parts': sorted(self.parts)}, fh)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self.path + '.tmp', self.path)
 
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _file_operations(vm):
+    return vm if isinstance(vm, FileOperations) else vm.operations.file
+
+
+def copy_between(src_vm, src_path, dst_vm, dst_path, src_credentials=None, dst_credentials=None, overwrite=True):
+    """
+    Copies a file or directory from one virtual machine's guest into another's, streaming the contents
+    from guest to guest without an intermediate local file. See 'FileOperations.copy_to'.
+
+    :param src_vm: (VirtualMachine or FileOperations) Source virtual machine.
+    :param src_path: (str) File or directory in the source guest.
+    :param dst_vm: (VirtualMachine or FileOperations) Target virtual machine.
+    :param dst_path: (str) File or directory in the target guest.
+    :param src_credentials: (str) Credentials type of the source virtual machine.
+    :param dst_credentials: (str) Credentials type of the target virtual machine.
+    :param overwrite: (bool) Overwrites the files already present in the target guest.
+    """
+    _file_operations(src_vm).copy_to(dst_vm, src_path, dst_path, credentials=src_credentials,
+                                      dst_credentials=dst_credentials, overwrite=overwrite)
+
+
+def broadcast_upload(vms, src, dest, credentials=None, overwrite=True, max_workers=BROADCAST_WORKERS):
+    """
+    Uploads one local file into the guests of many virtual machines.
+    The source is mapped into memory once and every upload streams from that shared mapping,
+    so local I/O does not grow with the number of targets.
+
+    :param vms: (list) VirtualMachine (or FileOperations) objects to upload into.
+    :param src: (str) Local file to upload.
+    :param dest: (str) Path of the file in each guest.
+    :param credentials: (str) Credentials type used on every virtual machine, see 'set_credentials'.
+    :param overwrite: (bool) Overwrites the file if present on guest while upload.
+    :param max_workers: (int) Maximum number of uploads in flight.
+
+    :return: (dict) For each of 'vms', None when the upload succeeded or else the exception raised for it.
+    """
+    if not os.path.isfile(src):
+        raise IOError("Local file '{0}' doesn't exists".format(src))
+
+    with open(src, 'rb') as fhandler:
+        size = os.path.getsize(src)
+        buf = mmap.mmap(fhandler.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+
+        def upload(vm):
             try:
-                file_manager.MakeDirectoryInGuest(
-                    vm=self.vmomi_object,
-                    auth=cred,
-                    directoryPath=os.path.dirname(dest),
-                    createParentDirectories=True
-                )
-            except:
-                # Directory already exists!
-                pass
+                _file_operations(vm).put_stream(dest, _BufferReader(buf), size=size, credentials=credentials,
+                                                overwrite=overwrite)
+                return vm, None
+            except Exception as err:
+                return vm, err
 
-            url = file_manager.InitiateFileTransferToGuest(
-                vm=self.vmomi_object,
-                auth=cred,
-                guestFilePath=dest,
-                fileAttributes=file_attributes,
-                fileSize=len(_file),
-                overwrite=overwrite
-            )
+        pool = ThreadPool(max(1, min(max_workers, len(vms))))
+        try:
+            return dict(pool.map(upload, vms))
+        finally:
+            pool.terminate()
+            if size:
+                buf.close()
+
+
+class FileOperations(BaseOperation):
+    """
+    FileOperations provides APIs to manipulate the guest operating system file options.
+    """
+
+    def __init__(self, vim, timeout=None, listing_cache_ttl=LISTING_CACHE_TTL, metrics=None, **kwargs):
+        super(FileOperations, self).__init__(vim, timeout=timeout, **kwargs)
+        # Directory listings are only cached for the duration of one operation, see '_listing_scope'.
+        self._listing_cache_ttl = listing_cache_ttl
+        self._scope = threading.local()
+        # Every transfer reports its phase timings here, see 'pyVirtualize.utils.metrics'.
+        self.metrics = metrics if metrics is not None else transfer_metrics
+        self._name = None
+
+    @property
+    def _listing_cache(self):
+        """
+        Listing cache of the operation running in this thread, None outside of any.
+        """
+        return getattr(self._scope, 'cache', None)
+
+    @contextmanager
+    def _listing_scope(self, cache=None):
+        """
+        Caches the directory listings, keyed by (VM, path, pattern), for the duration of one operation so that
+        its existence / type checks share them; the cache is dropped when the outermost scope of the thread exits,
+        hence guest programs or other clients writing in between never make a later call see stale listings.
+        Worker threads of the operation join it by passing the caller's 'cache'.
+        """
+        if self._listing_cache is not None:
+            yield self._listing_cache
+            return
+
+        self._scope.cache = cache if cache is not None else TTLCache(ttl=self._listing_cache_ttl)
+        try:
+            yield self._scope.cache
+        finally:
+            self._scope.cache = None
+
+    @property
+    def _vm_name(self):
+        if self._name is None:
+            self._name = self.vmomi_object.name
+        return self._name
 
-            # url = url.replace("*", self.address)
+    def transfer_summary(self):
+        """
+        Summary of the file transfers done with this virtual machine: number of transfers and failures, bytes,
+        seconds, seconds per phase ('initiate', 'connect', 'first_byte', 'body', 'local_io') and MB/s.
+        To follow every transfer individually, register a hook with 'self.metrics.add_hook'.
+        """
+        return self.metrics.summary(vm=self._vm_name)
 
-            response = requests.put(url, data=_file, verify=False)
+    def _upload_file(self, src, dest, credentials=None, overwrite=True, compress=None):
 
-            if response.status_code == requests.codes.ok:
-                # log.info("File uploaded in '{0}'.".format(self.vm_obj.summary.config.name))
-                pass
+        if not os.path.isfile(src):
+            raise IOError("Local file '{0}' doesn't exists".format(src))
+
+        with open(src, 'rb') as fhandler:
+            if compress:
+                self._upload_compressed(fhandler, dest, compress, credentials=credentials, overwrite=overwrite)
             else:
-                _ = "File could not be uploaded. Response: {0}, Reason: {1}". \
-                    format(response.status_code, response.content)
+                self.put_stream(dest, fhandler, size=os.path.getsize(src), credentials=credentials,
+                                overwrite=overwrite)
 
-                raise IOError(_)
+    def _upload_compressed(self, stream, dest, method, credentials=None, overwrite=True):
+        """
+        Compresses 'stream' locally, uploads the compressed payload into a guest temporary file and
+        lets a guest-side helper decompress it into 'dest'.
+        """
+        _check_compression(method)
 
-    def _upload_dir(self, src, dest, credentials=None):
+        if not overwrite and self.remote_path_exists(dest, credentials=credentials):
+            raise IOError("Remote path '{0}' already exists.".format(dest))
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            _compress_stream(stream, spool, method)
+            size = spool.tell()
+            spool.seek(0)
+
+            temp_path = self._create_guest_temp_file(suffix='.' + method, credentials=credentials)
+            try:
+                self.put_stream(temp_path, spool, size=size, credentials=credentials)
+                self._make_remote_dirs(os.path.dirname(dest), self._get_auth(type_=credentials))
+                self._run_guest_script(_shell.decompress_script(self._is_windows_guest(), method, temp_path, dest),
+                                       credentials=credentials)
+            except Exception:
+                # The helper removes the payload itself once it got decompressed.
+                self._delete_remote_file(temp_path, credentials=credentials)
+                raise
+            finally:
+                self._invalidate_listing(dest)
+
+    def _upload_dir(self, src, dest, credentials=None, compress=None):
 
         if os.path.isdir(src):
             for dirpath, dirs, files in os.walk(src):
                 for file_ in files:
                     src_file = os.path.join(dirpath, file_)
                     dest_file = os.path.join(dest, os.path.relpath(src_file, src))
-                    self._upload_file(src=src_file, dest=dest_file, credentials=credentials)
+                    self._upload_file(src=src_file, dest=dest_file, credentials=credentials, compress=compress)
 
                 for dir_ in dirs:
                     src_path = os.path.join(dirpath, dir_)
                     dest_path = os.path.join(dest, os.path.relpath(src_path, src))
-                    self._upload_dir(src=src_path, dest=dest_path, credentials=credentials)
+                    self._upload_dir(src=src_path, dest=dest_path, credentials=credentials, compress=compress)
 
         elif os.path.isfile(src):
             dest_file = os.path.join(dest, os.path.basename(src))
-            self._upload_file(src=src, dest=dest_file, credentials=credentials)
+            self._upload_file(src=src, dest=dest_file, credentials=credentials, compress=compress)
 
-    def upload(self, src, dest, credentials=None, overwrite=True):
+    def upload(self, src, dest, credentials=None, overwrite=True, compress=None):
         """
         Uploads the file/directory into the guest operating system.
         In case of file it will 'pyVirtualize' requires the file path and 'dest' also requires the path specifying file name. 
@@ -101,29 +474,143 @@ class FileOperations(BaseOperation):
         :param overwrite: (bool)
          Overwrites the file if present on guest while upload.
 
+        :param compress: (str, optional)
+         'gzip' or 'zstd'. Compresses every file before it is sent and decompresses it within the guest
+         using a helper run through the guest's shell, which pays off for compressible data over slow links.
+         'zstd' requires the 'zstandard' package locally and the 'zstd' tool within the guest.
+
         """
 
         if not (os.path.exists(src) or os.path.isfile(src) or os.path.isdir(src)):
             raise IOError("Source path '{0}' doesn't exists.".format(src))
 
         if os.path.isfile(src):
-            self._upload_file(src=src, dest=dest, credentials=credentials, overwrite=overwrite)
+            self._upload_file(src=src, dest=dest, credentials=credentials, overwrite=overwrite, compress=compress)
         else:
-            self._upload_dir(src=src, dest=dest, credentials=credentials)
+            self._upload_dir(src=src, dest=dest, credentials=credentials, compress=compress)
 
-    def _download_file(self, src, dest, credentials=None, overwrite=True):
+    def upload_large(self, src, dest, credentials=None, part_size=PART_SIZE, max_workers=PART_WORKERS,
+                     verify=True, state_dir=None):
+        """
+        Uploads a large file in parts which travel in parallel and are joined back within the guest.
+        Every completed part is recorded in a local state file, so calling it again after a failure
+        only sends the parts still missing in the guest.
+        Once joined, a SHA-256 computed within the guest is compared with the local one.
 
-        file_manager = self.service_instance.content.guestOperationsManager.fileManager
+        :param src: (str)
+         Local file to upload.
 
-        file_transfer_info = file_manager.InitiateFileTransferFromGuest(
-            vm=self.vmomi_object,
-            auth=self._get_auth(type_=credentials),
-            guestFilePath=src
-        )
+        :param dest: (str)
+         Path of the file in the guest. The parts are staged in the '<dest>.parts' guest directory.
 
-        url = file_transfer_info.url  # .replace('*', self.host_obj.address)
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param part_size: (int)
+         Size of every part in bytes.
+
+        :param max_workers: (int)
+         Number of parts uploaded concurrently.
+
+        :param verify: (bool)
+         Compare the SHA-256 of the joined guest file with the local file.
 
-        response = requests.get(url=url, verify=False)
+        :param state_dir: (str, optional)
+         Local directory holding the resume state, default is 'pyVirtualize-uploads' in the temp directory.
+
+        :return: (str) SHA-256 hex digest of the file when 'verify' is set.
+
+        :raises: IOError, when the guest file doesn't match the local one.
+        """
+        if not os.path.isfile(src):
+            raise IOError("Local file '{0}' doesn't exists".format(src))
+
+        stat = os.stat(src)
+        size = stat.st_size
+        count = max(1, (size + part_size - 1) // part_size)
+        parts_dir = dest + '.parts'
+        part_name = 'part{0:05d}'
+
+        state_key = '|'.join(str(_) for _ in (self.vmomi_object.summary.config.instanceUuid, dest,
+                                              os.path.abspath(src), size, stat.st_mtime, part_size))
+        state = _UploadState(os.path.join(state_dir or os.path.join(tempfile.gettempdir(), 'pyVirtualize-uploads'),
+                                          hashlib.sha1(state_key.encode('utf-8')).hexdigest() + '.json'))
+
+        # Parts recorded as done only count when the guest still holds them, complete.
+        if state.parts:
+            try:
+                present = dict((item.path, item.size) for item in self.iter_dir_in_vm(parts_dir, credentials))
+            except vim.fault.FileNotFound:
+                present = dict()
+            for index in list(state.parts):
+                expected = min(part_size, size - index * part_size)
+                if present.get(part_name.format(index)) != expected:
+                    state.discard(index)
+
+        if not state.parts:
+            # Leftovers of an attempt with other parameters would get joined too.
+            self._delete_remote_dir(parts_dir, credentials=credentials)
+
+        def upload_part(index):
+            offset = index * part_size
+            length = min(part_size, size - offset)
+            with open(src, 'rb') as fhandler:
+                fhandler.seek(offset)
+                self.put_stream(os.path.join(parts_dir, part_name.format(index)), _SizedReader(fhandler, length),
+                                size=length, credentials=credentials)
+            state.add(index)
+
+        pool = ThreadPool(max_workers)
+        try:
+            digest = pool.apply_async(_local_digest, (src,)) if verify else None
+            pool.map(upload_part, [index for index in range(count) if index not in state.parts])
+            local_digest = digest.get() if verify else None
+        finally:
+            pool.terminate()
+
+        windows = self._is_windows_guest()
+        self._run_guest_script(_shell.join_parts_script(windows, parts_dir, dest, uuid.uuid4().hex[:8]),
+                               credentials=credentials, timeout=self._helper_timeout(size))
+        self._invalidate_listing(parts_dir)
+        self._invalidate_listing(dest)
+        state.remove()
+
+        if verify:
+            remote_digest = self.remote_hash(dest, 'sha256', credentials=credentials,
+                                             timeout=self._helper_timeout(size))
+            if remote_digest != local_digest:
+                raise IOError("Integrity check of '{0}' failed, local sha256 {1} but guest sha256 {2}.".format(
+                    dest, local_digest, remote_digest))
+            return local_digest
+
+    def _download_files(self, files, credentials=None, overwrite=True, compress=None, cache=None, cache_hash=False):
+        """
+        Downloads the (src, dest, FileInfo) entries of 'files'.
+        With a 'cache', guest files are keyed by (path, size, modification time) and, if 'cache_hash' is set,
+        by their SHA-256 computed within the guest for all of 'files' in a single helper run.
+        When that helper fails, the files are downloaded without the cache rather than not at all.
+        """
+        keys = dict()
+        if cache is not None and files:
+            digests = dict()
+            if cache_hash:
+                try:
+                    digests = self.remote_hash([src for src, _, _ in files], credentials=credentials,
+                                               timeout=self._helper_timeout(sum(info.size for _, _, info in files)))
+                except (GuestCommandFailed, TimeOutException, IOError):
+                    digests = None
+            if digests is not None:
+                for src, _, info in files:
+                    keys[src] = (src, info.size, str(info.attributes.modificationTime), digests.get(src))
+
+        for src, dest, info in files:
+            self._download_file(src, dest, credentials=credentials, overwrite=overwrite, compress=compress,
+                                cache=cache, cache_key=keys.get(src))
+
+    def _download_file(self, src, dest, credentials=None, overwrite=True, compress=None, cache=None, cache_key=None):
 
         if os.path.exists(dest):
             if overwrite:
@@ -134,32 +621,85 @@ class FileOperations(BaseOperation):
             else:
                 return
 
-        if response.status_code == requests.codes.ok:
-            if not os.path.exists(os.path.dirname(dest)):
-                os.makedirs(os.path.dirname(dest))
-            with open(dest, "wb+") as fhandler:
-                fhandler.write(response.content)
-        else:
-            _ = "File was not downloaded. Response: {0}; Reason: {1}". \
-                format(response.status_code, response.content)
-
-            raise IOError(_)
-
-    def _download_dir(self, src, dest, credentials=None):
+        if cache_key is not None and cache.fetch(cache_key, dest):
+            return
 
-        files, dirs = self.get_remote_dir_desc(src, credentials=credentials)
-
-        for _file in files:
-            src_file = os.path.join(src, _file)
-            dest_file = os.path.join(dest, _file)
-            self._download_file(src_file, dest_file, credentials=credentials)
+        if compress:
+            _check_compression(method=compress)
+            temp_path = self._create_guest_temp_file(suffix='.' + compress, credentials=credentials)
+            try:
+                self._run_guest_script(_shell.compress_script(self._is_windows_guest(), compress, src, temp_path),
+                                       credentials=credentials)
+                self._write_local(temp_path, dest, credentials=credentials, compress=compress)
+            finally:
+                self._delete_remote_file(temp_path, credentials=credentials)
+        else:
+            self._write_local(src, dest, credentials=credentials)
 
-        for _dir in dirs:
-            src_path = os.path.join(src, _dir)
-            dest_path = os.path.join(dest, _dir)
-            self._download_dir(src_path, dest_path, credentials=credentials)
+        if cache_key is not None:
+            cache.store(cache_key, dest)
 
-    def download(self, src, dest, credentials=None, overwrite=True):
+    def _write_local(self, src, dest, credentials=None, compress=None):
+        with self.open_remote(src, credentials=credentials) as remote_file:
+            if os.path.dirname(dest) and not os.path.exists(os.path.dirname(dest)):
+                os.makedirs(os.path.dirname(dest))
+            with open(dest, "wb+") as fhandler:
+                writer = _TimedWriter(fhandler, remote_file.timer)
+                if compress:
+                    _decompress_stream(remote_file, writer, compress)
+                else:
+                    shutil.copyfileobj(remote_file, writer, CHUNK_SIZE)
+
+    def _download_dir(self, src, dest, credentials=None, overwrite=True, compress=None, cache=None, cache_hash=False):
+
+        for dirpath, dirs, files in self.walk_remote(src, credentials=credentials):
+            dest_path = os.path.normpath(os.path.join(dest, os.path.relpath(dirpath, src)))
+            self._download_files([(os.path.join(dirpath, _file.path), os.path.join(dest_path, _file.path), _file)
+                                  for _file in files],
+                                 credentials=credentials, overwrite=overwrite, compress=compress,
+                                 cache=cache, cache_hash=cache_hash)
+
+    def _iter_remote_glob(self, root, segments, relative='', credentials=None):
+        """
+        Yields (remote_path, relative_path, FileInfo) of the files below 'root' matching the glob 'segments'.
+        Every plain segment is evaluated by the guest through 'matchPattern', only '**' needs full listings.
+        """
+        head, rest = segments[0], segments[1:]
+
+        if head == '**':
+            if rest:
+                for match in self._iter_remote_glob(root, rest, relative, credentials):
+                    yield match
+            for _dir in self.get_remote_dir_desc(root, credentials)[1]:
+                for match in self._iter_remote_glob(os.path.join(root, _dir), segments,
+                                                    os.path.join(relative, _dir), credentials):
+                    yield match
+            return
+
+        for item in self._list_files(root, credentials, match_pattern=_glob_to_regex(head)):
+            if item.path in ('.', '..'):
+                continue
+            if rest and item.type == 'directory':
+                for match in self._iter_remote_glob(os.path.join(root, item.path), rest,
+                                                    os.path.join(relative, item.path), credentials):
+                    yield match
+            elif not rest and item.type == 'file':
+                yield os.path.join(root, item.path), os.path.join(relative, item.path), item
+
+    def _download_glob(self, src, dest, pattern, credentials=None, overwrite=True, compress=None, cache=None,
+                       cache_hash=False):
+        segments = [segment for segment in re.split(r'[/\\]', pattern) if segment]
+        if not segments:
+            raise ValueError("Invalid pattern '{0}'.".format(pattern))
+
+        files = [(src_file, os.path.join(dest, relative), info)
+                 for src_file, relative, info in self._iter_remote_glob(src, segments, credentials=credentials)]
+        self._download_files(files, credentials=credentials, overwrite=overwrite, compress=compress,
+                             cache=cache, cache_hash=cache_hash)
+        return [dest_file for _, dest_file, _ in files]
+
+    def download(self, src, dest, credentials=None, overwrite=True, pattern=None, compress=None, cache=None,
+                 cache_hash=False):
         """
         Downloads the file/directory into the guest operating system.
         In case of file it will 'pyVirtualize' requires the file path and 'dest' also requires the path specifying file name. 
@@ -183,18 +723,372 @@ class FileOperations(BaseOperation):
         :param overwrite: (bool)
          Overwrites the file if present on local when download.
 
+        :param pattern: (str, optional)
+         Glob selecting the files to download below the 'src' directory, ex: '*.dmp' or 'logs/**/*.dmp'.
+         Each path component is matched by the guest itself, so only matching entries are sent back;
+         '**' matches any number of directories.
+         The matched files are written below 'dest' keeping their path relative to 'src'.
+
+        :param compress: (str, optional)
+         'gzip' or 'zstd'. Every file is compressed within the guest by a helper run through the guest's shell,
+         transferred compressed and decompressed locally while it streams in.
+         'zstd' requires the 'zstandard' package locally and the 'zstd' tool within the guest.
+
+        :param cache: (pyVirtualize.utils.cache.ContentCache, optional)
+         Local content-addressed cache serving files already downloaded, from this or any other virtual machine,
+         with the same guest path, size and modification time.
+
+        :param cache_hash: (bool)
+         Also key the 'cache' by the SHA-256 of the guest file, computed within the guest. Costs one guest
+         helper run per directory but rules out false hits between files which merely look alike.
+
+        :return: List of the downloaded local files when 'pattern' is given.
+
         """
-        if not self.remote_path_exists(src, credentials=credentials):
-            raise IOError("Remote path '{0}' doesn't exists to download.".format(src))
+        with self._listing_scope():
+            if pattern is not None:
+                return self._download_glob(src, dest, pattern, credentials=credentials, overwrite=overwrite,
+                                           compress=compress, cache=cache, cache_hash=cache_hash)
+
+            info = self._remote_file_info(src, credentials=credentials)
+            if info is None or info.type not in ('file', 'directory'):
+                raise IOError("Remote path '{0}' doesn't exists to download.".format(src))
+
+            if info.type == 'file':
+                self._download_files([(src, dest, info)], credentials=credentials, overwrite=overwrite,
+                                     compress=compress, cache=cache, cache_hash=cache_hash)
+            else:
+                self._download_dir(src=src, dest=dest, credentials=credentials, overwrite=overwrite,
+                                   compress=compress, cache=cache, cache_hash=cache_hash)
 
-        if self._is_remote_path_file(src, credentials=credentials):
-            self._download_file(src=src, dest=dest, credentials=credentials)
-        else:
-            self._download_dir(src=src, dest=dest, credentials=credentials)
+    def _create_guest_temp_file(self, prefix='pyv', suffix='', credentials=None):
+        file_manager = self._guest_manager('fileManager')
+        return file_manager.CreateTemporaryFileInGuest(
+            vm=self.vmomi_object,
+            auth=self._get_auth(type_=credentials),
+            prefix=prefix,
+            suffix=suffix
+        )
+
+    def _create_guest_temp_dir(self, prefix='pyv', suffix='', credentials=None):
+        file_manager = self._guest_manager('fileManager')
+        return file_manager.CreateTemporaryDirectoryInGuest(
+            vm=self.vmomi_object,
+            auth=self._get_auth(type_=credentials),
+            prefix=prefix,
+            suffix=suffix
+        )
+
+    def _delete_remote_file(self, path, credentials=None, missing_ok=True):
+        file_manager = self._guest_manager('fileManager')
+        try:
+            file_manager.DeleteFileInGuest(
+                vm=self.vmomi_object,
+                auth=self._get_auth(type_=credentials),
+                filePath=path
+            )
+        except vim.fault.FileNotFound:
+            if not missing_ok:
+                raise
+        finally:
+            self._invalidate_listing(path)
+
+    def _delete_remote_dir(self, path, credentials=None, missing_ok=True):
+        file_manager = self._guest_manager('fileManager')
+        try:
+            file_manager.DeleteDirectoryInGuest(
+                vm=self.vmomi_object,
+                auth=self._get_auth(type_=credentials),
+                directoryPath=path,
+                recursive=True
+            )
+        except vim.fault.FileNotFound:
+            if not missing_ok:
+                raise
+        finally:
+            self._invalidate_listing(path)
+
+    def _helper_timeout(self, size):
+        """
+        Seconds allowed to a guest helper going through 'size' bytes: the operations timeout,
+        plus the time to read them at GUEST_IO_RATE.
+        """
+        return self._timeout_seconds + size // GUEST_IO_RATE
+
+    def _run_guest_script(self, script, credentials=None, timeout=None):
+        """
+        Runs a helper 'script' with the guest's shell and waits for it, up to 'timeout' seconds
+        (the operations timeout by default), raising GuestCommandFailed when it exits with a non-zero status.
+        Helpers run in a non-interactive session, hence they don't wait for a user to be logged in
+        ('guest.interactiveGuestOperationsReady'), which never happens on headless guests.
+        """
+        from .process import ProcessOperations
+
+        program, arguments = _shell.shell_command(self._is_windows_guest(), script)
+        process_info = ProcessOperations(self._vim, timeout=timeout or self._timeout_seconds).execute(
+            program, arguments, wait_for_guest_ready=False, credentials=credentials, interactive=False
+        )
+        if process_info.exitCode != 0:
+            raise GuestCommandFailed("Guest helper exited with status {0}.".format(process_info.exitCode))
+        return process_info
+
+    def _make_remote_dirs(self, path, cred):
+        file_manager = self._guest_manager('fileManager')
+        try:
+            file_manager.MakeDirectoryInGuest(
+                vm=self.vmomi_object,
+                auth=cred,
+                directoryPath=path,
+                createParentDirectories=True
+            )
+        except vim.fault.FileAlreadyExists:
+            pass
+        finally:
+            self._invalidate_listing(path)
+
+    def _initiate_upload(self, dest, size, credentials=None, overwrite=True):
+
+        file_manager = self._guest_manager('fileManager')
+        cred = self._get_auth(type_=credentials)
+
+        try:
+            self._make_remote_dirs(os.path.dirname(dest), cred)
+        except:
+            # Directory already exists!
+            pass
+
+        # url = url.replace("*", self.address)
+        return file_manager.InitiateFileTransferToGuest(
+            vm=self.vmomi_object,
+            auth=cred,
+            guestFilePath=dest,
+            fileAttributes=vim.vm.guest.FileManager.WindowsFileAttributes(),
+            fileSize=size,
+            overwrite=overwrite
+        )
+
+    def put_stream(self, dest, stream, size=None, credentials=None, overwrite=True):
+        """
+        Uploads the contents of a readable file-like object into a guest file, streaming it
+        straight from 'stream' without staging it on the local disk.
+
+        :param dest: (str)
+         Path of the guest file to write, missing directories are created.
 
-    def list_dir_in_vm(self, path, credentials=None):
+        :param stream: (file-like)
+         Object providing 'read'. It is read from its current position.
+
+        :param size: (int, optional)
+         Number of bytes 'stream' will provide. When omitted it is determined from a seekable stream,
+         otherwise the stream is read into memory first.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param overwrite: (bool)
+         Overwrites the file if present on guest while upload.
+        """
+        if size is None:
+            try:
+                position = stream.tell()
+                stream.seek(0, os.SEEK_END)
+                size = stream.tell() - position
+                stream.seek(position)
+            except (AttributeError, IOError, OSError):
+                stream = io.BytesIO(stream.read())
+                size = len(stream.getvalue())
+
+        timer = self.metrics.timer(self._vm_name, 'upload', dest)
+        try:
+            url = self._initiate_upload(dest, size, credentials=credentials, overwrite=overwrite)
+            timer.phase('initiate')
+
+            try:
+                body = _TimedReader(_SizedReader(stream, size), timer) if size else b''
+                response = requests.put(url, data=body, verify=False)
+                timer.phase('first_byte')
+            finally:
+                self._invalidate_listing(dest)
+
+            if response.status_code != requests.codes.ok:
+                _ = "File could not be uploaded. Response: {0}, Reason: {1}". \
+                    format(response.status_code, response.content)
+
+                raise IOError(_)
+        except Exception as err:
+            timer.finish(0, error=err)
+            raise
+        timer.finish(size)
+
+    def put_bytes(self, dest, data, credentials=None, overwrite=True):
+        """
+        Writes 'data' into a guest file directly from memory.
+
+        :param dest: (str)
+         Path of the guest file to write, missing directories are created.
+
+        :param data: (bytes or str)
+         Contents of the file, text is encoded as UTF-8.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param overwrite: (bool)
+         Overwrites the file if present on guest while upload.
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self.put_stream(dest, io.BytesIO(data), size=len(data), credentials=credentials, overwrite=overwrite)
+
+    def open_remote(self, src, credentials=None):
+        """
+        Opens a guest file for streamed reading, nothing is written to the local disk.
+
+        :param src: (str)
+         Path of the guest file to read.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :return: RemoteFile, a read-only file-like object which should be closed (or used as context manager).
+        """
+        file_manager = self._guest_manager('fileManager')
+        timer = self.metrics.timer(self._vm_name, 'download', src)
+
+        try:
+            file_transfer_info = file_manager.InitiateFileTransferFromGuest(
+                vm=self.vmomi_object,
+                auth=self._get_auth(type_=credentials),
+                guestFilePath=src
+            )
+            timer.phase('initiate')
+
+            url = file_transfer_info.url  # .replace('*', self.host_obj.address)
+
+            response = requests.get(url=url, verify=False, stream=True)
+            timer.phase('connect')
+
+            if response.status_code != requests.codes.ok:
+                _ = "File was not downloaded. Response: {0}; Reason: {1}". \
+                    format(response.status_code, response.content)
+                response.close()
+
+                raise IOError(_)
+        except Exception as err:
+            timer.finish(0, error=err)
+            raise
+
+        return RemoteFile(response, size=file_transfer_info.size, attributes=file_transfer_info.attributes,
+                          timer=timer)
+
+    def get_stream(self, src, stream, credentials=None):
+        """
+        Copies a guest file into a writable file-like object.
+
+        :param src: (str)
+         Path of the guest file to read.
+
+        :param stream: (file-like)
+         Object providing 'write'.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :return: (int) Number of bytes written.
+        """
+        written = 0
+        with self.open_remote(src, credentials=credentials) as remote_file:
+            writer = _TimedWriter(stream, remote_file.timer)
+            for chunk in remote_file:
+                writer.write(chunk)
+                written += len(chunk)
+        return written
+
+    def get_bytes(self, src, credentials=None):
+        """
+        Reads a guest file into memory.
+
+        :param src: (str)
+         Path of the guest file to read.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :return: (bytes) Contents of the file.
+        """
+        buf = io.BytesIO()
+        self.get_stream(src, buf, credentials=credentials)
+        return buf.getvalue()
+
+    def copy_to(self, dst_vm, src, dest, credentials=None, dst_credentials=None, overwrite=True):
+        """
+        Copies a file or directory of this guest into another virtual machine's guest.
+        The contents stream from this guest's transfer URL straight into the PUT towards the other guest,
+        with only a socket-sized buffer in between and nothing written on the local disk.
+
+        :param dst_vm: (VirtualMachine or FileOperations)
+         Target virtual machine.
+
+        :param src: (str)
+         File or directory in this guest.
+
+        :param dest: (str)
+         Target file, or directory whose contents mirror 'src', in the other guest.
+
+        :param credentials: (str)
+         Credentials type of this virtual machine, see 'set_credentials'.
+
+        :param dst_credentials: (str)
+         Credentials type of the target virtual machine, see 'set_credentials'.
+
+        :param overwrite: (bool)
+         Overwrites the files already present in the target guest.
+        """
+        dst_ops = _file_operations(dst_vm)
+
+        with self._listing_scope():
+            path_type = self._remote_path_type(src, credentials=credentials)
+            if path_type is None:
+                raise IOError("Remote path '{0}' doesn't exists to copy.".format(src))
+
+            if path_type == 'file':
+                self._copy_file_to(dst_ops, src, dest, credentials, dst_credentials, overwrite)
+                return
+
+            dst_cred = dst_ops._get_auth(type_=dst_credentials)
+            for dirpath, dirs, files in self.walk_remote(src, credentials=credentials):
+                dest_path = os.path.normpath(os.path.join(dest, os.path.relpath(dirpath, src)))
+                if not files:
+                    dst_ops._make_remote_dirs(dest_path, dst_cred)
+                for _file in files:
+                    self._copy_file_to(dst_ops, os.path.join(dirpath, _file.path),
+                                       os.path.join(dest_path, _file.path), credentials, dst_credentials, overwrite)
+
+    def _copy_file_to(self, dst_ops, src, dest, credentials=None, dst_credentials=None, overwrite=True):
+        with self.open_remote(src, credentials=credentials) as remote_file:
+            dst_ops.put_stream(dest, remote_file, size=remote_file.size, credentials=dst_credentials,
+                               overwrite=overwrite)
+
+    def list_dir_in_vm(self, path, credentials=None, match_pattern=None):
         """
         Returns information about files or directories in the guest.
+        The listing is paged through completely, so directories holding more entries than the
+        server returns in one call are not truncated.
 
         :param path: (str)
          The complete path to the directory or file to query.
@@ -205,57 +1099,176 @@ class FileOperations(BaseOperation):
          If string is left empty, it will find the 'default' credentials type and will use them.
          And if it doesn't find any, then it will raise an Exception.
 
+        :param match_pattern: (str, optional)
+         Perl-compatible regular expression, evaluated by the guest, which the returned names must match.
+
         :return: 
             vim.vm.guest.FileManager.ListFileInfo:
                 A `GuestListFileInfo` object containing information for all the matching files in the filePath and 
                 the number of files left to be returned.
 
         """
-        file_manager = self.service_instance.content.guestOperationsManager.fileManager
-
-        return file_manager.ListFilesInGuest(
-            vm=self.vmomi_object,
-            auth=self._get_auth(type_=credentials),
-            filePath=path
+        return vim.vm.guest.FileManager.ListFileInfo(
+            files=self._list_files(path, credentials=credentials, match_pattern=match_pattern),
+            remaining=0
         )
 
-    def get_remote_dir_desc(self, path, credentials=None):
+    def iter_dir_in_vm(self, path, credentials=None, match_pattern=None, page_size=LIST_PAGE_SIZE):
+        """
+        Generator over the files or directories in the guest, fetching the listing 'page_size' entries
+        at a time using the 'index' and 'maxResults' arguments of ListFilesInGuest.
+        Unlike 'list_dir_in_vm' it does not consult or fill the listing cache.
 
-        file_list = self.list_dir_in_vm(path, credentials)
+        :param path: (str)
+         The complete path to the directory or file to query.
 
-        try:
-            fi = [item.path for item in file_list.files if item.type == 'file']
-        except:
-            fi = []
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
 
-        try:
-            di = [item.path for item in file_list.files if item.type == 'directory']
-        except:
-            di = []
+        :param match_pattern: (str, optional)
+         Perl-compatible regular expression, evaluated by the guest, which the returned names must match.
 
-        if di.__contains__('.'):
-            di.remove('.')
-        if di.__contains__('..'):
-            di.remove('..')
+        :param page_size: (int)
+         Maximum number of entries requested per ListFilesInGuest call.
+
+        :return: iterator of vim.vm.guest.FileManager.FileInfo
+        """
+        file_manager = self._guest_manager('fileManager')
+        auth = self._get_auth(type_=credentials)
+
+        index = 0
+        while True:
+            file_list = file_manager.ListFilesInGuest(
+                vm=self.vmomi_object,
+                auth=auth,
+                filePath=path,
+                index=index,
+                maxResults=page_size,
+                matchPattern=match_pattern
+            )
+            files = file_list.files or []
+            for item in files:
+                yield item
+
+            index += len(files)
+            if not files or not file_list.remaining:
+                break
+
+    def _list_files(self, path, credentials=None, match_pattern=None):
+        cache = self._listing_cache
+        if cache is None:
+            return list(self.iter_dir_in_vm(path, credentials=credentials, match_pattern=match_pattern))
+
+        key = (self._vm_key, self._normalize_remote_path(path), match_pattern)
+        files = cache.get(key)
+        if files is None:
+            files = list(self.iter_dir_in_vm(path, credentials=credentials, match_pattern=match_pattern))
+            cache.set(key, files)
+        return files
+
+    def get_remote_dir_desc(self, path, credentials=None, match_pattern=None):
+
+        files = self._list_files(path, credentials, match_pattern=match_pattern)
+
+        fi = [item.path for item in files if item.type == 'file']
+        di = [item.path for item in files if item.type == 'directory' and item.path not in ('.', '..')]
 
         return fi, di
 
-    def _is_remote_path_dir(self, path, credentials=None):
-        fi, di = self.get_remote_dir_desc(os.path.dirname(path), credentials)
-        for d in di:
-            if d == os.path.basename(path):
-                return True
+    def walk_remote(self, path, credentials=None, max_workers=WALK_WORKERS, onerror=None):
+        """
+        Generates the file names in the guest directory tree rooted at 'path', like 'os.walk' does locally.
+        Sub-directories are listed concurrently by up to 'max_workers' threads and every directory is
+        yielded as soon as its listing arrives, hence the order is not top-down.
+        As the sub-directories are scheduled before yielding, pruning 'dirs' in place has no effect.
 
-        return False
+        :param path: (str)
+         The guest directory to walk.
 
-    def _is_remote_path_file(self, path, credentials=None):
-        fi, di = self.get_remote_dir_desc(os.path.dirname(path), credentials)
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param max_workers: (int)
+         Maximum number of ListFilesInGuest calls in flight.
+
+        :param onerror: (callable, optional)
+         Called with (dirpath, exception) when a directory cannot be listed, after which the walk goes on.
+         By default the exception is raised.
+
+        :return: iterator of (dirpath, dirs, files) tuples, 'dirs' being the sub-directory names and
+         'files' the vim.vm.guest.FileManager.FileInfo objects, carrying size and attributes, of the files.
+        """
+        results = queue.Queue()
+        pool = ThreadPool(max_workers)
+        cache = self._listing_cache
+
+        def list_dir(dirpath):
+            try:
+                with self._listing_scope(cache):
+                    results.put((dirpath, self._list_files(dirpath, credentials), None))
+            except Exception as err:
+                results.put((dirpath, None, err))
+
+        try:
+            pool.apply_async(list_dir, (path,))
+            pending = 1
+
+            while pending:
+                dirpath, listing, error = results.get()
+                pending -= 1
 
-        for f in fi:
-            if f == os.path.basename(path):
-                return True
+                if error is not None:
+                    if onerror is None:
+                        raise error
+                    onerror(dirpath, error)
+                    continue
 
-        return False
+                dirs = [item.path for item in listing if item.type == 'directory' and item.path not in ('.', '..')]
+                files = [item for item in listing if item.type == 'file']
+
+                for _dir in dirs:
+                    pool.apply_async(list_dir, (os.path.join(dirpath, _dir),))
+                    pending += 1
+
+                yield dirpath, dirs, files
+        finally:
+            pool.terminate()
+
+    def _remote_file_info(self, path, credentials=None):
+        """
+        FileInfo of the remote path as listed in its parent directory, or None when it doesn't exist.
+        A listing of the parent already in the cache is reused, otherwise only the entry itself is listed.
+        """
+        path = self._normalize_remote_path(path)
+        parent, name = os.path.dirname(path), os.path.basename(path)
+
+        cache = self._listing_cache
+        listing = cache.get((self._vm_key, parent, None)) if cache is not None else None
+        if listing is None:
+            listing = self._list_files(parent, credentials, match_pattern='^' + re.escape(name) + '$')
+        for item in listing:
+            if item.path == name:
+                return item
+        return None
+
+    def _remote_path_type(self, path, credentials=None):
+        """
+        Type of the remote path ('file', 'directory' or 'symlink'), or None when it doesn't exist.
+        """
+        info = self._remote_file_info(path, credentials)
+        return info.type if info is not None else None
+
+    def _is_remote_path_dir(self, path, credentials=None):
+        return self._remote_path_type(path, credentials) == 'directory'
+
+    def _is_remote_path_file(self, path, credentials=None):
+        return self._remote_path_type(path, credentials) == 'file'
 
     def remote_path_exists(self, path, credentials=None):
         """
@@ -273,19 +1286,103 @@ class FileOperations(BaseOperation):
         :return: (bool) 'True' if path exists or else 'False' if it doesn't.
 
         """
-        fi, di = self.get_remote_dir_desc(os.path.dirname(path), credentials)
+        return self._remote_path_type(path, credentials) in ('file', 'directory')
+
+    def remote_stat(self, path, credentials=None):
+        """
+        Status of a guest file or directory, read from ListFilesInGuest without transferring the file.
+
+        :param path: (str)
+         The complete path to the directory or file to query.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :return: RemoteStat(path, type, size, mtime, attributes), 'mtime' being a datetime and 'attributes'
+         the vim.vm.guest.FileManager.FileAttributes of the entry.
+
+        :raises: IOError, if the path doesn't exist.
+        """
+        info = self._remote_file_info(path, credentials=credentials)
+        if info is None:
+            raise IOError("Remote path '{0}' was not found.".format(path))
+        return RemoteStat(path, info.type, info.size, info.attributes.modificationTime, info.attributes)
+
+    def remote_hash(self, paths, algo='sha256', credentials=None, timeout=None):
+        """
+        Computes digests of guest files within the guest, all of 'paths' in a single helper run,
+        so checking contents costs no transfer of the files themselves.
+        The list of paths is uploaded into a guest file which the helper reads, hence any number of paths
+        fits within the command line limits of the guest.
+
+        :param paths: (str or list)
+         Guest file, or list of guest files, to hash.
+
+        :param algo: (str)
+         One of 'md5', 'sha1', 'sha256' or 'sha512'.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param timeout: (int, optional)
+         Seconds allowed to the helper, default is the operations timeout.
+
+        :return: Hex digest of 'paths', or when a list is given, a dict mapping every path to its hex digest.
+         Paths which are not regular files get None.
+        """
+        single = not isinstance(paths, (list, tuple, set))
+        paths = [paths] if single else list(paths)
 
-        for f in fi:
-            if f == os.path.basename(path):
-                return True
+        paths_file = self._create_guest_temp_file(suffix='.paths', credentials=credentials)
+        output = self._create_guest_temp_file(suffix='.' + algo, credentials=credentials)
+        try:
+            self.put_bytes(paths_file, '\n'.join(paths) + '\n', credentials=credentials)
+            self._run_guest_script(_shell.hash_script(self._is_windows_guest(), algo, paths_file, output),
+                                   credentials=credentials, timeout=timeout)
+            digests = _shell.parse_hash_output(self.get_bytes(output, credentials=credentials))
+        finally:
+            self._delete_remote_file(paths_file, credentials=credentials)
+            self._delete_remote_file(output, credentials=credentials)
+
+        digests = dict((path, digests.get(path)) for path in paths)
+        return digests[paths[0]] if single else digests
+
+    @property
+    def _vm_key(self):
+        return self.vmomi_object._moId
+
+    @staticmethod
+    def _normalize_remote_path(path):
+        stripped = path.rstrip('/\\')
+        return stripped if stripped else path
+
+    def _invalidate_listing(self, path):
+        """
+        Forgets the cached listings of 'path', of everything beneath it and of all its parents,
+        since a write or delete at 'path' may have changed any of them.
+        """
+        cache = self._listing_cache
+        if cache is None:
+            return
+        path = self._normalize_remote_path(path)
+
+        def nested(parent, child):
+            return child == parent or any(child.startswith(parent.rstrip(sep) + sep) for sep in '/\\')
 
-        for d in di:
-            if d == os.path.basename(path):
-                return True
-        return False
+        cache.invalidate_if(
+            lambda key: key[0] == self._vm_key and (nested(path, key[1]) or nested(key[1], path))
+        )
 
     def create_remote(self, path, contents=None, credentials=None):
         """
+        Creates the file 'path' with 'contents' in the guest, written directly from memory.
+        Without 'contents' it only creates the parent directories of 'path'.
 
         :param path: 
         :param contents: 
@@ -293,23 +1390,10 @@ class FileOperations(BaseOperation):
         :return: 
         """
         if contents is not None:
-
-            with open(os.path.basename(path), "w+") as fh:
-                fh.write(contents)
-            self.move_remote(os.path.basename(path), path, credentials=credentials)
+            self.put_bytes(path, contents, credentials=credentials)
         else:
 
-            content = self.service_instance.RetrieveContent()
-            file_manager = content.guestOperationsManager.fileManager
-
-            cred = self._get_auth(type_=credentials)
-
-            file_manager.MakeDirectoryInGuest(
-                vm=self.vmomi_object,
-                auth=cred,
-                directoryPath=os.path.dirname(path),
-                createParentDirectories=True
-            )
+            self._make_remote_dirs(os.path.dirname(path), self._get_auth(type_=credentials))
 
     def create_local(self, path, contents=None):
 
@@ -321,25 +1405,68 @@ class FileOperations(BaseOperation):
         else:
             os.makedirs(path)
 
-    def delete_remote(self, path, credentials=None):
+    def delete_remote(self, path, credentials=None, max_workers=DELETE_WORKERS):
+        """
+        Deletes guest files or directories, directories recursively.
+        The type of each path is taken from the listings of the running operation when known (ex: 'move_local'),
+        so no existence check precedes the delete, and several paths are deleted concurrently.
 
-        if not self.remote_path_exists(path, credentials=credentials):
-            raise IOError("Remote path '{0}' was not found.".format(path))
+        :param path: (str or list)
+         Guest path, or list of guest paths, to delete.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param max_workers: (int)
+         Maximum number of deletes in flight.
+
+        :raises: IOError, if a path was not found.
+        """
+        if not isinstance(path, (list, tuple, set)):
+            return self._delete_remote_path(path, credentials=credentials)
+
+        cache = self._listing_cache
+
+        def delete(each):
+            with self._listing_scope(cache):
+                self._delete_remote_path(each, credentials=credentials)
 
-        file_manager = self.service_instance.content.guestOperationsManager.fileManager
+        pool = ThreadPool(max(1, min(max_workers, len(path))))
         try:
-            file_manager.DeleteDirectoryInGuest(
-                vm=self.vmomi_object,
-                auth=self._get_auth(type_=credentials),
-                directoryPath=path,
-                recursive=True
-            )
-        except vim.fault.NotADirectory:
-            file_manager.DeleteFileInGuest(
-                vm=self.vmomi_object,
-                auth=self._get_auth(type_=credentials),
-                filePath=path
-            )
+            pool.map(delete, path)
+        finally:
+            pool.terminate()
+
+    def _cached_path_type(self, path):
+        """
+        Type of the remote path if a cached listing of its parent knows it, without any guest call.
+        """
+        cache = self._listing_cache
+        if cache is None:
+            return None
+        path = self._normalize_remote_path(path)
+        parent, name = os.path.dirname(path), os.path.basename(path)
+        for match_pattern in (None, '^' + re.escape(name) + '$'):
+            for item in cache.get((self._vm_key, parent, match_pattern)) or []:
+                if item.path == name:
+                    return item.type
+        return None
+
+    def _delete_remote_path(self, path, credentials=None):
+        path_type = self._cached_path_type(path)
+        try:
+            if path_type in ('file', 'symlink'):
+                self._delete_remote_file(path, credentials=credentials, missing_ok=False)
+                return
+            try:
+                self._delete_remote_dir(path, credentials=credentials, missing_ok=False)
+            except vim.fault.NotADirectory:
+                self._delete_remote_file(path, credentials=credentials, missing_ok=False)
+        except vim.fault.FileNotFound:
+            raise IOError("Remote path '{0}' was not found.".format(path))
 
     def delete_local(self, path):
 
@@ -361,14 +1488,83 @@ class FileOperations(BaseOperation):
 
         self.delete_local(src)
 
-    def move_local(self, src, dest, credentials=None):
+    def move_within(self, src, dest, credentials=None, overwrite=False, max_workers=DELETE_WORKERS):
+        """
+        Moves or renames files or directories inside the guest with MoveFileInGuest / MoveDirectoryInGuest,
+        the data never leaves the guest.
 
-        if not self.remote_path_exists(src):
-            raise IOError("Remote path '{0}' doesn't exists in '{1}'.".format(src,
-                                                                              self.vmomi_object.summary.config.name))
+        :param src: (str or list)
+         Guest path to move, or list of guest paths to move into the 'dest' directory concurrently.
 
-        if os.path.isfile(src):
-            self._download_file(src, dest, credentials)
-        else:
-            self._download_dir(src, dest, credentials)
-        self.delete_remote(src, credentials)
+        :param dest: (str)
+         New guest path, or the target directory when 'src' is a list.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param overwrite: (bool)
+         Replaces an existing target file; directories are never replaced.
+
+        :param max_workers: (int)
+         Maximum number of moves in flight.
+        """
+        if not isinstance(src, (list, tuple, set)):
+            return self._move_remote_path(src, dest, credentials=credentials, overwrite=overwrite)
+
+        cache = self._listing_cache
+
+        def move(path):
+            name = os.path.basename(self._normalize_remote_path(path))
+            with self._listing_scope(cache):
+                self._move_remote_path(path, os.path.join(dest, name), credentials=credentials, overwrite=overwrite)
+
+        pool = ThreadPool(max(1, min(max_workers, len(src))))
+        try:
+            pool.map(move, src)
+        finally:
+            pool.terminate()
+
+    def _move_remote_path(self, src, dest, credentials=None, overwrite=False):
+        file_manager = self._guest_manager('fileManager')
+        auth = self._get_auth(type_=credentials)
+
+        path_type = self._cached_path_type(src) or self._remote_path_type(src, credentials=credentials)
+        if path_type is None:
+            raise IOError("Remote path '{0}' was not found.".format(src))
+
+        try:
+            if path_type == 'directory':
+                file_manager.MoveDirectoryInGuest(
+                    vm=self.vmomi_object,
+                    auth=auth,
+                    srcDirectoryPath=src,
+                    dstDirectoryPath=dest
+                )
+            else:
+                file_manager.MoveFileInGuest(
+                    vm=self.vmomi_object,
+                    auth=auth,
+                    srcFilePath=src,
+                    dstFilePath=dest,
+                    overwrite=overwrite
+                )
+        finally:
+            self._invalidate_listing(src)
+            self._invalidate_listing(dest)
+
+    def move_local(self, src, dest, credentials=None):
+        """
+        Moves a guest file or directory onto the local disk: downloads it, then deletes it from the guest.
+        """
+        with self._listing_scope():
+            path_type = self._remote_path_type(src, credentials=credentials)
+            if path_type not in ('file', 'directory'):
+                raise IOError("Remote path '{0}' doesn't exists in '{1}'.".format(
+                    src, self.vmomi_object.summary.config.name))
+
+            self.download(src, dest, credentials=credentials)
+            # The type is cached by now, the delete goes straight to the right call.
+            self.delete_remote(src, credentials=credentials)
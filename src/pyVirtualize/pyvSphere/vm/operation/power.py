@@ -24,6 +24,7 @@ class PowerOperations(BaseOperation):
          
         """
         self.vmomi_object.PowerOn()
+        self._invalidate_guest_state()
         if sync: self._wait_for_power_on(wait_for_guest_ready)
 
     def power_off(self, sync=True):
@@ -36,6 +37,7 @@ class PowerOperations(BaseOperation):
 
         """
         self.vmomi_object.PowerOff()
+        self._invalidate_guest_state()
         if sync: self._wait_for_power_off()
 
     def shutdown(self, sync=True):
@@ -48,6 +50,7 @@ class PowerOperations(BaseOperation):
          
         """
         self.vmomi_object.ShutdownGuest()
+        self._invalidate_guest_state()
         if sync: self._wait_for_power_off()
 
     def restart(self, sync=True):
@@ -76,4 +79,5 @@ class PowerOperations(BaseOperation):
         :return: 
         """
         self.vmomi_object.ResetVM_Task()
+        self._invalidate_guest_state()
         if sync: self._wait_for_power_on()
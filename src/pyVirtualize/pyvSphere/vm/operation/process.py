@@ -1,9 +1,191 @@
 __author__ = 'rramchandani'
 
+import time
+import uuid
+import threading
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
 from pyVmomi import vim
 from pyVirtualize.utils.exceptions import TimeOutException, ProgramNotExecuted
 
-from ._base import BaseOperation
+from ._base import BaseOperation, retrieve_contents
+from .file import FileOperations
+from . import _shell
+
+STREAM_POLL_INTERVAL = 5  # seconds between two reads of a streamed program output.
+FLEET_WORKERS = 64  # maximum number of virtual machines 'run_everywhere' works on at once.
+HOST_CONCURRENCY = 8  # maximum number of those running on the same ESXi host.
+
+
+class ProcessResult(object):
+    """
+    Outcome of a program run through 'ProcessOperations.run'.
+
+    :ivar exit_code: (int) Exit code of the program, None if the guest didn't report it.
+    :ivar stdout: (str) Captured standard output, None when not captured.
+    :ivar stderr: (str) Captured standard error, None when not captured.
+    :ivar timings: (dict) Seconds spent per step: 'prepare', 'execute', 'fetch' and 'cleanup'.
+    :ivar process_info: vim.vm.guest.ProcessManager.ProcessInfo of the process started in the guest.
+    """
+
+    def __init__(self, exit_code, stdout=None, stderr=None, timings=None, process_info=None):
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timings = timings if timings is not None else dict()
+        self.process_info = process_info
+
+    def __repr__(self):
+        return "<ProcessResult: exit_code={0}>".format(self.exit_code)
+
+
+class ProcessStream(object):
+    """
+    Iterator over the output lines of a program running in the guest, see 'ProcessOperations.stream'.
+
+    :ivar exit_code: (int) Exit code of the program, set once the iteration ended.
+    :ivar process_info: vim.vm.guest.ProcessManager.ProcessInfo of the program, set once the iteration ended.
+    """
+
+    def __init__(self):
+        self._lines = iter(())
+        self._cleanup = None
+        self.exit_code = None
+        self.process_info = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._lines)
+
+    next = __next__
+
+    def close(self):
+        """
+        Stops following the output; the program itself keeps running in the guest.
+        """
+        self._lines.close()
+        if self._cleanup is not None:
+            # Closed before the first line was asked for, the iteration never got to clean up.
+            self._cleanup()
+            self._cleanup = None
+
+
+class CommandBatch(object):
+    """
+    Collects command lines and runs them all in the guest through a single script and a single
+    StartProgramInGuest, instead of one 'execute' per command.
+    The commands are written in the syntax of 'shell': 'sh' or 'bash' for Linux guests,
+    'cmd' or 'powershell' for Windows guests; it defaults to 'cmd' on Windows and 'sh' elsewhere.
+    Each command runs with its own stdout and stderr, for 'cmd' the redirection applies to the last command
+    of a '&' chain only. With 'sh' and 'bash' each command runs in a subshell; with 'cmd' and 'powershell'
+    a command calling 'exit' ends the whole batch, the commands after it being reported as not run.
+
+    Usage:
+        batch = vm.operations.process.batch()
+        batch.add('reg add HKLM\\Software\\Foo /v Bar /d 1 /f').add('sc stop foo')
+        for result in batch.run(stop_on_error=True):
+            print(result.exit_code, result.stdout)
+
+    :ivar timings: (dict) Seconds spent by the last 'run' per step: 'prepare', 'execute', 'fetch' and 'cleanup'.
+    """
+
+    def __init__(self, operations, shell=None):
+        if shell is not None and shell not in _shell.BATCH_SHELLS:
+            raise ValueError("Unsupported shell '{0}', use one of {1}.".format(shell, _shell.BATCH_SHELLS))
+        self._operations = operations
+        self.shell = shell
+        self.commands = []
+        self.timings = dict()
+
+    def add(self, command):
+        """
+        :param command: (str) Command line, in the syntax of the batch's shell.
+        :return: the batch itself, so that calls can be chained.
+        """
+        self.commands.append(command)
+        return self
+
+    def __len__(self):
+        return len(self.commands)
+
+    def run(self, stop_on_error=False, cwd="", env_vars=None, wait_for_guest_ready=True, credentials=None,
+            interactive=True, encoding='utf-8'):
+        """
+        Uploads the compiled script, runs it once and collects every command's exit code and output.
+
+        :param stop_on_error: (bool)
+         Skip the remaining commands once one exits with a non-zero status.
+
+        :param cwd: (str)
+         The absolute path of the working directory for the commands to be run.
+
+        :param env_vars: (str)
+         An array of environment variables, specified in the guest OS notation, see 'execute'.
+
+        :param wait_for_guest_ready: (bool)
+         Wait until Guest operations are ready before starting the script.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param interactive: (bool)
+         This is set to true if the client wants an interactive session in the guest.
+
+        :param encoding: (str)
+         Encoding used to decode the outputs, None keeps them as bytes.
+
+        :return: (list) One ProcessResult per command, in the order they were added.
+         Commands skipped due to 'stop_on_error' have an 'exit_code' of None.
+        """
+        operations = self._operations
+        files = FileOperations(operations._vim, timeout=operations._timeout_seconds)
+        shell = self.shell or ('cmd' if operations._is_windows_guest() else 'sh')
+        windows = shell in ('cmd', 'powershell')
+        token = '--pyv-{0}--'.format(uuid.uuid4().hex)
+        timings = self.timings = dict()
+        start = time.time()
+
+        workdir = files._create_guest_temp_dir(credentials=credentials)
+        try:
+            script = _shell.batch_script(shell, self.commands, workdir, token, stop_on_error).encode('utf-8')
+            if shell == 'powershell':
+                # Without a BOM, Windows PowerShell reads scripts in the ANSI code page.
+                script = b'\xef\xbb\xbf' + script
+            script_path = _shell.join(windows, workdir, 'batch.' + _shell.BATCH_EXTENSIONS[shell])
+            files.put_bytes(script_path, script, credentials=credentials)
+            program, arguments = _shell.batch_command(shell, script_path)
+            timings['prepare'] = time.time() - start
+
+            start = time.time()
+            operations.execute(program, arguments, cwd=cwd, env_vars=env_vars,
+                               wait_for_guest_ready=wait_for_guest_ready, credentials=credentials,
+                               interactive=interactive)
+            timings['execute'] = time.time() - start
+
+            start = time.time()
+            output = files.get_bytes(_shell.join(windows, workdir, 'result'), credentials=credentials)
+            timings['fetch'] = time.time() - start
+        finally:
+            start = time.time()
+            files._delete_remote_dir(workdir, credentials=credentials)
+            timings['cleanup'] = time.time() - start
+
+        results = []
+        for outcome in _shell.parse_batch_output(output, token, len(self.commands)):
+            if outcome is None:
+                results.append(ProcessResult(None))
+                continue
+            exit_code, stdout, stderr = outcome
+            if encoding:
+                stdout, stderr = stdout.decode(encoding, 'replace'), stderr.decode(encoding, 'replace')
+            results.append(ProcessResult(exit_code, stdout, stderr))
+        return results
 
 
 class ProcessOperations(BaseOperation):
@@ -13,7 +195,7 @@ class ProcessOperations(BaseOperation):
 
     def execute(self, program, arguments="", cwd="", env_vars=None, start_minimized=False,
                 wait_for_guest_ready=True, wait_for_program_to_exit=True,
-                credentials=None, interactive=True):
+                credentials=None, interactive=True, on_output=None):
         """
         Starts a program in the guest operating system.
         If program is not executed then it will raise an Exception ''
@@ -74,6 +256,10 @@ class ProcessOperations(BaseOperation):
         :param interactive: (bool) 
          This is set to true if the client wants an interactive session in the guest.
 
+        :param on_output: (callable, optional)
+         Called with each line of the program's output (stdout and stderr merged) while it runs, see 'stream'.
+         Implies waiting for the program to exit.
+
         :return:  vim.vm.guest.ProcessManager.ProcessInfo:
             Attributes:
                 name (str): The process name
@@ -136,13 +322,20 @@ class ProcessOperations(BaseOperation):
 
         """
 
+        if on_output is not None:
+            stream = self.stream(program, arguments, cwd=cwd, env_vars=env_vars,
+                                 wait_for_guest_ready=wait_for_guest_ready, credentials=credentials,
+                                 interactive=interactive)
+            for line in stream:
+                on_output(line)
+            return stream.process_info
+
         self._precheck_for_operations()
 
-        if wait_for_guest_ready and not self._is_guest_operations_ready():
+        if wait_for_guest_ready and not self._is_guest_operations_ready(cached=True):
             self._wait_for_guest_operations_ready()
 
-        content = self.service_instance.RetrieveContent()
-        pm = content.guestOperationsManager.processManager
+        pm = self._guest_manager('processManager')
         creds = self._get_auth(type_=credentials, interactive=interactive)
 
         if creds is None:
@@ -176,11 +369,316 @@ class ProcessOperations(BaseOperation):
                 # Program executed, now wait for process to complete or timeout after 'default_timeout' secs!
                 self._wait_for_process_terminate_in_guest(res, creds)
 
-        process_info = self.list_processes(pids=[res], credentials=credentials)
+        process_info = self.list_processes(pids=[res], credentials=credentials, interactive=interactive)
         process_info = process_info[0] if isinstance(process_info, list) else process_info
 
         return process_info
 
+    def batch(self, shell=None):
+        """
+        :param shell: (str, optional)
+         Syntax of the command lines: 'sh', 'bash', 'cmd' or 'powershell'.
+         Defaults to 'cmd' for Windows guests and 'sh' otherwise.
+
+        :return: CommandBatch, an empty batch of commands to run in this guest with a single program start.
+        """
+        return CommandBatch(self, shell)
+
+    def execute_many(self, commands, cwd="", env_vars=None, wait_for_guest_ready=True, credentials=None,
+                     interactive=True):
+        """
+        Starts several programs in the guest operating system and waits for all of them,
+        polling them together, see 'wait_all'.
+
+        :param commands: (list)
+         Programs to start, each either the program path (str) or a (program, arguments) tuple.
+
+        :param cwd: (str)
+         The absolute path of the working directory for the programs to be run.
+
+        :param env_vars: (str)
+         An array of environment variables, specified in the guest OS notation, see 'execute'.
+
+        :param wait_for_guest_ready: (bool)
+         Wait until Guest operations are ready before starting the first program.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param interactive: (bool)
+         This is set to true if the client wants an interactive session in the guest.
+
+        :return: iterator of (command, vim.vm.guest.ProcessManager.ProcessInfo), in the order the programs end.
+         'command' is the entry of 'commands' as given. All programs are started before this returns.
+        """
+        started = dict()
+        for index, command in enumerate(commands):
+            program, arguments = command if isinstance(command, (tuple, list)) else (command, "")
+            process_info = self.execute(program, arguments, cwd=cwd, env_vars=env_vars,
+                                        wait_for_guest_ready=wait_for_guest_ready and index == 0,
+                                        wait_for_program_to_exit=False, credentials=credentials,
+                                        interactive=interactive)
+            started[process_info.pid] = command
+
+        return ((started[pid], process_info)
+                for pid, process_info in self.wait_all(list(started), credentials=credentials, interactive=interactive))
+
+    def wait_all(self, pids, credentials=None, interactive=True):
+        """
+        Waits for processes started in the guest operating system to end.
+        All outstanding processes are polled with a single ListProcessesInGuest call,
+        first every half a second, then less often while none of them ends (up to every 5 seconds).
+
+        :param pids: (list)
+         IDs of the processes to wait for.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param interactive: (bool)
+         This is set to true if the client wants an interactive session in the guest.
+
+        :return: iterator of (pid, vim.vm.guest.ProcessManager.ProcessInfo), as each process ends.
+         The ProcessInfo is None for a process the guest doesn't list,
+         ex: it ended more than 5 minutes ago or was not started by StartProgramInGuest.
+
+        :raises: pyVirtualize.utils.exceptions.TimeOutException
+         when processes are still running after the timeout.
+        """
+        self._precheck_for_operations()
+        creds = self._get_auth(type_=credentials, interactive=interactive)
+        for pid, process_info in self._iter_processes_terminated_in_guest(pids, creds):
+            yield pid, process_info
+
+    def run(self, program, arguments="", capture_output=True, cwd="", env_vars=None, wait_for_guest_ready=True,
+            credentials=None, interactive=True, encoding='utf-8'):
+        """
+        Runs a program in the guest operating system, waits for it to exit and returns its exit code
+        together with its standard output and error.
+        The outputs are redirected into files of a guest temporary directory, fetched back in a single
+        transfer once the program exited, and the directory is removed afterwards.
+
+        :param program: (str)
+         The absolute path to the program to start.
+
+        :param arguments: (str)
+         The arguments to the program, as for 'execute'.
+
+        :param capture_output: (bool)
+         Capture stdout and stderr. When 'False', this is 'execute' returning a ProcessResult.
+
+        :param cwd: (str)
+         The absolute path of the working directory for the program to be run.
+
+        :param env_vars: (str)
+         An array of environment variables, specified in the guest OS notation, see 'execute'.
+
+        :param wait_for_guest_ready: (bool)
+         Wait until Guest operations are ready before starting the program.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param interactive: (bool)
+         This is set to true if the client wants an interactive session in the guest.
+
+        :param encoding: (str)
+         Encoding used to decode the outputs, None keeps them as bytes.
+
+        :return: ProcessResult, with the exit code, stdout, stderr and timings.
+        """
+        timings = dict()
+        start = time.time()
+
+        if not capture_output:
+            process_info = self.execute(program, arguments, cwd=cwd, env_vars=env_vars,
+                                        wait_for_guest_ready=wait_for_guest_ready, credentials=credentials,
+                                        interactive=interactive)
+            timings['execute'] = time.time() - start
+            return ProcessResult(getattr(process_info, 'exitCode', None), timings=timings, process_info=process_info)
+
+        files = FileOperations(self._vim, timeout=self._timeout_seconds)
+        windows = self._is_windows_guest()
+        token = '--pyv-{0}--'.format(uuid.uuid4().hex)
+
+        workdir = files._create_guest_temp_dir(credentials=credentials)
+        try:
+            script = _shell.capture_script(windows, program, arguments, workdir, token)
+            if windows:
+                script_path = _shell.join(windows, workdir, 'run.cmd')
+                files.put_bytes(script_path, script, credentials=credentials)
+                wrapper, wrapper_arguments = _shell.script_command(windows, script_path)
+            else:
+                wrapper, wrapper_arguments = _shell.shell_command(windows, script)
+            timings['prepare'] = time.time() - start
+
+            start = time.time()
+            process_info = self.execute(wrapper, wrapper_arguments, cwd=cwd, env_vars=env_vars,
+                                        wait_for_guest_ready=wait_for_guest_ready, credentials=credentials,
+                                        interactive=interactive)
+            timings['execute'] = time.time() - start
+
+            start = time.time()
+            output = files.get_bytes(_shell.join(windows, workdir, 'result'), credentials=credentials)
+            timings['fetch'] = time.time() - start
+        finally:
+            start = time.time()
+            files._delete_remote_dir(workdir, credentials=credentials)
+            timings['cleanup'] = time.time() - start
+
+        stdout, _, stderr = output.partition(token.encode('ascii'))
+        if encoding:
+            stdout, stderr = stdout.decode(encoding, 'replace'), stderr.decode(encoding, 'replace')
+
+        return ProcessResult(getattr(process_info, 'exitCode', None), stdout, stderr, timings, process_info)
+
+    def stream(self, program, arguments="", cwd="", env_vars=None, wait_for_guest_ready=True, credentials=None,
+               interactive=True, encoding='utf-8', poll_interval=STREAM_POLL_INTERVAL):
+        """
+        Starts a program in the guest operating system and follows its output while it runs.
+        The program is started before this returns, iterating only reads its output:
+        the output is redirected into a guest file, every 'poll_interval' seconds its size is checked and,
+        when it grew, only the newly appended bytes are extracted by a guest helper and fetched.
+
+        :param program: (str)
+         The absolute path to the program to start.
+
+        :param arguments: (str)
+         The arguments to the program, as for 'execute'.
+
+        :param cwd: (str)
+         The absolute path of the working directory for the program to be run.
+
+        :param env_vars: (str)
+         An array of environment variables, specified in the guest OS notation, see 'execute'.
+
+        :param wait_for_guest_ready: (bool)
+         Wait until Guest operations are ready before starting the program.
+         Reading its output never waits, the helpers doing it run in a non-interactive session.
+
+        :param credentials: (str)
+         Specify the credentials type string.
+         Which was added using 'set_credentials' function.
+         If string is left empty, it will find the 'default' credentials type and will use them.
+         And if it doesn't find any, then it will raise an Exception.
+
+        :param interactive: (bool)
+         This is set to true if the client wants an interactive session in the guest.
+
+        :param encoding: (str)
+         Encoding used to decode the lines, None yields them as bytes.
+
+        :param poll_interval: (int)
+         Seconds between two reads of the output.
+
+        :return: ProcessStream, iterating over the output lines (stdout and stderr merged, line endings stripped).
+         Its 'exit_code' and 'process_info' are set once the program exited and the iteration ended.
+
+        :raises: pyVirtualize.utils.exceptions.TimeOutException
+         when the program runs for longer than the timeout.
+        """
+        files = FileOperations(self._vim, timeout=self._timeout_seconds)
+        windows = self._is_windows_guest()
+
+        workdir = files._create_guest_temp_dir(credentials=credentials)
+        try:
+            output = _shell.join(windows, workdir, 'output')
+            script = _shell.redirect_script(windows, program, arguments, output)
+            if windows:
+                script_path = _shell.join(windows, workdir, 'run.cmd')
+                files.put_bytes(script_path, script, credentials=credentials)
+                wrapper, wrapper_arguments = _shell.script_command(windows, script_path)
+            else:
+                wrapper, wrapper_arguments = _shell.shell_command(windows, script)
+
+            process_info = self.execute(wrapper, wrapper_arguments, cwd=cwd, env_vars=env_vars,
+                                        wait_for_guest_ready=wait_for_guest_ready, wait_for_program_to_exit=False,
+                                        credentials=credentials, interactive=interactive)
+        except Exception:
+            files._delete_remote_dir(workdir, credentials=credentials)
+            raise
+
+        def cleanup():
+            try:
+                files._delete_remote_dir(workdir, credentials=credentials)
+            except vim.fault.FileFault:
+                # The output is still held open by the program, which was left running.
+                pass
+
+        stream = ProcessStream()
+        stream._cleanup = cleanup
+        stream._lines = self._stream_lines(stream, files, windows, workdir, process_info.pid, time.time(),
+                                           credentials, interactive, encoding, poll_interval)
+        return stream
+
+    def _stream_lines(self, stream, files, windows, workdir, pid, start_time, credentials, interactive, encoding,
+                      poll_interval):
+        # From here on the 'finally' below removes the working directory.
+        stream._cleanup = None
+        finished = False
+        try:
+            offset, pending = 0, b''
+            while True:
+                # Checked before reading, so that the last read gets everything the program wrote.
+                process_info = self.list_processes(pids=[pid], credentials=credentials, interactive=interactive)
+                process_info = process_info[0] if process_info else None
+                finished = process_info is None or \
+                    (isinstance(process_info.exitCode, int) and process_info.exitCode >= 0)
+
+                data = self._read_output_from(files, windows, workdir, offset, credentials)
+                offset += len(data)
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield self._decode_line(line, encoding)
+
+                if finished:
+                    break
+                elif time.time() - start_time >= self._timeout_seconds:
+                    raise TimeOutException
+                time.sleep(poll_interval)
+
+            if pending:
+                yield self._decode_line(pending, encoding)
+
+            stream.process_info = process_info
+            stream.exit_code = getattr(process_info, 'exitCode', None)
+        finally:
+            try:
+                files._delete_remote_dir(workdir, credentials=credentials)
+            except vim.fault.FileFault:
+                # The output is still held open by a program which was left running.
+                if finished:
+                    raise
+
+    @staticmethod
+    def _read_output_from(files, windows, workdir, offset, credentials):
+        """
+        Bytes appended to 'workdir'/output past 'offset', empty when it didn't grow.
+        """
+        info = next(iter(files.iter_dir_in_vm(workdir, credentials=credentials, match_pattern='^output$')), None)
+        if info is None or info.size <= offset:
+            return b''
+
+        chunk = _shell.join(windows, workdir, 'chunk')
+        files._run_guest_script(_shell.tail_script(windows, _shell.join(windows, workdir, 'output'), offset, chunk),
+                                credentials=credentials)
+        return files.get_bytes(chunk, credentials=credentials)
+
+    @staticmethod
+    def _decode_line(line, encoding):
+        line = line.rstrip(b'\r')
+        return line.decode(encoding, 'replace') if encoding else line
+
     def list_processes(self, pids=[], credentials=None, interactive=True):
         """
         List the processes running in the guest operating system, 
@@ -251,8 +749,7 @@ class ProcessOperations(BaseOperation):
         """
         self._precheck_for_operations()
 
-        content = self.service_instance.RetrieveContent()
-        pm = content.guestOperationsManager.processManager
+        pm = self._guest_manager('processManager')
         creds = self._get_auth(type_=credentials, interactive=interactive)
 
         if pids:
@@ -320,8 +817,7 @@ class ProcessOperations(BaseOperation):
         """
         self._precheck_for_operations()
 
-        content = self.service_instance.RetrieveContent()
-        pm = content.guestOperationsManager.processManager
+        pm = self._guest_manager('processManager')
         creds = self._get_auth(type_=credentials, interactive=interactive)
 
         if names:
@@ -330,3 +826,95 @@ class ProcessOperations(BaseOperation):
             res = pm.ReadEnvironmentVariableInGuest(self.vmomi_object, creds)
 
         return res
+
+
+def _process_operations(vm, timeout=None):
+    ops = vm if isinstance(vm, ProcessOperations) else vm.operations.process
+    return ops if timeout is None else ProcessOperations(ops._vim, timeout=timeout)
+
+
+def _hosts_of(operations):
+    """
+    :return: (dict) VM moId -> moId of the ESXi host running it, fetched with one
+     PropertyCollector call per vCenter.
+    """
+    by_server = defaultdict(list)
+    for ops in operations:
+        by_server[id(ops.service_instance)].append(ops)
+
+    hosts = dict()
+    for group in by_server.values():
+        # A virtual machine which is gone is left out, the run itself reports it.
+        contents = retrieve_contents(group[0].service_instance.content.propertyCollector,
+                                     [ops.vmomi_object for ops in group], vim.VirtualMachine, ['runtime.host'])
+        for obj in contents:
+            for prop in obj.propSet:
+                hosts[obj.obj._moId] = prop.val._moId if prop.val is not None else None
+    return hosts
+
+
+def _interleave(groups):
+    """
+    Round-robin over the lists of 'groups', so that consecutive items belong to different groups.
+    """
+    groups = [list(group) for group in groups]
+    ordered = []
+    while any(groups):
+        for group in groups:
+            if group:
+                ordered.append(group.pop(0))
+    return ordered
+
+
+def run_everywhere(vms, program, arguments="", capture_output=True, credentials=None, timeout=None,
+                   per_host=HOST_CONCURRENCY, max_workers=FLEET_WORKERS, **kwargs):
+    """
+    Runs the same program in the guests of many virtual machines, see 'ProcessOperations.run'.
+    Up to 'max_workers' virtual machines are handled at once, of which at most 'per_host' on the same ESXi host;
+    the work is interleaved across hosts so that a crowded host doesn't hold back the others.
+    A failure on one virtual machine is reported for it and doesn't stop the others.
+
+    Usage:
+        for vm, result in run_everywhere(vsphere.VirtualMachines.values(), '/bin/uname', '-r'):
+            print(vm, result if isinstance(result, Exception) else result.stdout)
+
+    :param vms: (list) VirtualMachine (or ProcessOperations) objects to run the program on.
+    :param program: (str) The absolute path to the program to start.
+    :param arguments: (str) The arguments to the program.
+    :param capture_output: (bool) Capture the stdout and stderr of the program.
+    :param credentials: (str) Credentials type used on every virtual machine, see 'set_credentials'.
+    :param timeout: (int) Seconds allowed per virtual machine, defaults to the timeout of its operations.
+    :param per_host: (int) Maximum number of virtual machines running the program at once on one ESXi host.
+    :param max_workers: (int) Maximum number of virtual machines running the program at once.
+    :param kwargs: Further arguments of 'ProcessOperations.run', ex: cwd, env_vars, interactive.
+
+    :return: iterator of (vm, ProcessResult), in the order the virtual machines finish.
+     For a virtual machine on which it failed, the exception raised is given instead of the ProcessResult.
+    """
+    vms = list(vms)
+    if not vms:
+        return
+
+    operations = dict((id(vm), _process_operations(vm, timeout)) for vm in vms)
+    hosts = _hosts_of(list(operations.values()))
+
+    by_host = defaultdict(list)
+    for vm in vms:
+        by_host[hosts.get(operations[id(vm)].vmomi_object._moId)].append(vm)
+    semaphores = dict((host, threading.BoundedSemaphore(max(1, per_host))) for host in by_host)
+    host_of = dict((id(vm), host) for host, group in by_host.items() for vm in group)
+
+    def run(vm):
+        with semaphores[host_of[id(vm)]]:
+            try:
+                return vm, operations[id(vm)].run(program, arguments, capture_output=capture_output,
+                                                  credentials=credentials, **kwargs)
+            except Exception as err:
+                return vm, err
+
+    pool = ThreadPool(max(1, min(max_workers, len(vms))))
+    try:
+        for vm, result in pool.imap_unordered(run, _interleave(by_host.values())):
+            yield vm, result
+    finally:
+        pool.terminate()
@@ -1,7 +1,439 @@
 __author__ = 'rramchandani'
 
+import math
+import time
+import datetime
+import threading
+from collections import defaultdict, namedtuple
+from multiprocessing.pool import ThreadPool
 
-from ._base import BaseOperation
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pyVmomi import vim, vmodl
+from pyVirtualize.utils.exceptions import TimeOutException
+
+from ._base import BaseOperation, wait_for_tasks, retrieve_contents, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, \
+    POLL_BACKOFF
+from ._snapshot_tree import SnapshotTree
+
+TASK_WORKERS = 16  # maximum number of tasks submitted at once by the multi virtual machines functions.
+RESET_WORKERS = 32  # maximum number of virtual machines 'reset_to_snapshot' reverts or powers on at once.
+RESET_PER_HOST = 4  # maximum number of those on the same ESXi host.
+RESET_PER_DATASTORE = 4  # maximum number of reverts at once touching the same datastore.
+RESET_STAGES = ('revert', 'power_on', 'guest_ready')
+REPORT_PAGE_SIZE = 500  # virtual machines per page of the snapshot report retrieval.
+
+# One snapshot of 'snapshot_report':
+#   vm          - name of the virtual machine,
+#   name, path  - name of the snapshot and its path in the snapshot tree, ex: 'base/patched',
+#   moid        - managed object ID of the snapshot,
+#   create_time - creation time (datetime), age - time elapsed since then (timedelta),
+#   size        - bytes of its delta disks, state and memory files,
+#   files       - names of those files,
+#   is_current  - True for the snapshot the virtual machine runs from.
+SnapshotUsage = namedtuple('SnapshotUsage', 'vm name path moid create_time age size files is_current')
+
+
+def _snapshot_operations(vm):
+    return vm if isinstance(vm, SnapshotOperations) else vm.operations.snapshot
+
+
+def _run_tasks(vms, start, max_workers=TASK_WORKERS):
+    """
+    Starts a task on each of 'vms' with 'start(SnapshotOperations)', which returns the task or None when
+    there is nothing to do, then waits for all of them together.
+
+    :return: (dict) For each of 'vms', None when its task succeeded (or wasn't needed) or else the error.
+    """
+    vms = list(vms)
+    if not vms:
+        return dict()
+
+    def submit(vm):
+        ops = _snapshot_operations(vm)
+        try:
+            return vm, ops, start(ops)
+        except Exception as err:
+            return vm, ops, err
+
+    pool = ThreadPool(max(1, min(max_workers, len(vms))))
+    try:
+        submitted = pool.map(submit, vms)
+    finally:
+        pool.terminate()
+
+    results, by_server = dict(), defaultdict(list)
+    for vm, ops, task in submitted:
+        if task is None or isinstance(task, Exception):
+            results[vm] = task
+        else:
+            by_server[id(ops.service_instance)].append((vm, ops, task))
+
+    for group in by_server.values():
+        ops = group[0][1]
+        errors = wait_for_tasks(ops.service_instance, [task for vm, ops, task in group],
+                                timeout=ops._timeout_seconds)
+        for vm, ops, task in group:
+            results[vm] = errors.get(task._moId)
+            # Snapshots and disks changed on the server side, fetch the tree again on next use.
+            ops._vim.snapshot_tree = None
+    return results
+
+
+def remove_all_snapshots(vms, consolidate=True, max_workers=TASK_WORKERS):
+    """
+    Removes all the snapshots of many virtual machines, with one RemoveAllSnapshots_Task per virtual machine,
+    all running in parallel.
+
+    :param vms: (list) VirtualMachine (or SnapshotOperations) objects.
+    :param consolidate: (bool) Consolidate the disks once the snapshots are removed.
+    :param max_workers: (int) Maximum number of tasks submitted at once.
+
+    :return: (dict) For each of 'vms', None when it succeeded or else the error.
+    """
+    return _run_tasks(vms, lambda ops: ops.vmomi_object.RemoveAllSnapshots_Task(consolidate=consolidate),
+                      max_workers)
+
+
+def consolidate_disks(vms, only_needed=True, max_workers=TASK_WORKERS):
+    """
+    Consolidates the disks of many virtual machines, with ConsolidateVMDisks_Task running in parallel.
+
+    :param vms: (list) VirtualMachine (or SnapshotOperations) objects.
+    :param only_needed: (bool) Skip the virtual machines which don't report 'runtime.consolidationNeeded',
+     read for all of them with one PropertyCollector call per vCenter.
+    :param max_workers: (int) Maximum number of tasks submitted at once.
+
+    :return: (dict) For each of 'vms', None when it succeeded or was skipped, or else the error.
+    """
+    vms = list(vms)
+    needed = _consolidation_needed([_snapshot_operations(vm) for vm in vms]) if only_needed else dict()
+
+    def start(ops):
+        # A virtual machine gone meanwhile isn't skipped, its task reports the error.
+        if only_needed and not needed.get(ops.vmomi_object._moId, True):
+            return None
+        return ops.vmomi_object.ConsolidateVMDisks_Task()
+
+    return _run_tasks(vms, start, max_workers)
+
+
+def _retrieve(operations, paths):
+    """
+    Reads 'paths' of the virtual machines of 'operations' with one PropertyCollector call per vCenter.
+
+    :return: (dict) VM moId -> {path: value}; virtual machines which are gone are left out.
+    """
+    by_server = defaultdict(list)
+    for ops in operations:
+        by_server[id(ops.service_instance)].append(ops)
+
+    values = dict()
+    for group in by_server.values():
+        contents = retrieve_contents(group[0].service_instance.content.propertyCollector,
+                                     [ops.vmomi_object for ops in group], vim.VirtualMachine, paths)
+        for obj in contents:
+            values[obj.obj._moId] = dict((prop.name, prop.val) for prop in obj.propSet)
+    return values
+
+
+def _consolidation_needed(operations):
+    """
+    :return: (dict) VM moId -> its 'runtime.consolidationNeeded'; virtual machines which are gone are left out.
+    """
+    return dict((moid, bool(values.get('runtime.consolidationNeeded')))
+                for moid, values in _retrieve(operations, ['runtime.consolidationNeeded']).items())
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, int(math.ceil(percent / 100.0 * len(values))) - 1)]
+
+
+class ResetReport(object):
+    """
+    Outcome of 'reset_to_snapshot'.
+
+    :ivar results: (dict) For each virtual machine, None when it was reset or else the error raised for it.
+    :ivar timings: (dict) For each virtual machine, seconds spent per stage: 'revert', 'power_on' and 'guest_ready'.
+     Waiting for a host or datastore slot is not accounted to the stages.
+    :ivar seconds: (float) Wall clock time of the whole reset.
+    """
+
+    def __init__(self):
+        self.results = dict()
+        self.timings = dict()
+        self.seconds = 0.0
+
+    @property
+    def failed(self):
+        return dict((vm, err) for vm, err in self.results.items() if err is not None)
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """
+        :return: (dict) Per stage, its latency percentiles (keys 'p50', 'p90', ...) and 'max', in seconds,
+         over the virtual machines which went through it.
+        """
+        report = dict()
+        for stage in RESET_STAGES:
+            values = [timings[stage] for timings in self.timings.values() if stage in timings]
+            if not values:
+                continue
+            report[stage] = dict(('p{0}'.format(p), _percentile(values, p)) for p in percents)
+            report[stage]['max'] = max(values)
+        return report
+
+    def __repr__(self):
+        return "<ResetReport: {0} reset, {1} failed in {2:.0f}s>".format(
+            len(self.results) - len(self.failed), len(self.failed), self.seconds)
+
+
+def reset_to_snapshot(vms, snapshot, power_on=True, wait_for_guest_ready=True, interactive=True,
+                      per_host=RESET_PER_HOST, per_datastore=RESET_PER_DATASTORE, max_workers=RESET_WORKERS):
+    """
+    Resets a group of virtual machines: reverts each to a snapshot, powers it on and waits for its guest
+    operations to be ready, as a pipeline: while some virtual machines are reverting, others are powering on
+    and others booting.
+    Reverts are limited to 'per_host' at once per ESXi host and 'per_datastore' per datastore,
+    power ons to 'per_host' per ESXi host. The guest readiness of all the booting virtual machines is
+    polled together, with a single PropertyCollector call.
+
+    :param vms: (list) VirtualMachine (or SnapshotOperations) objects.
+    :param snapshot: (str) Name (or path) of the snapshot, on each virtual machine.
+    :param power_on: (bool) Powers on the virtual machines left powered off by the revert.
+    :param wait_for_guest_ready: (bool) Waits for the guest operations to be ready, once powered on.
+    :param interactive: (bool) Waits for the interactive guest operations, i.e. a user logged in.
+    :param per_host: (int) Maximum number of reverts or power ons at once on one ESXi host.
+    :param per_datastore: (int) Maximum number of reverts at once on one datastore.
+    :param max_workers: (int) Maximum number of reverts or power ons at once.
+
+    :return: ResetReport, with the result and stage timings of every virtual machine.
+    """
+    vms = list(vms)
+    report = ResetReport()
+    if not vms:
+        return report
+
+    start_time = time.time()
+    operations = dict((id(vm), _snapshot_operations(vm)) for vm in vms)
+    placement = _retrieve(operations.values(), ['runtime.host', 'datastore'])
+    lock = threading.Lock()
+    slots = dict()
+    booting = queue.Queue()
+
+    def slot(kind, key, size):
+        with lock:
+            if (kind, key) not in slots:
+                slots[(kind, key)] = threading.BoundedSemaphore(max(1, size))
+            return slots[(kind, key)]
+
+    def reset(vm):
+        ops = operations[id(vm)]
+        placed = placement.get(ops.vmomi_object._moId, dict())
+        host = placed.get('runtime.host')
+        datastores = sorted(ds._moId for ds in placed.get('datastore') or [])
+        timings = report.timings[vm] = dict()
+        try:
+            node = ops._get_snapshot(snapshot)
+            with slot('host', host._moId if host is not None else None, per_host):
+                # Always taken in the same order, so that two reverts can't wait for each other.
+                held = [slot('datastore', ds, per_datastore) for ds in datastores]
+                for each in held:
+                    each.acquire()
+                try:
+                    stage = time.time()
+                    ops._wait_for_task_to_complete(node.snapshot.RevertToSnapshot_Task())
+                    timings['revert'] = time.time() - stage
+                finally:
+                    for each in reversed(held):
+                        each.release()
+                ops._snapshot_tree().revert(node)
+                ops._invalidate_guest_state()
+
+                if power_on and not ops._is_guest_powered_on():
+                    stage = time.time()
+                    ops._wait_for_task_to_complete(ops.vmomi_object.PowerOnVM_Task())
+                    ops._invalidate_guest_state()
+                    timings['power_on'] = time.time() - stage
+
+            if power_on and wait_for_guest_ready:
+                booting.put((vm, time.time()))
+            else:
+                report.results[vm] = None
+        except Exception as err:
+            report.results[vm] = err
+
+    ready_path = 'guest.interactiveGuestOperationsReady' if interactive else 'guest.guestOperationsReady'
+    pool = ThreadPool(max(1, min(max_workers, len(vms))))
+    try:
+        pending = pool.map_async(reset, vms)
+        waiting = dict()
+        interval = POLL_MIN_INTERVAL
+        while True:
+            # Read before draining the queue: once all resets are done, nothing is put anymore.
+            done = pending.ready()
+            while True:
+                try:
+                    vm, since = booting.get_nowait()
+                except queue.Empty:
+                    break
+                waiting[id(vm)] = (vm, since)
+
+            if waiting:
+                states = _retrieve([operations[key] for key in waiting], [ready_path])
+                now, progressed = time.time(), False
+                for key, (vm, since) in list(waiting.items()):
+                    ops = operations[key]
+                    if states.get(ops.vmomi_object._moId, dict()).get(ready_path):
+                        report.timings[vm]['guest_ready'] = now - since
+                        report.results[vm] = None
+                    elif now - since >= ops._timeout_seconds:
+                        report.results[vm] = TimeOutException()
+                    else:
+                        continue
+                    progressed = True
+                    del waiting[key]
+                interval = POLL_MIN_INTERVAL if progressed else min(interval * POLL_BACKOFF, POLL_MAX_INTERVAL)
+
+            if done and not waiting:
+                break
+            time.sleep(interval)
+    finally:
+        pool.terminate()
+
+    report.seconds = time.time() - start_time
+    return report
+
+
+def _retrieve_pages(pc, spec, page_size):
+    """
+    Generator over the objects of a PropertyCollector retrieval, fetched 'page_size' objects at a time.
+    """
+    result = pc.RetrievePropertiesEx([spec], vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size))
+    token = None
+    try:
+        while result is not None:
+            token = result.token
+            for obj in result.objects:
+                yield obj
+            if not token:
+                break
+            result = pc.ContinueRetrievePropertiesEx(token)
+            token = None
+    finally:
+        if token:
+            # Stopped half-way through, let the server drop the remaining pages.
+            pc.CancelRetrievePropertiesEx(token)
+
+
+def _chain_keys(disks):
+    return set(key for disk in disks or [] for unit in disk.chain or [] for key in unit.fileKey or [])
+
+
+def _snapshot_usages(vm_name, info, layout, now):
+    """
+    Generates the SnapshotUsage of every snapshot of a virtual machine from its 'snapshot' and 'layoutEx'.
+    The delta files of a snapshot are the ones in the disk chains of its successors (its child snapshots,
+    or the running disks for the current snapshot) and not in its own chain.
+    """
+    tree = SnapshotTree.from_info(info)
+    files = dict((f.key, f) for f in layout.file or []) if layout else dict()
+    layouts = dict((s.key._moId, s) for s in layout.snapshot or []) if layout else dict()
+
+    def chain(node):
+        return _chain_keys(layouts[node.moid].disk) if node.moid in layouts else set()
+
+    for node in tree:
+        successors = set()
+        for child in node.children:
+            successors |= chain(child)
+        if node.is_current and layout:
+            successors |= _chain_keys(layout.disk)
+        keys = successors - chain(node)
+        if node.moid in layouts:
+            own = layouts[node.moid]
+            keys |= set(key for key in (own.dataKey, own.memoryKey) if key is not None and key >= 0)
+
+        owned = [files[key] for key in keys if key in files]
+        create_time = node.create_time
+        age = (now.replace(tzinfo=create_time.tzinfo) if create_time.tzinfo else now) - create_time \
+            if create_time is not None else None
+        yield SnapshotUsage(vm_name, node.name, node.path, node.moid, create_time, age,
+                            sum(f.size or 0 for f in owned), sorted(f.name for f in owned), node.is_current)
+
+
+def snapshot_report(service_instance, vms=None, older_than=None, larger_than=None, sort_by=None, reverse=True,
+                    page_size=REPORT_PAGE_SIZE):
+    """
+    Reports the disk usage and age of every snapshot, for all the virtual machines of a vCenter or ESXi host.
+    The 'name', 'snapshot' and 'layoutEx' of all the virtual machines are fetched with a single
+    PropertyCollector retrieval (paged by 'page_size'), and results are streamed as pages arrive.
+
+    Usage:
+        for usage in snapshot_report(si, older_than=7, larger_than=50 * 1024 ** 3, sort_by='size'):
+            print(usage.vm, usage.path, usage.size, usage.age)
+
+    :param service_instance: The ServiceInstance to report on.
+    :param vms: (list, optional) VirtualMachine (or vim.VirtualMachine) objects, only report on these.
+    :param older_than: (int or timedelta) Only snapshots older than this; an int counts days.
+    :param larger_than: (int) Only snapshots using more bytes than this.
+    :param sort_by: (str) Sort on this field of SnapshotUsage, ex: 'size', 'age'.
+     The whole report is then collected before the first result is given.
+    :param reverse: (bool) Sort descending.
+    :param page_size: (int) Virtual machines fetched per round trip.
+
+    :return: iterator of SnapshotUsage.
+    """
+    if older_than is not None and not isinstance(older_than, datetime.timedelta):
+        older_than = datetime.timedelta(days=older_than)
+
+    usages = _snapshot_report(service_instance, vms, page_size)
+    usages = (usage for usage in usages
+              if (older_than is None or (usage.age is not None and usage.age > older_than)) and
+              (larger_than is None or usage.size > larger_than))
+    if sort_by is not None:
+        if sort_by not in SnapshotUsage._fields:
+            raise ValueError("Can't sort on '{0}', use one of {1}.".format(sort_by, SnapshotUsage._fields))
+        usages = iter(sorted(usages, key=lambda usage: getattr(usage, sort_by), reverse=reverse))
+    return usages
+
+
+def _vmomi_vm(vm):
+    if isinstance(vm, vim.VirtualMachine):
+        return vm
+    return vm.vmomi_object if hasattr(vm, 'vmomi_object') else vm.vim.vmomi_object
+
+
+def _snapshot_report(service_instance, vms, page_size):
+    content = service_instance.content
+    prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                           pathSet=['name', 'snapshot', 'layoutEx'])
+    view = None
+    if vms is None:
+        view = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(
+            obj=view, skip=True,
+            selectSet=[vmodl.query.PropertyCollector.TraversalSpec(name='view', path='view', skip=False,
+                                                                   type=vim.view.ContainerView)]
+        )]
+    else:
+        object_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=_vmomi_vm(vm), skip=False) for vm in vms]
+
+    spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=[prop_spec])
+    now = datetime.datetime.utcnow()
+    try:
+        for obj in _retrieve_pages(content.propertyCollector, spec, page_size):
+            props = dict((prop.name, prop.val) for prop in obj.propSet)
+            if not props.get('snapshot'):
+                continue
+            for usage in _snapshot_usages(props.get('name'), props['snapshot'], props.get('layoutEx'), now):
+                yield usage
+    finally:
+        if view is not None:
+            view.Destroy()
 
 
 class SnapshotOperations(BaseOperation):
@@ -9,6 +441,19 @@ class SnapshotOperations(BaseOperation):
     SnapshotOperations provides APIs to manipulate the snapshot operations on the Virtual Machine.
     """
     
+    def tree(self, refresh=False):
+        """
+        Snapshot tree of this virtual machine: every snapshot with its parent, children, path, moref,
+        creation time and whether it is the current one, see 'SnapshotTree'.
+        It is fetched once and then kept up to date by the operations of this class.
+
+        :param refresh: (bool)
+         Fetch it again, ex: after snapshots were taken or removed from outside of pyVirtualize.
+
+        :return: SnapshotTree
+        """
+        return self._snapshot_tree(refresh=refresh)
+
     def create(self, name, desc="", memory=True, quiesce=False):
         """
         Creates a new snapshot of this virtual machine. 
@@ -37,25 +482,28 @@ class SnapshotOperations(BaseOperation):
          VMware Tools is used to quiesce the file system in the virtual machine. 
          This assures that a disk snapshot represents a consistent state of the guest file systems. 
          If the virtual machine is powered off or VMware Tools are not available, the quiesce flag is ignored.
+         
+        :return: SnapshotNode of the new snapshot.
         """
+        tree = self._snapshot_tree()
         task_ = self.vmomi_object.CreateSnapshot_Task(
             name=name, description=desc, memory=memory, quiesce=quiesce
         )
         self._wait_for_task_to_complete(task=task_)
+        return tree.add(task_.info.result, name, desc, task_.info.completeTime)
 
     def revert(self, name):
         """
         Change the execution state of the virtual machine to the state of this snapshot.
         
         :param name: (str)
-         Name of the snapshot.
+         Name of the snapshot, or its path (ex: 'base/patched') when the name is not unique.
         """
-        snapshots = self._get_snapshot_list()
-        if name not in snapshots:
-            raise ValueError("Snapshot '{0}' doesn't exists.".format(name))
-        snapshot = snapshots.get(name)
-        task_ = snapshot.RevertToSnapshot_Task()
+        node = self._get_snapshot(name)
+        task_ = node.snapshot.RevertToSnapshot_Task()
         self._wait_for_task_to_complete(task=task_)
+        self._snapshot_tree().revert(node)
+        self._invalidate_guest_state()
 
     def revert_to_current(self):
         """
@@ -64,33 +512,65 @@ class SnapshotOperations(BaseOperation):
         snapshot = self.vmomi_object.snapshot.currentSnapshot
         task_ = snapshot.RevertToSnapshot_Task()
         self._wait_for_task_to_complete(task=task_)
+        self._invalidate_guest_state()
 
-    def remove(self, name):
+    def remove(self, name, remove_children=False, consolidate=True):
         """
         Removes the specified snapshot from the machine.
 
         :param name: (str)
-         Name of the snapshot.
+         Name of the snapshot, or its path (ex: 'base/patched') when the name is not unique.
+
+        :param remove_children: (bool)
+         Removes the whole subtree of the snapshot in the same task.
+
+        :param consolidate: (bool)
+         Consolidates the disks once the snapshot is removed.
         """
-        snapshots = self._get_snapshot_list()
-        if not snapshots.has_key(name):
-            raise ValueError("Snapshot '{0}' doesn't exists.".format(name))
-        snapshot = snapshots.get(name)
-        task_ = snapshot.RemoveSnapshot_Task(False)
+        node = self._get_snapshot(name)
+        task_ = node.snapshot.RemoveSnapshot_Task(removeChildren=remove_children, consolidate=consolidate)
         self._wait_for_task_to_complete(task=task_)
+        self._snapshot_tree().remove(node, remove_children=remove_children)
 
-    def remove_current(self):
+    def remove_current(self, remove_children=False, consolidate=True):
         """
         Removes the current snapshot from the machine.
+
+        :param remove_children: (bool)
+         Removes the whole subtree of the snapshot in the same task.
+
+        :param consolidate: (bool)
+         Consolidates the disks once the snapshot is removed.
         """
         snapshot = self.vmomi_object.snapshot.currentSnapshot
-        task_ = snapshot.RemoveSnapshot_Task()
+        task_ = snapshot.RemoveSnapshot_Task(removeChildren=remove_children, consolidate=consolidate)
+        self._wait_for_task_to_complete(task=task_)
+        node = self._snapshot_tree().find(snapshot)
+        if node is not None:
+            self._snapshot_tree().remove(node, remove_children=remove_children)
+
+    def remove_all(self, consolidate=True):
+        """
+        Removes all snapshots from the machine, with a single task.
+
+        :param consolidate: (bool)
+         Consolidates the disks once the snapshots are removed.
+        """
+        task_ = self.vmomi_object.RemoveAllSnapshots_Task(consolidate=consolidate)
         self._wait_for_task_to_complete(task=task_)
+        self._snapshot_tree().clear()
 
-    def remove_all(self):
+    def consolidate_disks(self, only_needed=True):
         """
-        Removes all snapshots from the machine.
+        Consolidates the disks of the machine, ex: after a snapshot removal left redundant delta disks.
+
+        :param only_needed: (bool)
+         Only consolidates when the machine reports 'runtime.consolidationNeeded'.
+
+        :return: (bool) True when a consolidation ran.
         """
-        for snapshot in self._get_snapshot_list():
-            task_ = snapshot.RemoveSnapshot_Task()
-            self._wait_for_task_to_complete(task=task_)
+        if only_needed and not _consolidation_needed([self]).get(self.vmomi_object._moId, True):
+            return False
+        task_ = self.vmomi_object.ConsolidateVMDisks_Task()
+        self._wait_for_task_to_complete(task=task_)
+        return True
@@ -2,18 +2,46 @@ __author__ = 'rramchandani'
 
 from pyVmomi import vim, vmodl
 
-from ._base import BaseOperation
+from ._base import BaseOperation, wait_for_tasks
+from ._snapshot_tree import SnapshotTree
+
+LINKED_CLONE_SNAPSHOT = 'pyv-linked-clone-base'  # snapshot linked clones are based on, when none is named.
 
 
 class VMUtils(BaseOperation):
 
+    def _clone_snapshot(self, template, snapshot, linked, create_base_snapshot):
+        """
+        Snapshot of 'template' a clone is based on: the one named 'snapshot', or for linked clones
+        the current one, created when missing and 'create_base_snapshot'. None for full clones of the current state.
+        """
+        if snapshot is None and not linked:
+            return None
+
+        tree = SnapshotTree.from_vm(template)
+        if snapshot is not None:
+            node = tree.find(snapshot)
+        else:
+            node = tree.current or tree.find(LINKED_CLONE_SNAPSHOT)
+        if node is not None:
+            return node.snapshot
+
+        if not (linked and create_base_snapshot):
+            raise ValueError("Snapshot '{0}' doesn't exists.".format(snapshot))
+        task = template.CreateSnapshot_Task(
+            name=snapshot or LINKED_CLONE_SNAPSHOT, description="Base of the linked clones.",
+            memory=False, quiesce=False
+        )
+        self._wait_for_task_to_complete(task)
+        return task.info.result
+
     def clone(self, template_name, vm_name, datacenter_name,
               resource_pool_cluster=None, host=None,
               is_template=False, snapshot=None, memory=False,
               datastore_name=None, vm_folder=None, power_on=False,
               changeSID=False, nw={}, identification={},
               timezone=40, autologon=False, autologonCount=1, autologonAdminPwd="",
-              fullName=None, orgName=None):
+              fullName=None, orgName=None, linked=False, create_base_snapshot=True):
         """
         Creates a clone of this virtual machine. 
         If the virtual machine is used as a template, this method corresponds to the deploy command.
@@ -141,6 +169,17 @@ class VMUtils(BaseOperation):
          
         :param orgName: (str, optional)
          User's organization.
+
+        :param linked: (bool, optional)
+         Creates a linked clone: the clone's disks are delta disks on top of the source's disks at 'snapshot'
+         (diskMoveType 'createNewChildDiskBacking'), so that it takes seconds and only the delta uses space.
+         Without 'snapshot', the current snapshot of the source is used.
+         Default, 'False' i.e. full copy of the disks.
+
+        :param create_base_snapshot: (bool, optional)
+         For linked clones, takes the snapshot on the source (named 'snapshot', or 'pyv-linked-clone-base')
+         when it doesn't exist yet. The source must not be marked as a template then.
+         Default, 'True'.
         
         """
 
@@ -195,6 +234,9 @@ class VMUtils(BaseOperation):
         """
 
         relospec = vim.vm.RelocateSpec()
+        if linked:
+            relospec.diskMoveType = 'createNewChildDiskBacking'
+
         if datastore is not None:
             relospec.datastore = datastore
 
@@ -211,8 +253,8 @@ class VMUtils(BaseOperation):
         clonespec.template = is_template
         clonespec.memory = memory
 
-        from_snapshot = self._get_snapshot_list().get(snapshot, None)
-        if from_snapshot is None:
+        from_snapshot = self._clone_snapshot(template, snapshot, linked, create_base_snapshot)
+        if from_snapshot is not None:
             clonespec.snapshot = from_snapshot
 
         # The Specification data object type contains information required to customize a virtual machine
@@ -308,3 +350,135 @@ class VMUtils(BaseOperation):
         task = template.CloneVM_Task(folder=destfolder, name=vm_name, spec=clonespec)
         self._wait_for_task_to_complete(task)
         return template
+
+    def _instant_clone_location(self, parent, vm_folder=None, resource_pool_cluster=None, datastore_name=None,
+                                nics=None):
+        relospec = vim.vm.RelocateSpec()
+        if vm_folder:
+            relospec.folder = self._get_obj([vim.Folder], vm_folder)
+        if resource_pool_cluster:
+            resources = [i for i in self._get_obj([vim.ResourcePool]) if i.owner.name == resource_pool_cluster]
+            relospec.pool = resources[0] if resources else None
+        if datastore_name:
+            relospec.datastore = self._get_obj([vim.Datastore], datastore_name, not_found_return_none=True)
+
+        device_changes = []
+        for card in [d for d in parent.config.hardware.device if isinstance(d, vim.vm.device.VirtualEthernetCard)]:
+            if not nics or card.deviceInfo.label not in nics:
+                continue
+            network = self._get_obj([vim.Network], nics[card.deviceInfo.label], not_found_return_none=True)
+            if network is None:
+                raise ValueError("Network '{0}' doesn't exists.".format(nics[card.deviceInfo.label]))
+
+            if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
+                card.backing = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo(
+                    port=vim.dvs.PortConnection(portgroupKey=network.key,
+                                                switchUuid=network.config.distributedVirtualSwitch.uuid)
+                )
+            else:
+                card.backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
+                    deviceName=network.name, network=network
+                )
+            card.connectable = vim.vm.device.VirtualDevice.ConnectInfo(startConnected=True, connected=True,
+                                                                       allowGuestControl=True)
+            device_changes.append(vim.vm.device.VirtualDeviceSpec(
+                operation=vim.vm.device.VirtualDeviceSpec.Operation.edit, device=card
+            ))
+        if device_changes:
+            relospec.deviceChange = device_changes
+        return relospec
+
+    @staticmethod
+    def _instant_clone_spec(vm_name, location, config=None):
+        return vim.vm.InstantCloneSpec(
+            name=vm_name,
+            location=location,
+            config=[vim.option.OptionValue(key=key, value=value) for key, value in sorted((config or {}).items())]
+        )
+
+    def instant_clone(self, vm_name, parent_name=None, vm_folder=None, resource_pool_cluster=None,
+                      datastore_name=None, nics=None, config=None):
+        """
+        Creates an instant clone: a new virtual machine forked from the running (or frozen) state of the parent,
+        sharing its memory and disks, so that it is up without booting.
+        The clone is powered on and its MAC addresses are regenerated by vSphere.
+        The privilege VirtualMachine.Provisioning.Clone is required on the parent.
+
+        :param vm_name: (str)
+         The name of the new virtual machine.
+
+        :param parent_name: (str, optional)
+         Name of the running virtual machine to fork. Default, this virtual machine.
+
+        :param vm_folder: (str, optional)
+         Name of the folder under which the clone should be listed. Default, the parent's folder.
+
+        :param resource_pool_cluster: (str, optional)
+         Specify a Cluster name from which Resource pool will be picked. Default, the parent's resource pool.
+
+        :param datastore_name: (str, optional)
+         The datastore where the clone should be located. Default, the parent's datastore.
+
+        :param nics: (dict, optional)
+         Network to connect each network adapter of the clone to, keyed by the adapter's label.
+         ex: {'Network adapter 1': 'VM Network'}
+
+        :param config: (dict, optional)
+         Configuration keys set on the clone, typically read by the guest to customize itself once forked.
+         ex: {'guestinfo.ic.hostname': 'worker-01', 'guestinfo.ic.ipaddress': '10.0.0.11'}
+
+        :return: vim.VirtualMachine, the clone.
+        """
+        parent = self._get_obj([vim.VirtualMachine], parent_name) if parent_name else self.vmomi_object
+        location = self._instant_clone_location(parent, vm_folder, resource_pool_cluster, datastore_name, nics)
+
+        task = parent.InstantClone_Task(spec=self._instant_clone_spec(vm_name, location, config))
+        self._wait_for_task_to_complete(task)
+        return task.info.result
+
+    def instant_clone_many(self, vm_names, parent_name=None, vm_folder=None, resource_pool_cluster=None,
+                           datastore_name=None, nics=None, config=None):
+        """
+        Creates many instant clones of the same parent at once, see 'instant_clone'.
+        All the InstantClone_Task are started before any is waited for, and they are waited for together.
+
+        :param vm_names: (list)
+         The names of the new virtual machines.
+
+        :param parent_name: (str, optional)
+         Name of the running virtual machine to fork. Default, this virtual machine.
+
+        :param vm_folder: (str, optional)
+         Name of the folder under which the clones should be listed. Default, the parent's folder.
+
+        :param resource_pool_cluster: (str, optional)
+         Specify a Cluster name from which Resource pool will be picked. Default, the parent's resource pool.
+
+        :param datastore_name: (str, optional)
+         The datastore where the clones should be located. Default, the parent's datastore.
+
+        :param nics: (dict, optional)
+         Network to connect each network adapter of the clones to, keyed by the adapter's label.
+
+        :param config: (dict or callable, optional)
+         Configuration keys set on every clone, or a function returning them for a clone's name.
+         ex: lambda name: {'guestinfo.ic.hostname': name}
+
+        :return: (dict) For each of 'vm_names', the clone (vim.VirtualMachine) or else the error raised for it.
+        """
+        parent = self._get_obj([vim.VirtualMachine], parent_name) if parent_name else self.vmomi_object
+        location = self._instant_clone_location(parent, vm_folder, resource_pool_cluster, datastore_name, nics)
+
+        results, tasks = dict(), dict()
+        for vm_name in vm_names:
+            try:
+                spec = self._instant_clone_spec(vm_name, location, config(vm_name) if callable(config) else config)
+                tasks[vm_name] = parent.InstantClone_Task(spec=spec)
+            except Exception as err:
+                results[vm_name] = err
+
+        errors = wait_for_tasks(self.service_instance, list(tasks.values()), timeout=self._timeout_seconds)
+        for vm_name, task in tasks.items():
+            error = errors.get(task._moId)
+            results[vm_name] = error if error is not None else task.info.result
+        return results
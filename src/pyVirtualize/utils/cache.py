@@ -0,0 +1,217 @@
+__author__ = 'rramchandani'
+
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+
+class TTLCache(object):
+    """
+    Small thread-safe mapping whose entries expire 'ttl' seconds after they were stored.
+    A 'ttl' of 0 (or None) disables caching altogether.
+    """
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if time.time() >= expires:
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_if(self, predicate):
+        """
+        Drops every entry whose key satisfies 'predicate(key)'.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ContentCache(object):
+    """
+    Content-addressed store of downloaded files, shareable between processes on the same machine.
+    Each file is stored once under the SHA-256 of its contents, whatever number of keys point to it,
+    and the least recently used contents are evicted once the store grows beyond 'max_bytes'.
+    Every write is done through a rename, hence concurrent readers and writers never see partial files.
+    The size of the store is kept as a running total, the store is only walked on first use and when evicting.
+
+    Layout of 'root':
+        objects/<2 first hex>/<sha256>   the contents
+        keys/<sha1 of key>               the sha256 of the contents the key maps to
+
+    :param root: (str) Directory of the store, created when missing.
+    :param max_bytes: (int) Size cap of the stored contents.
+    """
+
+    def __init__(self, root, max_bytes=10 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Bytes of contents in the store, None until first walked; other processes' writes show at the next walk.
+        self._size = None
+        self._lock = threading.Lock()
+        for _dir in ('objects', 'keys', 'tmp'):
+            path = os.path.join(root, _dir)
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:
+                    # Created meanwhile by another process.
+                    pass
+
+    @staticmethod
+    def _key_name(key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def _temp_path(self):
+        return os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+
+    def _publish(self, temp_path, path):
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # Windows doesn't replace existing files, the existing entry is as good as ours.
+            os.remove(temp_path)
+
+    def lookup(self, key):
+        """
+        :return: (str) Path of the stored contents for 'key', or None on a miss.
+        """
+        try:
+            with open(os.path.join(self.root, 'keys', self._key_name(key))) as fh:
+                digest = fh.read().strip()
+        except (IOError, OSError):
+            return None
+
+        path = self._object_path(digest)
+        try:
+            # The modification time doubles as the LRU clock.
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def fetch(self, key, dest):
+        """
+        Copies the contents stored for 'key' into 'dest'.
+
+        :return: (bool) False on a miss.
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        if os.path.dirname(dest) and not os.path.isdir(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        try:
+            shutil.copyfile(path, dest)
+        except (IOError, OSError):
+            # Evicted by another process in between.
+            return False
+        return True
+
+    def store(self, key, src):
+        """
+        Adds the local file 'src' as the contents of 'key'.
+
+        :return: (str) SHA-256 hex digest of the contents.
+        """
+        digest = hashlib.sha256()
+        temp_object = self._temp_path()
+        with open(src, 'rb') as fin:
+            with open(temp_object, 'wb') as fout:
+                for chunk in iter(lambda: fin.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                    fout.write(chunk)
+        digest = digest.hexdigest()
+        path = self._object_path(digest)
+        added = 0 if os.path.exists(path) else os.path.getsize(temp_object)
+        self._publish(temp_object, path)
+
+        temp_key = self._temp_path()
+        with open(temp_key, 'w') as fh:
+            fh.write(digest)
+        self._publish(temp_key, os.path.join(self.root, 'keys', self._key_name(key)))
+
+        with self._lock:
+            if self._size is None:
+                # The walk counts what was just added.
+                self._size = self._scan()[1]
+            else:
+                self._size += added
+            full = self._size > self.max_bytes
+        if full:
+            self.evict()
+        return digest
+
+    def _scan(self):
+        """
+        :return: ([(mtime, size, path)], total size) of the stored contents.
+        """
+        entries, total = [], 0
+        for dirpath, dirs, files in os.walk(os.path.join(self.root, 'objects')):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """
+        Removes the least recently used contents until the store fits in 'max_bytes'.
+        Keys left pointing to removed contents simply miss.
+        """
+        entries, total = self._scan()
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+        with self._lock:
+            self._size = total
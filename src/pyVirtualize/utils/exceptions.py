@@ -18,4 +18,7 @@ class ProgramNotExecuted(Exception):
     message = "Program couldn't be executed within the Guest."
 
 class TaskExecutionFailed(Exception):
-    message = "Task couldn't get executed."
\ No newline at end of file
+    message = "Task couldn't get executed."
+
+class GuestCommandFailed(Exception):
+    message = "Command exited with a non-zero status within the Guest."
@@ -0,0 +1,147 @@
+__author__ = 'rramchandani'
+
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+PHASES = ('initiate', 'connect', 'first_byte', 'body', 'local_io')
+
+
+class TransferMetrics(object):
+    """
+    Timings of one guest file transfer.
+
+    :ivar vm: (str) Name of the virtual machine.
+    :ivar direction: (str) 'upload' or 'download'.
+    :ivar path: (str) Guest path transferred.
+    :ivar bytes: (int) Bytes moved over the wire.
+    :ivar phases: (dict) Seconds spent per phase:
+        'initiate'   - the InitiateFileTransfer(To|From)Guest SOAP call(s),
+        'connect'    - opening the HTTP request towards the ESXi host until the body starts to flow
+                       (for downloads, until the response headers arrived),
+        'first_byte' - for downloads, from the headers to the first body byte;
+                       for uploads, from the last body byte sent to the response,
+        'body'       - moving the body,
+        'local_io'   - reading or writing the local side, this overlaps 'body'.
+    :ivar error: (Exception) Set when the transfer failed.
+    """
+
+    def __init__(self, vm, direction, path):
+        self.vm = vm
+        self.direction = direction
+        self.path = path
+        self.bytes = 0
+        self.phases = dict()
+        self.started = time.time()
+        self.finished = None
+        self.error = None
+
+    @property
+    def seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def mbps(self):
+        """
+        Achieved throughput in MB/s over the whole transfer, initiate call included.
+        """
+        return self.bytes / (1024.0 * 1024.0) / self.seconds if self.seconds > 0 else 0.0
+
+    def __repr__(self):
+        return "<TransferMetrics {0} {1} '{2}': {3} bytes, {4:.2f} MB/s>".format(
+            self.vm, self.direction, self.path, self.bytes, self.mbps)
+
+
+class TransferTimer(object):
+    """
+    Splits a transfer into consecutive phases; each 'phase' call closes the phase running since the previous one.
+    """
+
+    def __init__(self, registry, vm, direction, path):
+        self.registry = registry
+        self.metrics = TransferMetrics(vm, direction, path)
+        self._mark = self.metrics.started
+        self._done = False
+
+    def phase(self, name):
+        now = time.time()
+        self.add(name, now - self._mark)
+        self._mark = now
+
+    def add(self, name, seconds):
+        self.metrics.phases[name] = self.metrics.phases.get(name, 0.0) + seconds
+
+    def finish(self, nbytes, error=None):
+        if self._done:
+            return
+        self._done = True
+        self.metrics.bytes = nbytes
+        self.metrics.error = error
+        self.metrics.finished = time.time()
+        self.registry.record(self.metrics)
+
+
+class MetricsRegistry(object):
+    """
+    Collects TransferMetrics, keeps a per-VM summary and forwards every record to the registered hooks,
+    ex: to push them to a monitoring system.
+    """
+
+    def __init__(self):
+        self._hooks = []
+        self._summary = dict()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        :param hook: (callable) Called with each TransferMetrics once its transfer ended.
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def timer(self, vm, direction, path):
+        return TransferTimer(self, vm, direction, path)
+
+    def record(self, metrics):
+        with self._lock:
+            summary = self._summary.setdefault(metrics.vm, {
+                'transfers': 0, 'failures': 0, 'bytes': 0, 'seconds': 0.0, 'phases': dict((p, 0.0) for p in PHASES)
+            })
+            summary['transfers'] += 1
+            summary['failures'] += 1 if metrics.error is not None else 0
+            summary['bytes'] += metrics.bytes
+            summary['seconds'] += metrics.seconds
+            for name, seconds in metrics.phases.items():
+                summary['phases'][name] = summary['phases'].get(name, 0.0) + seconds
+
+        for hook in list(self._hooks):
+            try:
+                hook(metrics)
+            except Exception:
+                log.exception("Transfer metrics hook %r failed.", hook)
+
+    def summary(self, vm=None):
+        """
+        :return: (dict) Per VM name: number of transfers and failures, bytes, seconds, seconds per phase and MB/s.
+         Only the given 'vm' when specified.
+        """
+        with self._lock:
+            result = dict()
+            for name, summary in self._summary.items():
+                if vm is not None and name != vm:
+                    continue
+                _ = dict(summary, phases=dict(summary['phases']))
+                _['mbps'] = _['bytes'] / (1024.0 * 1024.0) / _['seconds'] if _['seconds'] > 0 else 0.0
+                result[name] = _
+        return result.get(vm, dict()) if vm is not None else result
+
+    def reset(self):
+        with self._lock:
+            self._summary.clear()
+
+
+transfer_metrics = MetricsRegistry()
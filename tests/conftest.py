@@ -0,0 +1,32 @@
+"""
+Makes the modules under test importable on their own, from the source tree.
+The package '__init__' files use Python 2 implicit relative imports and pull in the whole SDK, so when
+importing 'pyVirtualize' fails (ex: under Python 3) its packages are registered empty instead:
+the modules the tests need only use absolute or explicit relative imports and load by themselves.
+"""
+
+__author__ = 'rramchandani'
+
+import os
+import sys
+import types
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+PACKAGES = ('pyVirtualize', 'pyVirtualize.utils', 'pyVirtualize.pyvSphere', 'pyVirtualize.pyvSphere.vm',
+            'pyVirtualize.pyvSphere.vm.operation')
+
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+try:
+    import pyVirtualize
+except ImportError:
+    for name in [name for name in sys.modules if name.split('.')[0] == 'pyVirtualize']:
+        del sys.modules[name]
+    for name in PACKAGES:
+        package = types.ModuleType(name)
+        package.__path__ = [os.path.join(SRC, *name.split('.'))]
+        sys.modules[name] = package
+        if '.' in name:
+            parent, _, child = name.rpartition('.')
+            setattr(sys.modules[parent], child, package)
@@ -0,0 +1,314 @@
+"""
+Fake vSphere objects the operations are tested against.
+The virtual machines are real managed object refs (pyVmomi type checks them), whose properties and methods are
+answered by plain Python objects through 'Stub'. Their guest is the local machine, see 'LocalGuest'.
+"""
+
+__author__ = 'rramchandani'
+
+import io
+import os
+import re
+import shutil
+import datetime
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+import requests
+from pyVmomi import vim, vmodl
+
+from pyVirtualize.utils.cache import TTLCache
+from pyVirtualize.pyvSphere.vm.operation._auth import GuestAuthSessions
+from pyVirtualize.pyvSphere.vm.operation._base import GUEST_STATE_TTL
+
+CREDENTIALS = {'user': {'username': 'user', 'password': 'secret', 'default': True}}
+
+# Guest state of a powered on Linux guest with VMware Tools running and a user logged in.
+GUEST_STATE = {
+    'guest.toolsStatus': 'toolsOk',
+    'guest.guestOperationsReady': True,
+    'guest.interactiveGuestOperationsReady': True,
+    'summary.config.guestFullName': 'Ubuntu Linux (64-bit)',
+    'runtime.powerState': 'poweredOn',
+}
+
+
+class Obj(object):
+    """
+    Stands for the vim data objects and the objects answering a managed object.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Stub(object):
+    """
+    Answers the property reads and method calls of the managed object refs it made, see 'ref',
+    from the object registered for their moId. Refs whose object is gone raise ManagedObjectNotFound.
+    """
+
+    def __init__(self):
+        self.targets = dict()
+
+    def ref(self, type_, moid, target):
+        self.targets[moid] = target
+        return type_(moid, self)
+
+    def _target(self, mo):
+        target = self.targets.get(mo._moId)
+        if target is None:
+            raise vmodl.fault.ManagedObjectNotFound(obj=mo)
+        return target
+
+    def InvokeAccessor(self, mo, info):
+        return getattr(self._target(mo), info.name)
+
+    def InvokeMethod(self, mo, info, args):
+        return getattr(self._target(mo), info.wsdlName)(*args)
+
+
+class PropertyCollector(object):
+    """
+    RetrieveContents over 'properties', moId -> {path: value}.
+    An object whose moId is in 'gone' fails the whole call, naming it in the fault if 'names_gone'.
+    """
+
+    def __init__(self):
+        self.properties = defaultdict(dict)
+        self.gone = set()
+        self.names_gone = True
+        self.calls = []  # moIds asked for, per call.
+
+    def RetrieveContents(self, specs):
+        objects = [obj_spec.obj for spec in specs for obj_spec in spec.objectSet]
+        paths = [path for spec in specs for prop_spec in spec.propSet for path in prop_spec.pathSet]
+        self.calls.append([obj._moId for obj in objects])
+        for obj in objects:
+            if obj._moId in self.gone:
+                raise vmodl.fault.ManagedObjectNotFound(obj=obj) if self.names_gone else \
+                    vmodl.fault.ManagedObjectNotFound()
+        return [Obj(obj=obj, propSet=[Obj(name=path, val=self.properties[obj._moId][path])
+                                      for path in paths if path in self.properties[obj._moId]])
+                for obj in objects]
+
+
+class Task(object):
+    """
+    vSphere task which is running for its first 'polls' reads of 'info', then succeeds and calls 'on_done'.
+    """
+
+    def __init__(self, polls=1, on_done=None):
+        self._polls = polls
+        self._on_done = on_done
+
+    @property
+    def info(self):
+        if self._polls > 0:
+            self._polls -= 1
+            return Obj(state='running', error=None)
+        if self._on_done is not None:
+            self._on_done, on_done = None, self._on_done
+            on_done()
+        return Obj(state='success', error=None)
+
+
+class _Raw(io.BytesIO):
+
+    def read(self, size=-1, decode_content=False):
+        return super(_Raw, self).read(size)
+
+
+class Response(object):
+    """
+    Response of the HTTP transfers of 'LocalGuest'.
+    """
+
+    def __init__(self, data=b'', status_code=requests.codes.ok):
+        self.status_code = status_code
+        self.content = b''
+        self.raw = _Raw(data)
+
+    def iter_content(self, size):
+        return iter(lambda: self.raw.read(size), b'')
+
+    def close(self):
+        self.raw.close()
+
+
+class LocalGuest(object):
+    """
+    guestOperationsManager of a Linux guest which is the local machine: guest paths are local paths and programs
+    run locally through the shell. Temporary files and directories are created under 'root'.
+    Its 'fileManager', 'processManager' and 'authManager' are itself; each call is counted in 'calls'
+    and the 'interactiveSession' of each ticket handed out is recorded in 'tickets'.
+    Guest files are transferred with 'http_get' and 'http_put', which stand for 'requests.get' and 'requests.put'.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.fileManager = self.processManager = self.authManager = self
+        self.calls = defaultdict(int)
+        self.tickets = []
+        self._processes = dict()
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def AcquireCredentialsInGuest(self, vm, requestedAuth, sessionID=None):
+        with self._lock:
+            self.tickets.append(requestedAuth.interactiveSession)
+            ticket = 'ticket-{0}'.format(len(self.tickets))
+        return vim.vm.guest.TicketedSessionAuthentication(ticket=ticket,
+                                                          interactiveSession=requestedAuth.interactiveSession)
+
+    def ReleaseCredentialsInGuest(self, vm, auth):
+        pass
+
+    def ListFilesInGuest(self, vm, auth, filePath, index=0, maxResults=None, matchPattern=None):
+        self._count('ListFilesInGuest')
+        if os.path.isdir(filePath):
+            names = ['.', '..'] + sorted(os.listdir(filePath))
+            entries = [(name, os.path.join(filePath, name)) for name in names]
+        elif os.path.exists(filePath):
+            entries = [(filePath, filePath)]
+        else:
+            raise vim.fault.FileNotFound(file=filePath)
+
+        files = []
+        for name, path in entries:
+            if matchPattern and not re.search(matchPattern, name):
+                continue
+            kind = 'symlink' if os.path.islink(path) else 'directory' if os.path.isdir(path) else 'file'
+            files.append(vim.vm.guest.FileManager.FileInfo(
+                path=name, type=kind, size=os.path.getsize(path),
+                attributes=vim.vm.guest.FileManager.FileAttributes(
+                    modificationTime=datetime.datetime.utcfromtimestamp(os.path.getmtime(path)))
+            ))
+        end = len(files) if maxResults is None else index + maxResults
+        return vim.vm.guest.FileManager.ListFileInfo(files=files[index:end], remaining=max(0, len(files) - end))
+
+    def CreateTemporaryFileInGuest(self, vm, auth, prefix, suffix, directoryPath=None):
+        handle, path = tempfile.mkstemp(suffix, prefix, directoryPath or self.root)
+        os.close(handle)
+        return path
+
+    def CreateTemporaryDirectoryInGuest(self, vm, auth, prefix, suffix, directoryPath=None):
+        return tempfile.mkdtemp(suffix, prefix, directoryPath or self.root)
+
+    def MakeDirectoryInGuest(self, vm, auth, directoryPath, createParentDirectories):
+        if os.path.exists(directoryPath):
+            raise vim.fault.FileAlreadyExists(file=directoryPath)
+        os.makedirs(directoryPath)
+
+    def DeleteFileInGuest(self, vm, auth, filePath):
+        self._count('DeleteFileInGuest')
+        if not os.path.lexists(filePath):
+            raise vim.fault.FileNotFound(file=filePath)
+        if os.path.isdir(filePath):
+            raise vim.fault.NotAFile(file=filePath)
+        os.remove(filePath)
+
+    def DeleteDirectoryInGuest(self, vm, auth, directoryPath, recursive):
+        self._count('DeleteDirectoryInGuest')
+        if not os.path.lexists(directoryPath):
+            raise vim.fault.FileNotFound(file=directoryPath)
+        if not os.path.isdir(directoryPath):
+            raise vim.fault.NotADirectory(file=directoryPath)
+        shutil.rmtree(directoryPath)
+
+    def InitiateFileTransferFromGuest(self, vm, auth, guestFilePath):
+        if not os.path.isfile(guestFilePath):
+            raise vim.fault.FileNotFound(file=guestFilePath)
+        return vim.vm.guest.FileManager.FileTransferInformation(
+            attributes=vim.vm.guest.FileManager.FileAttributes(), size=os.path.getsize(guestFilePath),
+            url='local:' + guestFilePath
+        )
+
+    def InitiateFileTransferToGuest(self, vm, auth, guestFilePath, fileAttributes, fileSize, overwrite):
+        if os.path.exists(guestFilePath) and not overwrite:
+            raise vim.fault.FileAlreadyExists(file=guestFilePath)
+        return 'local:' + guestFilePath
+
+    def http_get(self, url, verify=True, stream=False):
+        with open(url[len('local:'):], 'rb') as fh:
+            return Response(fh.read())
+
+    def http_put(self, url, data=None, verify=True):
+        with open(url[len('local:'):], 'wb') as fh:
+            if isinstance(data, bytes):
+                fh.write(data)
+            else:
+                for chunk in iter(lambda: data.read(64 * 1024), b''):
+                    fh.write(chunk)
+        return Response()
+
+    def StartProgramInGuest(self, vm, auth, spec):
+        self._count('StartProgramInGuest')
+        with open(os.devnull, 'wb') as devnull:
+            process = subprocess.Popen('{0} {1}'.format(spec.programPath, spec.arguments), shell=True,
+                                       cwd=spec.workingDirectory or None, stdout=devnull, stderr=devnull)
+        with self._lock:
+            self._processes[process.pid] = (spec, process)
+        return process.pid
+
+    def ListProcessesInGuest(self, vm, auth, pids=None):
+        with self._lock:
+            listed = [(pid, self._processes[pid]) for pid in pids or sorted(self._processes)
+                      if pid in self._processes]
+        return [vim.vm.guest.ProcessManager.ProcessInfo(
+            pid=pid, name=os.path.basename(spec.programPath), owner='user',
+            cmdLine='{0} {1}'.format(spec.programPath, spec.arguments), exitCode=process.poll()
+        ) for pid, (spec, process) in listed]
+
+
+class FakeVim(object):
+    """
+    Stands for 'VimBase', the state the operations of one virtual machine share.
+    """
+
+    def __init__(self, vmomi_object, service_instance, credentials=None):
+        self.vmomi_object = vmomi_object
+        self.service_instance = service_instance
+        self.credentials = dict(CREDENTIALS) if credentials is None else credentials
+        self.auth_sessions = GuestAuthSessions(self)
+        self.guest_state = TTLCache(ttl=GUEST_STATE_TTL)
+        self.snapshot_tree = None
+
+
+class Server(object):
+    """
+    vCenter holding the fake virtual machines, see 'vm'.
+    """
+
+    def __init__(self, root):
+        self.stub = Stub()
+        self.pc = PropertyCollector()
+        self.guest = LocalGuest(root)
+        self.service_instance = Obj(content=Obj(propertyCollector=self.pc, guestOperationsManager=self.guest))
+
+    def vm(self, moid='vm-1', target=None, properties=None):
+        """
+        :param target: Object answering the properties and methods of the virtual machine, named after it by default.
+        :param properties: (dict) Properties served by the PropertyCollector, on top of GUEST_STATE.
+        :return: FakeVim
+        """
+        self.pc.properties[moid].update(GUEST_STATE)
+        self.pc.properties[moid].update(properties or dict())
+        vmomi_object = self.stub.ref(vim.VirtualMachine, moid, target if target is not None else Obj(name=moid))
+        return FakeVim(vmomi_object, self.service_instance)
+
+    def patch(self, monkeypatch):
+        """
+        Routes the guest file transfers to the local guest and makes the guest operations poll without delay.
+        """
+        from pyVirtualize.pyvSphere.vm.operation import _base
+
+        monkeypatch.setattr(requests, 'get', self.guest.http_get)
+        monkeypatch.setattr(requests, 'put', self.guest.http_put)
+        monkeypatch.setattr(_base, 'POLL_MIN_INTERVAL', 0.01)
+        monkeypatch.setattr(_base, 'POLL_MAX_INTERVAL', 0.05)
@@ -0,0 +1,77 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVmomi import vim
+
+from pyVirtualize.pyvSphere.vm.operation.snapshot import SnapshotOperations, consolidate_disks
+
+from fakes import Obj, Server
+
+
+class Machine(object):
+    """
+    Answers a virtual machine, whose ConsolidateVMDisks_Task succeeds at once.
+    It has no 'runtime': the flag has to be read through the PropertyCollector.
+    """
+
+    def __init__(self, server, moid):
+        self.name = moid
+        self.consolidated = False
+        self._server = server
+
+    def ConsolidateVMDisks_Task(self):
+        self.consolidated = True
+        moid = 'task-{0}'.format(self.name)
+        self._server.pc.properties[moid]['info.state'] = 'success'
+        return self._server.stub.ref(vim.Task, moid, Obj(info=Obj(state='success', error=None)))
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    return server
+
+
+def machines(server, flags):
+    targets = [Machine(server, 'vm-{0}'.format(index + 1)) for index in range(len(flags))]
+    vms = [SnapshotOperations(server.vm(target.name, target=target, properties={'runtime.consolidationNeeded': flag}))
+           for target, flag in zip(targets, flags)]
+    return targets, vms
+
+
+def test_only_the_machines_needing_it_are_consolidated(server):
+    targets, vms = machines(server, [True, False, True, False])
+    results = consolidate_disks(vms)
+
+    assert results == dict((vm, None) for vm in vms)
+    assert [target.consolidated for target in targets] == [True, False, True, False]
+    # The flags of all the machines in one call, then the two tasks.
+    assert server.pc.calls == [['vm-1', 'vm-2', 'vm-3', 'vm-4'], ['task-vm-1', 'task-vm-3']]
+
+
+def test_machine_gone_reports_an_error(server):
+    targets, vms = machines(server, [True, True])
+    del server.stub.targets['vm-2']
+    server.pc.gone.add('vm-2')
+
+    results = consolidate_disks(vms)
+    assert results[vms[0]] is None and targets[0].consolidated
+    assert results[vms[1]] is not None
+
+
+def test_all_consolidated_when_not_only_needed(server):
+    targets, vms = machines(server, [False, False])
+    consolidate_disks(vms, only_needed=False)
+    assert all(target.consolidated for target in targets)
+    assert server.pc.calls == [['task-vm-1', 'task-vm-2']]
+
+
+def test_single_machine(server):
+    targets, vms = machines(server, [False, True])
+    assert vms[0].consolidate_disks() is False
+    assert vms[1].consolidate_disks() is True
+    assert [target.consolidated for target in targets] == [False, True]
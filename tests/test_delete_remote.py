@@ -0,0 +1,63 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.pyvSphere.vm.operation.file import FileOperations
+
+from fakes import Server
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    return server
+
+
+@pytest.fixture
+def ops(server):
+    return FileOperations(server.vm())
+
+
+def test_deletes_a_directory_recursively(server, ops, tmpdir):
+    tmpdir.mkdir('dir').mkdir('sub').join('file').write('x')
+    ops.delete_remote(str(tmpdir.join('dir')))
+    assert tmpdir.listdir() == []
+    assert server.guest.calls['DeleteDirectoryInGuest'] == 1
+
+
+def test_file_of_unknown_type_falls_back_to_a_file_delete(server, ops, tmpdir):
+    tmpdir.join('file').write('x')
+    ops.delete_remote(str(tmpdir.join('file')))
+    assert tmpdir.listdir() == []
+    assert server.guest.calls['DeleteDirectoryInGuest'] == 1
+    assert server.guest.calls['DeleteFileInGuest'] == 1
+
+
+def test_known_file_is_deleted_without_trying_a_directory_delete(server, ops, tmpdir):
+    tmpdir.join('file').write('x')
+    with ops._listing_scope():
+        ops.get_remote_dir_desc(str(tmpdir))
+        ops.delete_remote(str(tmpdir.join('file')))
+    assert tmpdir.listdir() == []
+    assert server.guest.calls['DeleteDirectoryInGuest'] == 0
+    assert server.guest.calls['ListFilesInGuest'] == 1
+
+
+def test_deletes_a_list_of_paths(server, ops, tmpdir):
+    paths = [tmpdir.join('f{0}'.format(index)) for index in range(6)]
+    for path in paths:
+        path.write('x')
+    tmpdir.mkdir('dir').join('file').write('x')
+
+    ops.delete_remote([str(path) for path in paths] + [str(tmpdir.join('dir'))], max_workers=3)
+    assert tmpdir.listdir() == []
+
+
+def test_missing_path_raises_ioerror(ops, tmpdir):
+    with pytest.raises(IOError):
+        ops.delete_remote(str(tmpdir.join('missing')))
+    with pytest.raises(IOError):
+        ops.delete_remote([str(tmpdir.join('missing'))])
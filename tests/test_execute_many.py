@@ -0,0 +1,54 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.pyvSphere.vm.operation.process import ProcessOperations
+
+from fakes import Server
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    return server
+
+
+@pytest.fixture
+def ops(server):
+    return ProcessOperations(server.vm())
+
+
+def test_execute_many_yields_in_the_order_programs_end(server, ops):
+    slow = ('/bin/sh', "-c 'sleep 0.4; exit 3'")
+    quick = ['/bin/sh', "-c 'exit 5'"]
+    results = list(ops.execute_many([slow, u'/bin/true', quick]))
+
+    commands = [command for command, _ in results]
+    assert commands[-1] is slow
+    assert sorted(commands[:2], key=str) == sorted([u'/bin/true', quick], key=str)
+    assert dict((str(command), info.exitCode) for command, info in results) == \
+        {str(slow): 3, u'/bin/true': 0, str(quick): 5}
+    assert server.guest.calls['StartProgramInGuest'] == 3
+
+
+def test_execute_many_starts_all_programs_before_returning(server, ops, tmpdir):
+    marker = tmpdir.join('marker')
+    results = ops.execute_many([('/bin/sh', u"-c 'echo started > {0}'".format(marker))])
+    assert server.guest.calls['StartProgramInGuest'] == 1
+    (_, info), = list(results)
+    assert info.exitCode == 0 and marker.read() == 'started\n'
+
+
+def test_wait_all(ops):
+    slow = ops.execute('/bin/sh', "-c 'sleep 0.4'", wait_for_program_to_exit=False).pid
+    quick = ops.execute('/bin/sh', "-c 'exit 1'", wait_for_program_to_exit=False).pid
+    ended = list(ops.wait_all([slow, quick]))
+    assert [pid for pid, _ in ended] == [quick, slow]
+    assert [info.exitCode for _, info in ended] == [1, 0]
+
+
+def test_wait_all_reports_unknown_processes_as_none(ops):
+    assert list(ops.wait_all([1])) == [(1, None)]
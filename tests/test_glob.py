@@ -0,0 +1,27 @@
+__author__ = 'rramchandani'
+
+import re
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.pyvSphere.vm.operation.file import _glob_to_regex
+
+
+@pytest.mark.parametrize('pattern, matching, other', [
+    ('*.dmp', ['a.dmp', '.dmp', 'core.1.dmp'], ['a.dmpx', 'a_dmp']),
+    ('log?.txt', ['log1.txt', 'logA.txt'], ['log.txt', 'log12.txt']),
+    ('[ab]*', ['a', 'bee'], ['c', '']),
+    ('[!ab]*', ['c', 'zed'], ['a', 'bee']),
+    ('[]]x', [']x'], ['x', 'ax']),
+    ('a[b', ['a[b'], ['ab']),
+    ('a+b(1).log', ['a+b(1).log'], ['aab1.log']),
+    ('[a\\]', ['a', '\\'], ['b']),
+])
+def test_glob_to_regex(pattern, matching, other):
+    regex = re.compile(_glob_to_regex(pattern))
+    for name in matching:
+        assert regex.match(name), (pattern, name)
+    for name in other:
+        assert not regex.match(name), (pattern, name)
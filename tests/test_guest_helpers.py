@@ -0,0 +1,46 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.utils.exceptions import GuestCommandFailed
+from pyVirtualize.pyvSphere.vm.operation._base import BaseOperation
+from pyVirtualize.pyvSphere.vm.operation.file import FileOperations, GUEST_IO_RATE
+
+from fakes import Server
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    return server
+
+
+@pytest.fixture
+def headless(server, monkeypatch):
+    # Nobody ever logs in, waiting for the interactive guest operations would last the whole timeout.
+    def wait(self):
+        raise AssertionError('waited for guest.interactiveGuestOperationsReady')
+
+    monkeypatch.setattr(BaseOperation, '_wait_for_guest_operations_ready', wait)
+    return FileOperations(server.vm(properties={'guest.interactiveGuestOperationsReady': False}))
+
+
+def test_helper_runs_without_a_user_logged_in(server, headless, tmpdir):
+    target = tmpdir.join('touched')
+    headless._run_guest_script('echo done > {0}'.format(target))
+    assert target.read() == 'done\n'
+    assert server.guest.tickets == [False]
+
+
+def test_helper_failure_raises(headless):
+    with pytest.raises(GuestCommandFailed):
+        headless._run_guest_script('exit 3')
+
+
+def test_helper_timeout_grows_with_size(server):
+    ops = FileOperations(server.vm(), timeout=60)
+    assert ops._helper_timeout(0) == 60
+    assert ops._helper_timeout(10 * GUEST_IO_RATE) == 70
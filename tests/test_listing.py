@@ -0,0 +1,96 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.pyvSphere.vm.operation.file import FileOperations
+
+from fakes import Server
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    return server
+
+
+@pytest.fixture
+def ops(server):
+    return FileOperations(server.vm())
+
+
+def listed(server):
+    return server.guest.calls['ListFilesInGuest']
+
+
+def test_listing_is_paged_through(server, ops, tmpdir):
+    for index in range(5):
+        tmpdir.join('f{0}'.format(index)).write('x')
+
+    names = [item.path for item in ops.iter_dir_in_vm(str(tmpdir), page_size=3)]
+    assert names == ['.', '..', 'f0', 'f1', 'f2', 'f3', 'f4']
+    assert listed(server) == 3
+
+
+def test_list_dir_returns_every_page(server, ops, tmpdir, monkeypatch):
+    iter_dir_in_vm = FileOperations.iter_dir_in_vm
+    monkeypatch.setattr(FileOperations, 'iter_dir_in_vm', lambda self, path, credentials=None, match_pattern=None:
+                        iter_dir_in_vm(self, path, credentials, match_pattern, page_size=2))
+    for index in range(5):
+        tmpdir.join('f{0}'.format(index)).write('x')
+
+    info = ops.list_dir_in_vm(str(tmpdir))
+    assert len(info.files) == 7 and info.remaining == 0
+    assert listed(server) == 4
+
+
+def test_no_listing_is_kept_outside_of_an_operation(server, ops, tmpdir):
+    path = tmpdir.join('file')
+    path.write('x')
+    assert ops.remote_path_exists(str(path))
+
+    # Deleted by a guest program, unknown to pyVirtualize.
+    path.remove()
+    assert not ops.remote_path_exists(str(path))
+    assert listed(server) == 2
+
+
+def test_listings_are_shared_within_an_operation(server, ops, tmpdir):
+    tmpdir.join('file').write('x')
+    with ops._listing_scope():
+        assert ops.get_remote_dir_desc(str(tmpdir)) == (['file'], [])
+        assert ops._is_remote_path_file(str(tmpdir.join('file')))
+        assert not ops.remote_path_exists(str(tmpdir.join('other')))
+    assert listed(server) == 1
+    assert ops._listing_cache is None
+
+
+def test_writes_invalidate_the_listings(server, ops, tmpdir):
+    sub = tmpdir.mkdir('sub')
+    with ops._listing_scope():
+        assert ops.get_remote_dir_desc(str(tmpdir)) == ([], ['sub'])
+        assert ops.get_remote_dir_desc(str(sub)) == ([], [])
+
+        ops.put_bytes(str(sub.join('new')), b'data')
+        assert ops.get_remote_dir_desc(str(sub)) == (['new'], [])
+
+        ops.delete_remote(str(sub))
+        assert ops.get_remote_dir_desc(str(tmpdir)) == ([], [])
+    assert listed(server) == 4
+
+
+def test_walk_remote_lists_every_directory_once(server, ops, tmpdir):
+    tmpdir.mkdir('a').mkdir('b').join('deep').write('x')
+    tmpdir.join('top').write('x')
+
+    with ops._listing_scope():
+        walked = dict((dirpath, (sorted(dirs), sorted(f.path for f in files)))
+                      for dirpath, dirs, files in ops.walk_remote(str(tmpdir)))
+        assert ops._is_remote_path_dir(str(tmpdir.join('a', 'b')))
+
+    root = str(tmpdir)
+    assert walked == {root: (['a'], ['top']), tmpdir.join('a').strpath: (['b'], []),
+                      tmpdir.join('a', 'b').strpath: ([], ['deep'])}
+    assert listed(server) == 3
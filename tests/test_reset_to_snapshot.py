@@ -0,0 +1,159 @@
+__author__ = 'rramchandani'
+
+import threading
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVmomi import vim
+
+from pyVirtualize.pyvSphere.vm.operation import snapshot as snapshot_module
+from pyVirtualize.pyvSphere.vm.operation._base import retrieve_contents
+from pyVirtualize.pyvSphere.vm.operation.snapshot import SnapshotOperations, reset_to_snapshot
+
+from fakes import Obj, Server, Task
+
+
+class Reverts(object):
+    """
+    Highest number of reverts seen running at once, per host and per datastore.
+    """
+
+    def __init__(self):
+        self.running = defaultdict(int)
+        self.highest = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def start(self, keys):
+        with self._lock:
+            for key in keys:
+                self.running[key] += 1
+                self.highest[key] = max(self.highest[key], self.running[key])
+
+    def end(self, keys):
+        with self._lock:
+            for key in keys:
+                self.running[key] -= 1
+
+
+class Machine(object):
+    """
+    Answers a virtual machine which has a single snapshot, 'base', taken powered off.
+    """
+
+    def __init__(self, server, moid, host, datastores, reverts):
+        self.name = moid
+        self._server, self._moid, self._reverts = server, moid, reverts
+        self._keys = [host._moId] + [ds._moId for ds in datastores]
+        base = server.stub.ref(vim.vm.Snapshot, 'snapshot-' + moid, Obj(RevertToSnapshot_Task=self.revert))
+        self.snapshot = Obj(rootSnapshotList=[Obj(name='base', snapshot=base, description='', createTime=None,
+                                                  state='poweredOff', childSnapshotList=[])],
+                            currentSnapshot=base)
+        server.pc.properties[moid].update({'runtime.host': host, 'datastore': datastores})
+
+    def _set(self, path, value):
+        self._server.pc.properties[self._moid][path] = value
+
+    def revert(self, host, suppress_power_on):
+        self._reverts.start(self._keys)
+
+        def done():
+            self._reverts.end(self._keys)
+            self._set('runtime.powerState', 'poweredOff')
+        return Task(polls=2, on_done=done)
+
+    def PowerOnVM_Task(self, host):
+        return Task(on_done=lambda: self._set('runtime.powerState', 'poweredOn'))
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    monkeypatch.setattr(snapshot_module, 'POLL_MIN_INTERVAL', 0.01)
+    monkeypatch.setattr(snapshot_module, 'POLL_MAX_INTERVAL', 0.05)
+    return server
+
+
+def machines(server, reverts, placement):
+    """
+    :param placement: (list) (host, datastores) of each virtual machine, by moId.
+    """
+    refs = dict()
+
+    def ref(type_, moid):
+        if moid not in refs:
+            refs[moid] = server.stub.ref(type_, moid, Obj(name=moid))
+        return refs[moid]
+
+    vms = []
+    for index, (host, datastores) in enumerate(placement):
+        moid = 'vm-{0}'.format(index + 1)
+        target = Machine(server, moid, ref(vim.HostSystem, host), [ref(vim.Datastore, ds) for ds in datastores],
+                         reverts)
+        vms.append(SnapshotOperations(server.vm(moid, target=target)))
+    return vms
+
+
+def test_reverts_are_limited_per_host(server):
+    reverts = Reverts()
+    vms = machines(server, reverts, [('host-1', ['ds-1']), ('host-1', ['ds-2']), ('host-1', ['ds-3']),
+                                     ('host-2', ['ds-4']), ('host-2', ['ds-5'])])
+    report = reset_to_snapshot(vms, 'base', per_host=1)
+    assert report.failed == {}
+    assert reverts.highest['host-1'] == 1 and reverts.highest['host-2'] == 1
+    assert sorted(report.timings[vms[0]]) == ['guest_ready', 'power_on', 'revert']
+
+
+def test_reverts_are_limited_per_datastore(server):
+    reverts = Reverts()
+    vms = machines(server, reverts, [('host-{0}'.format(index), ['ds-1', 'ds-{0}'.format(index + 2)])
+                                     for index in range(4)])
+    report = reset_to_snapshot(vms, 'base', per_datastore=1, wait_for_guest_ready=False)
+    assert report.failed == {}
+    assert reverts.highest['ds-1'] == 1
+
+
+@pytest.mark.parametrize('names_gone', [True, False])
+def test_virtual_machine_gone_fails_alone(server, names_gone):
+    vms = machines(server, Reverts(), [('host-1', ['ds-1'])] * 3)
+    del server.stub.targets['vm-2']
+    server.pc.gone.add('vm-2')
+    server.pc.names_gone = names_gone
+
+    report = reset_to_snapshot(vms, 'base')
+    assert list(report.failed) == [vms[1]]
+    assert report.results[vms[0]] is None and report.results[vms[2]] is None
+
+
+def test_guest_not_ready_times_out(server):
+    vm, = machines(server, Reverts(), [('host-1', ['ds-1'])])
+    vm._timeout_seconds = 0.2
+    server.pc.properties['vm-1']['guest.interactiveGuestOperationsReady'] = False
+
+    report = reset_to_snapshot([vm], 'base')
+    assert isinstance(report.results[vm], snapshot_module.TimeOutException)
+
+    report = reset_to_snapshot([vm], 'base', interactive=False)
+    assert report.results[vm] is None
+
+
+def test_retrieve_contents_leaves_out_objects_gone(server):
+    vms = [server.vm('vm-{0}'.format(index)).vmomi_object for index in range(1, 5)]
+    server.pc.gone.update(['vm-2', 'vm-3'])
+
+    contents = retrieve_contents(server.pc, vms, vim.VirtualMachine, ['runtime.powerState'])
+    assert [obj.obj._moId for obj in contents] == ['vm-1', 'vm-4']
+    assert server.pc.calls == [['vm-1', 'vm-2', 'vm-3', 'vm-4'], ['vm-1', 'vm-3', 'vm-4'], ['vm-1', 'vm-4']]
+
+
+def test_retrieve_contents_asks_each_object_when_the_fault_names_none(server):
+    vms = [server.vm('vm-{0}'.format(index)).vmomi_object for index in range(1, 4)]
+    server.pc.gone.add('vm-2')
+    server.pc.names_gone = False
+
+    contents = retrieve_contents(server.pc, vms, vim.VirtualMachine, ['runtime.powerState'])
+    assert [obj.obj._moId for obj in contents] == ['vm-1', 'vm-3']
+    assert server.pc.calls == [['vm-1', 'vm-2', 'vm-3'], ['vm-1'], ['vm-2'], ['vm-3']]
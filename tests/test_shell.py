@@ -0,0 +1,136 @@
+__author__ = 'rramchandani'
+
+import os
+import hashlib
+import subprocess
+
+import pytest
+
+from pyVirtualize.pyvSphere.vm.operation import _shell
+
+posix_only = pytest.mark.skipif(not os.path.exists(_shell.SH), reason="needs /bin/sh")
+
+TOKEN = '--pyv-test--'
+
+
+def run_sh(script, path):
+    with open(path, 'w') as fh:
+        fh.write(script)
+    return subprocess.call([_shell.SH, path])
+
+
+def read(path):
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+@posix_only
+def test_sh_quote_survives_the_shell():
+    value = "it's a \"path\" with $HOME and `ticks`"
+    output = subprocess.check_output([_shell.SH, '-c', "printf '%s' " + _shell.sh_quote(value)])
+    assert output.decode('utf-8') == value
+
+
+def test_ps_quote_doubles_single_quotes():
+    assert _shell.ps_quote("it's") == "'it''s'"
+
+
+def test_join_uses_the_guest_separator():
+    assert _shell.join(False, '/tmp/', 'a', '/b/') == '/tmp/a/b'
+    assert _shell.join(True, 'C:\\Temp\\', 'a') == 'C:\\Temp\\a'
+
+
+def test_batch_script_rejects_unknown_shell():
+    with pytest.raises(ValueError):
+        _shell.batch_script('fish', ['true'], '/tmp', TOKEN)
+
+
+@posix_only
+def test_sh_batch_reports_each_command(tmpdir):
+    workdir = str(tmpdir)
+    commands = [
+        'echo out1; echo err1 >&2',
+        'exit 3',
+        "printf '%s\\n' \"it's $((1 + 1))\"",
+    ]
+    status = run_sh(_shell.batch_script('sh', commands, workdir, TOKEN), os.path.join(workdir, 'batch.sh'))
+
+    assert status == 0
+    results = _shell.parse_batch_output(read(os.path.join(workdir, 'result')), TOKEN, len(commands))
+    assert results == [
+        (0, b'out1\n', b'err1\n'),
+        (3, b'', b''),
+        (0, b"it's 2\n", b''),
+    ]
+
+
+@posix_only
+def test_sh_batch_stops_on_error(tmpdir):
+    workdir = str(tmpdir)
+    commands = ['true', 'echo failing >&2; false', 'echo never']
+    status = run_sh(_shell.batch_script('sh', commands, workdir, TOKEN, stop_on_error=True),
+                    os.path.join(workdir, 'batch.sh'))
+
+    assert status == 1
+    results = _shell.parse_batch_output(read(os.path.join(workdir, 'result')), TOKEN, len(commands))
+    assert results == [(0, b'', b''), (1, b'', b'failing\n'), None]
+
+
+def test_parse_batch_output_ignores_foreign_sections():
+    data = (TOKEN + ' 0 out 0\nline\n' + TOKEN + ' 0 err 0\n' + TOKEN + ' 7 out 0\nstray\n' +
+            TOKEN + ' garbage\n' + TOKEN + ' 1 out x\nnot a status\n').encode('ascii')
+    assert _shell.parse_batch_output(data, TOKEN, 2) == [(0, b'line\n', b''), (None, b'not a status\n', b'')]
+
+
+def test_cmd_batch_uses_crlf_and_leading_redirections():
+    script = _shell.batch_script('cmd', ['echo 0'], 'C:\\Temp\\w', TOKEN)
+    assert script.endswith('\r\n') and '\n' not in script.replace('\r\n', '')
+    assert '>> "%PYV_W%\\result" echo {0} %1 out %PYV_RC%'.format(TOKEN) in script
+
+
+@posix_only
+def test_hash_script_reads_paths_from_a_file(tmpdir):
+    paths = []
+    for index in range(300):
+        path = str(tmpdir.join("file it's {0:03d}".format(index)))
+        with open(path, 'w') as fh:
+            fh.write(str(index))
+        paths.append(path)
+    missing = str(tmpdir.join('missing'))
+    paths_file, output = str(tmpdir.join('paths')), str(tmpdir.join('digests'))
+    with open(paths_file, 'w') as fh:
+        fh.write('\n'.join(paths + [missing]) + '\n')
+
+    script = _shell.hash_script(False, 'sha256', paths_file, output)
+    assert len(_shell.shell_command(False, script)[1]) < 1024
+    assert run_sh(script, str(tmpdir.join('hash.sh'))) == 0
+
+    digests = _shell.parse_hash_output(read(output))
+    assert len(digests) == len(paths) + 1
+    assert digests[missing] is None
+    for path in paths:
+        assert digests[path] == hashlib.sha256(read(path)).hexdigest()
+
+
+def test_hash_script_rejects_unknown_algorithm():
+    with pytest.raises(ValueError):
+        _shell.hash_script(False, 'crc32', '/tmp/paths', '/tmp/out')
+
+
+@posix_only
+def test_join_parts_script_is_atomic(tmpdir):
+    parts_dir, dest = str(tmpdir.join('big.parts')), str(tmpdir.join('big'))
+    os.mkdir(parts_dir)
+    for index, data in enumerate(['ab', 'cd', 'ef']):
+        with open(os.path.join(parts_dir, 'part{0:05d}'.format(index)), 'w') as fh:
+            fh.write(data)
+
+    script = str(tmpdir.join('join.sh'))
+    assert run_sh(_shell.join_parts_script(False, parts_dir, dest, 'first'), script) == 0
+    assert read(dest) == b'abcdef'
+    assert not os.path.exists(parts_dir)
+
+    # A second join, ex: a retry after a timeout, fails without touching the joined file.
+    assert run_sh(_shell.join_parts_script(False, parts_dir, dest, 'second'), script) != 0
+    assert read(dest) == b'abcdef'
+    assert sorted(os.listdir(str(tmpdir))) == ['big', 'join.sh']
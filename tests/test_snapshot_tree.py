@@ -0,0 +1,126 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+from pyVirtualize.pyvSphere.vm.operation._snapshot_tree import SnapshotTree
+
+
+class Snapshot(object):
+    """
+    Stands for a vim.vm.Snapshot.
+    """
+
+    def __init__(self, moid):
+        self._moId = moid
+
+
+class Item(object):
+    """
+    Stands for a vim.vm.SnapshotTree.
+    """
+
+    def __init__(self, name, moid, children=()):
+        self.name = name
+        self.snapshot = Snapshot(moid)
+        self.description = ''
+        self.createTime = None
+        self.state = 'poweredOff'
+        self.childSnapshotList = list(children)
+
+
+class Info(object):
+    """
+    Stands for a vim.vm.SnapshotInfo.
+    """
+
+    def __init__(self, roots, current):
+        self.rootSnapshotList = roots
+        self.currentSnapshot = Snapshot(current)
+
+
+@pytest.fixture
+def tree():
+    #   base (1)
+    #   +-- patched (2)
+    #   |   +-- configured (3)
+    #   +-- pre (4)
+    #   +-- pre (5)      current
+    #   other (6)
+    #   +-- configured (7)
+    return SnapshotTree.from_info(Info([
+        Item('base', 'snapshot-1', [
+            Item('patched', 'snapshot-2', [Item('configured', 'snapshot-3')]),
+            Item('pre', 'snapshot-4'),
+            Item('pre', 'snapshot-5'),
+        ]),
+        Item('other', 'snapshot-6', [Item('configured', 'snapshot-7')]),
+    ], current='snapshot-5'))
+
+
+def test_from_info_builds_the_tree(tree):
+    assert len(tree) == 7
+    assert [node.moid for node in tree] == ['snapshot-{0}'.format(i) for i in range(1, 8)]
+    assert tree.current.moid == 'snapshot-5' and tree.current.is_current
+    assert tree.find('snapshot-3').path == 'base/patched/configured'
+
+
+def test_from_info_without_snapshots():
+    tree = SnapshotTree.from_info(None)
+    assert len(tree) == 0 and tree.current is None
+    assert tree.find('base') is None
+
+
+def test_find_by_name_path_id_and_object(tree):
+    assert tree.find('patched').moid == 'snapshot-2'
+    assert tree.find('other/configured').moid == 'snapshot-7'
+    assert tree.find('snapshot-4').name == 'pre'
+    assert tree.find(Snapshot('snapshot-6')).name == 'other'
+    assert tree.find('missing') is None
+    assert tree.find('base/missing') is None
+
+
+def test_find_ambiguous_name_suggests_paths(tree):
+    with pytest.raises(ValueError) as err:
+        tree.find('configured')
+    assert "'base/patched/configured'" in str(err.value) and "'other/configured'" in str(err.value)
+
+
+def test_find_same_named_siblings_suggests_ids(tree):
+    for key in ('pre', 'base/pre'):
+        with pytest.raises(ValueError) as err:
+            tree.find(key)
+        assert "'snapshot-4'" in str(err.value) and "'snapshot-5'" in str(err.value)
+
+
+def test_as_dict_leaves_ambiguous_entries_out(tree):
+    snapshots = tree.as_dict()
+    assert sorted(snapshots) == ['base', 'base/patched', 'base/patched/configured', 'other', 'other/configured',
+                                 'patched']
+    assert snapshots['patched'] is tree.find('snapshot-2').snapshot
+
+
+def test_add_becomes_child_of_current(tree):
+    node = tree.add(Snapshot('snapshot-8'), 'post')
+    assert node.path == 'base/pre/post'
+    assert tree.current is node and not tree.find('snapshot-5').is_current
+
+
+def test_remove_moves_children_up(tree):
+    tree.remove(tree.find('patched'))
+    assert tree.find('snapshot-3').path == 'base/configured'
+    assert [child.moid for child in tree.find('base').children] == ['snapshot-3', 'snapshot-4', 'snapshot-5']
+    assert tree.find('snapshot-2') is None and len(tree) == 6
+
+
+def test_remove_children_and_current(tree):
+    tree.revert(tree.find('snapshot-3'))
+    tree.remove(tree.find('patched'), remove_children=True)
+    assert tree.find('snapshot-3') is None and len(tree) == 5
+    assert tree.current.moid == 'snapshot-1'
+    # The name is unique again once its homonym is gone.
+    assert tree.find('configured').moid == 'snapshot-7'
+
+
+def test_clear(tree):
+    tree.clear()
+    assert len(tree) == 0 and list(tree) == [] and tree.current is None
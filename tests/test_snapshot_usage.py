@@ -0,0 +1,77 @@
+__author__ = 'rramchandani'
+
+import datetime
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.pyvSphere.vm.operation.snapshot import _snapshot_usages
+
+
+class Obj(object):
+    """
+    Stands for the vim data objects read by '_snapshot_usages'.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def snapshot(moid):
+    return Obj(_moId=moid)
+
+
+def chain(*keys):
+    return [Obj(chain=[Obj(fileKey=[key]) for key in keys])]
+
+
+NOW = datetime.datetime(2024, 1, 31, 12, 0)
+
+
+def usages():
+    # base (1) -> current (2): the running disk writes into delta 3, which belongs to 'current'.
+    info = Obj(
+        rootSnapshotList=[Obj(name='base', snapshot=snapshot('snapshot-1'), description='',
+                              createTime=datetime.datetime(2024, 1, 1), state='poweredOff', childSnapshotList=[
+                                  Obj(name='current', snapshot=snapshot('snapshot-2'), description='',
+                                      createTime=datetime.datetime(2024, 1, 30), state='poweredOn',
+                                      childSnapshotList=[])])],
+        currentSnapshot=snapshot('snapshot-2'),
+    )
+    layout = Obj(
+        file=[Obj(key=1, name='disk.vmdk', size=1000), Obj(key=2, name='disk-000001.vmdk', size=200),
+              Obj(key=3, name='disk-000002.vmdk', size=30), Obj(key=10, name='vm-Snapshot1.vmsn', size=4),
+              Obj(key=11, name='vm-Snapshot2.vmsn', size=5), Obj(key=12, name='vm-Snapshot2.vmem', size=60)],
+        snapshot=[Obj(key=snapshot('snapshot-1'), disk=chain(1), dataKey=10, memoryKey=-1),
+                  Obj(key=snapshot('snapshot-2'), disk=chain(1, 2), dataKey=11, memoryKey=12)],
+        disk=chain(1, 2, 3),
+    )
+    return dict((usage.name, usage) for usage in _snapshot_usages('vm-1', info, layout, NOW))
+
+
+def test_snapshot_owns_the_deltas_of_its_successors():
+    report = usages()
+    assert report['base'].size == 204
+    assert report['base'].files == ['disk-000001.vmdk', 'vm-Snapshot1.vmsn']
+
+
+def test_current_snapshot_owns_the_running_delta_and_its_memory():
+    current = usages()['current']
+    assert current.is_current and current.path == 'base/current'
+    assert current.size == 95
+    assert current.files == ['disk-000002.vmdk', 'vm-Snapshot2.vmem', 'vm-Snapshot2.vmsn']
+
+
+def test_age_is_measured_from_now():
+    report = usages()
+    assert report['base'].age == datetime.timedelta(days=30, hours=12)
+    assert report['current'].age == datetime.timedelta(days=1, hours=12)
+
+
+def test_without_layout_sizes_are_zero():
+    info = Obj(rootSnapshotList=[Obj(name='base', snapshot=snapshot('snapshot-1'), description='', createTime=None,
+                                     state='poweredOff', childSnapshotList=[])],
+               currentSnapshot=snapshot('snapshot-1'))
+    usage, = list(_snapshot_usages('vm-1', info, None, NOW))
+    assert usage.size == 0 and usage.files == [] and usage.age is None
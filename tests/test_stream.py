@@ -0,0 +1,47 @@
+__author__ = 'rramchandani'
+
+import pytest
+
+pytest.importorskip('pyVmomi')
+
+from pyVirtualize.pyvSphere.vm.operation._base import BaseOperation
+from pyVirtualize.pyvSphere.vm.operation.process import ProcessOperations
+
+from fakes import Server
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    server = Server(str(tmpdir))
+    server.patch(monkeypatch)
+    return server
+
+
+@pytest.fixture
+def waits(monkeypatch):
+    waits = []
+    monkeypatch.setattr(BaseOperation, '_wait_for_guest_operations_ready', lambda self: waits.append(self))
+    return waits
+
+
+def test_stream_follows_the_output(server, tmpdir):
+    ops = ProcessOperations(server.vm())
+    stream = ops.stream('/bin/sh', "-c 'echo one; sleep 0.3; printf \"two\\nthree\"; exit 4'", poll_interval=0.1)
+    assert list(stream) == ['one', 'two', 'three']
+    assert stream.exit_code == 4
+    assert tmpdir.listdir() == []
+
+
+def test_stream_on_headless_guest_never_waits(server, waits):
+    ops = ProcessOperations(server.vm(properties={'guest.interactiveGuestOperationsReady': False}))
+    stream = ops.stream('/bin/sh', "-c 'echo one; sleep 0.3; echo two'", wait_for_guest_ready=False,
+                        interactive=False, poll_interval=0.1)
+    assert list(stream) == ['one', 'two']
+    assert waits == []
+
+
+def test_stream_waits_for_readiness_only_to_start(server, waits):
+    ops = ProcessOperations(server.vm(properties={'guest.interactiveGuestOperationsReady': False}))
+    stream = ops.stream('/bin/sh', "-c 'sleep 0.3; echo done'", poll_interval=0.1)
+    assert list(stream) == ['done']
+    assert len(waits) == 1